@@ -1,9 +1,112 @@
 from django.contrib import admin
-from .models import VideoCall
+from django.db.models import DurationField, ExpressionWrapper, F, Max, Sum
+from django.db.models.functions import Coalesce, Now
+from .models import DailyCallStats, Participant, Room, UserDailyCallStats, VideoCall
 
 class VideoCallAdmin(admin.ModelAdmin):
-    list_display = ('caller', 'receiver', 'call_start_time', 'call_end_time', 'status', 'duration')
-    list_filter = ('status', 'call_start_time')
+    list_display = ('caller', 'receiver', 'call_start_time', 'call_end_time', 'status', 'duration_display')
+    # Filtering by date belongs to the call stats pages, which read the rollups instead of this table.
+    list_filter = ('status',)
     search_fields = ('caller__username', 'receiver__username')
+    list_select_related = ('caller', 'receiver')
+    # Reports live in the call stats pages; skip the extra COUNT(*) over the whole table.
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Computed by the database with the page's rows, not per row in Python.
+        return super().get_queryset(request).annotate(duration_value=ExpressionWrapper(
+            Coalesce('call_end_time', Now()) - F('call_start_time'), output_field=DurationField()))
+
+    @admin.display(description='duration')
+    def duration_display(self, obj):
+        return obj.duration_value
 
 admin.site.register(VideoCall, VideoCallAdmin)
+
+
+class ParticipantInline(admin.TabularInline):
+    model = Participant
+    fields = ('user', 'joined_at', 'left_at')
+    readonly_fields = ('joined_at',)
+    extra = 0
+
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner', 'mode', 'max_participants', 'created_at', 'closed_at')
+    list_filter = ('mode', 'created_at')
+    search_fields = ('name', 'owner__username')
+    inlines = (ParticipantInline,)
+
+admin.site.register(Room, RoomAdmin)
+
+
+class CallStatsAdmin(admin.ModelAdmin):
+    """Read-only pages over the rollup tables; ``manage.py rollup_calls`` fills them."""
+    date_hierarchy = 'day'
+    list_filter = ('day',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='missed rate')
+    def missed_rate_display(self, obj):
+        return f"{obj.missed_rate:.1%}"
+
+    @admin.display(description='p95 (s)', ordering='p95_seconds')
+    def p95_display(self, obj):
+        return '-' if obj.p95_seconds is None else round(obj.p95_seconds)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            response.context_data['totals'] = self.totals(changelist.queryset)
+        return response
+
+    def totals(self, queryset):
+        """``[(label, value)]`` shown above the list, over the filtered rows (none by default)."""
+        return []
+
+class DailyCallStatsAdmin(CallStatsAdmin):
+    change_list_template = 'admin/VideoCall/dailycallstats/change_list.html'
+    list_display = ('day', 'calls', 'ended', 'missed', 'missed_rate_display', 'minutes', 'p95_display', 'updated_at')
+
+    def totals(self, queryset):
+        totals = queryset.aggregate(calls=Sum('calls'), ended=Sum('ended'), missed=Sum('missed'),
+                                    seconds=Sum('total_seconds'), worst_p95=Max('p95_seconds'))
+        calls = totals['calls'] or 0
+        return [
+            ('Calls', calls),
+            ('Ended', totals['ended'] or 0),
+            ('Missed', totals['missed'] or 0),
+            ('Missed rate', f"{(totals['missed'] or 0) / calls:.1%}" if calls else '-'),
+            ('Minutes', round((totals['seconds'] or 0) / 60, 1)),
+            ('Worst daily p95 (s)', '-' if totals['worst_p95'] is None else round(totals['worst_p95'])),
+        ]
+
+class UserDailyCallStatsAdmin(CallStatsAdmin):
+    change_list_template = 'admin/VideoCall/dailycallstats/change_list.html'
+    list_display = ('day', 'user', 'calls_made', 'calls_received', 'missed', 'missed_rate_display', 'minutes', 'p95_display')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+
+    def totals(self, queryset):
+        totals = queryset.aggregate(made=Sum('calls_made'), received=Sum('calls_received'), missed=Sum('missed'),
+                                    seconds=Sum('total_seconds'), worst_p95=Max('p95_seconds'))
+        received = totals['received'] or 0
+        return [
+            ('Calls made', totals['made'] or 0),
+            ('Calls received', received),
+            ('Missed', totals['missed'] or 0),
+            ('Missed rate', f"{(totals['missed'] or 0) / received:.1%}" if received else '-'),
+            ('Minutes', round((totals['seconds'] or 0) / 60, 1)),
+            ('Worst daily p95 (s)', '-' if totals['worst_p95'] is None else round(totals['worst_p95'])),
+        ]
+
+admin.site.register(DailyCallStats, DailyCallStatsAdmin)
+admin.site.register(UserDailyCallStats, UserDailyCallStatsAdmin)
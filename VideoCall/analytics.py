@@ -0,0 +1,242 @@
+"""
+Daily call rollups into DailyCallStats and UserDailyCallStats.
+
+``rollup(first_day, last_day)`` recomputes those days from the finished
+(ENDED / MISSED) calls, read through the (status, call_start_time) index,
+entirely in the database: grouped counts and sums, and the 95th percentile
+duration by nearest rank using ROW_NUMBER() over each day or day and user.
+Days are replaced in one transaction, so running one twice is harmless.
+
+A call counts on the day it started and finishes within
+VIDEO_CALL_MAX_DURATION of that, so refreshing today and yesterday keeps the
+tables current. ``manage.py rollup_calls`` does that by default (use it
+nightly, or with --since to backfill) and RollupJob does it every
+VIDEO_CALL_ROLLUP_INTERVAL seconds inside the ASGI process.
+
+On PostgreSQL rollups hold an advisory lock, so only one runs at a time
+however many workers and cron jobs start one: RollupJob skips its turn
+while the lock is taken, the command waits for it. SQLite needs no lock,
+as IMMEDIATE transactions already take turns at the write lock.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Func, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, RowNumber, TruncDate
+from django.utils import timezone
+
+from . import repository
+
+logger = logging.getLogger(__name__)
+
+# Days recomputed per transaction when backfilling.
+CHUNK_DAYS = 31
+# PostgreSQL advisory lock key held while rolling up.
+ROLLUP_LOCK_ID = 7_337_001
+
+
+class DurationSeconds(Func):
+    """Seconds from the second expression to the first, as a float."""
+    arity = 2
+    output_field = FloatField()
+    arg_joiner = " - "
+    template = "EXTRACT(EPOCH FROM (%(expressions)s))"
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="ROUND((julianday(%(expressions)s)) * 86400.0, 3)", arg_joiner=") - julianday(",
+            **extra_context
+        )
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def finished_calls(first_day, last_day):
+    from .models import VideoCall
+    return VideoCall.objects.filter(
+        status__in=VideoCall.FINAL_STATUSES,
+        call_start_time__gte=day_start(first_day),
+        call_start_time__lt=day_start(last_day + timedelta(days=1)),
+    ).annotate(
+        day=TruncDate("call_start_time"),
+        seconds=DurationSeconds("call_end_time", "call_start_time"),
+    ).order_by()
+
+
+def as_date(value):
+    # Raw queries on SQLite return dates as text.
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def daily_rows(calls):
+    """``{day: {field: value}}`` of DailyCallStats fields."""
+    from .models import VideoCall
+    rows = calls.values("day").annotate(
+        calls=Count("id"),
+        ended=Count("id", filter=Q(status=VideoCall.ENDED)),
+        missed=Count("id", filter=Q(status=VideoCall.MISSED)),
+        total_seconds=Coalesce(Sum("seconds", filter=Q(status=VideoCall.ENDED)), 0.0),
+    )
+    stats = {row.pop("day"): row for row in rows}
+    p95 = calls.filter(status=VideoCall.ENDED).annotate(
+        position=Window(RowNumber(), partition_by=F("day"), order_by=F("seconds").asc()),
+        total=Window(Count("id"), partition_by=F("day")),
+    ).filter(position__gte=F("total") * 0.95, position__lt=F("total") * 0.95 + 1).values_list("day", "seconds")
+    for day, seconds in p95:
+        stats[day]["p95_seconds"] = seconds
+    return stats
+
+
+def user_rows(calls):
+    """``{(day, user_id): {field: value}}`` of UserDailyCallStats fields."""
+    from .models import VideoCall
+    # One row per call and participant: the calls each user made, then those they received.
+    fields = ("day", "participant", "made", "status", "seconds")
+    made = calls.annotate(participant=F("caller_id"), made=Value(1)).values_list(*fields)
+    received = calls.annotate(participant=F("receiver_id"), made=Value(0)).values_list(*fields)
+    legs, params = made.union(received, all=True).query.sql_with_params()
+    stats = {}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT day, participant, SUM(made), SUM(1 - made),"
+            " SUM(CASE WHEN made = 0 AND status = %s THEN 1 ELSE 0 END),"
+            " SUM(CASE WHEN status = %s THEN seconds ELSE 0 END)"
+            f" FROM ({legs}) legs GROUP BY day, participant",
+            [VideoCall.MISSED, VideoCall.ENDED, *params],
+        )
+        for day, user_id, calls_made, calls_received, missed, total_seconds in cursor.fetchall():
+            stats[as_date(day), user_id] = {
+                "calls_made": calls_made,
+                "calls_received": calls_received,
+                "missed": missed,
+                "total_seconds": total_seconds or 0.0,
+            }
+        cursor.execute(
+            "SELECT day, participant, seconds FROM ("
+            " SELECT day, participant, seconds,"
+            " ROW_NUMBER() OVER (PARTITION BY day, participant ORDER BY seconds) AS position,"
+            " COUNT(*) OVER (PARTITION BY day, participant) AS total"
+            f" FROM ({legs}) legs WHERE status = %s"
+            ") ranked WHERE position >= total * 0.95 AND position < total * 0.95 + 1",
+            [*params, VideoCall.ENDED],
+        )
+        for day, user_id, seconds in cursor.fetchall():
+            stats[as_date(day), user_id]["p95_seconds"] = seconds
+    return stats
+
+
+def rollup_chunk(first_day, last_day):
+    from .models import DailyCallStats, UserDailyCallStats
+    calls = finished_calls(first_day, last_day)
+    days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+    daily = daily_rows(calls)
+    users = user_rows(calls)
+    now = timezone.now()
+    with transaction.atomic():
+        DailyCallStats.objects.bulk_create(
+            [DailyCallStats(day=day, updated_at=now, **daily.get(day, {})) for day in days],
+            update_conflicts=True,
+            unique_fields=["day"],
+            update_fields=["calls", "ended", "missed", "total_seconds", "p95_seconds", "updated_at"],
+        )
+        UserDailyCallStats.objects.filter(day__range=(first_day, last_day)).delete()
+        UserDailyCallStats.objects.bulk_create(
+            [UserDailyCallStats(day=day, user_id=user_id, updated_at=now, **row) for (day, user_id), row in users.items()],
+            batch_size=500,
+        )
+    return len(days), len(users)
+
+
+@contextmanager
+def rollup_lock(wait=True):
+    """True once this connection holds the rollup lock; False if ``wait`` is off and another holds it."""
+    if connection.vendor != "postgresql":
+        yield True
+        return
+    with connection.cursor() as cursor:
+        if wait:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [ROLLUP_LOCK_ID])
+            acquired = True
+        else:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [ROLLUP_LOCK_ID])
+            acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [ROLLUP_LOCK_ID])
+
+
+def rollup(first_day, last_day, wait=True):
+    """
+    Recompute the stats of every day from ``first_day`` to ``last_day``;
+    returns (days, user rows), or None if ``wait`` is off and another rollup
+    is running.
+    """
+    days = user_days = 0
+    with rollup_lock(wait) as acquired:
+        if not acquired:
+            return None
+        while first_day <= last_day:
+            chunk_end = min(first_day + timedelta(days=CHUNK_DAYS - 1), last_day)
+            chunk_days, chunk_users = rollup_chunk(first_day, chunk_end)
+            days += chunk_days
+            user_days += chunk_users
+            first_day = chunk_end + timedelta(days=1)
+    return days, user_days
+
+
+def rollup_recent(days=2, wait=True):
+    """Recompute the last ``days`` days, today included."""
+    today = timezone.localdate()
+    return rollup(today - timedelta(days=days - 1), today, wait)
+
+
+class RollupJob:
+    def __init__(self, interval):
+        self.interval = interval
+        self.task = None
+
+    def start(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.task = loop.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Another worker or the cron job is on it.
+                await repository.run_sync(rollup_recent, wait=False)
+            except Exception:
+                logger.exception("Call stats rollup failed")
+
+
+_rollup_job = None
+
+
+def get_rollup_job():
+    global _rollup_job
+    if _rollup_job is None:
+        _rollup_job = RollupJob(getattr(settings, "VIDEO_CALL_ROLLUP_INTERVAL", 15 * 60))
+    return _rollup_job
@@ -0,0 +1,185 @@
+"""
+Serves collected static files straight from the ASGI application.
+
+StaticAssetsMiddleware answers GET and HEAD requests under STATIC_URL from
+STATIC_ROOT before they reach Django: no URL resolving, no middleware, no
+sync thread. It indexes STATIC_ROOT once, on the first request, and keeps
+files up to MAX_CACHED_SIZE in memory. It picks the ``.br`` or ``.gz``
+variant that collectstatic wrote (see storage.py) from Accept-Encoding.
+
+Names listed in the staticfiles.json manifest are content-hashed and never
+change, so they are sent as immutable for a year. Anything else, such as
+the unhashed copy of a file, gets VIDEO_CALL_STATIC_MAX_AGE. Run
+collectstatic before starting workers: files it writes later are only
+picked up by a restart. Requests for anything else pass through to Django.
+"""
+import asyncio
+import json
+import mimetypes
+import os
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from . import metrics
+
+STATIC_RESPONSES = metrics.registry.register(metrics.Counter(
+    "videocall_static_responses_total", "Static files served by StaticAssetsMiddleware, by content encoding.",
+    ["encoding"]))
+
+IMMUTABLE = b"public, max-age=31536000, immutable"
+# Files up to this size are read once and kept in memory; larger ones are streamed from disk.
+MAX_CACHED_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Preferred first.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class Variant:
+    __slots__ = ("path", "size", "etag", "body")
+
+    def __init__(self, path, stat, encoding):
+        self.path = path
+        self.size = stat.st_size
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding}"'.encode()
+        self.body = None
+
+    def read(self):
+        """The whole file, read once; only for files up to MAX_CACHED_SIZE."""
+        if self.body is None:
+            with open(self.path, "rb") as file:
+                self.body = file.read()
+        return self.body
+
+
+class Asset:
+    __slots__ = ("content_type", "cache_control", "variants")
+
+    def __init__(self, path, cache_control):
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type.encode()
+        self.cache_control = cache_control
+        self.variants = {"identity": Variant(path, os.stat(path), "identity")}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.variants[encoding] = Variant(path + suffix, os.stat(path + suffix), encoding)
+
+
+def static_prefix():
+    """The URL path STATIC_URL serves, or None when it points at another host."""
+    url = urlsplit(settings.STATIC_URL or "")
+    if url.netloc:
+        return None
+    return "/" + url.path.strip("/") + "/"
+
+
+def build_index(root, prefix):
+    """URL path -> Asset for every file collected into ``root``."""
+    try:
+        with open(os.path.join(root, "staticfiles.json"), encoding="utf-8") as manifest:
+            hashed = set(json.load(manifest).get("paths", {}).values())
+    except (OSError, ValueError):
+        hashed = set()
+    max_age = f"public, max-age={getattr(settings, 'VIDEO_CALL_STATIC_MAX_AGE', 60)}".encode()
+    index = {}
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            if filename.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, "/")
+            index[prefix + name] = Asset(path, IMMUTABLE if name in hashed else max_age)
+    return index
+
+
+def accepted_encodings(scope):
+    """Content codings the request accepts, from Accept-Encoding (``q=0`` excluded)."""
+    accepted = set()
+    for name, value in scope.get("headers", ()):
+        if name != b"accept-encoding":
+            continue
+        for part in value.decode("latin1").split(","):
+            coding, _, params = part.strip().partition(";")
+            params = params.replace(" ", "")
+            if params.startswith("q="):
+                try:
+                    if float(params[2:]) == 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+class StaticAssetsMiddleware:
+    """Answers requests for collected static files; passes everything else to ``app``."""
+
+    def __init__(self, app):
+        self.app = app
+        self.prefix = static_prefix()
+        self.index = None
+
+    def get_index(self):
+        if self.index is None:
+            root = settings.STATIC_ROOT
+            self.index = build_index(str(root), self.prefix) if root and self.prefix and os.path.isdir(root) else {}
+        return self.index
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD") or self.prefix is None \
+                or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+        asset = self.get_index().get(scope["path"])
+        if asset is None:
+            return await self.app(scope, receive, send)
+        await self.serve(scope, send, asset)
+
+    async def serve(self, scope, send, asset):
+        accepted = accepted_encodings(scope) if len(asset.variants) > 1 else ()
+        encoding = next((
+            encoding for encoding, _ in ENCODINGS
+            if encoding in asset.variants and (encoding in accepted or "*" in accepted)
+        ), "identity")
+        variant = asset.variants[encoding]
+        headers = [
+            (b"content-type", asset.content_type),
+            (b"cache-control", asset.cache_control),
+            (b"etag", variant.etag),
+        ]
+        if len(asset.variants) > 1:
+            headers.append((b"vary", b"Accept-Encoding"))
+        if encoding != "identity":
+            headers.append((b"content-encoding", encoding.encode()))
+        STATIC_RESPONSES.labels(encoding).inc()
+        if_none_match = header(scope, b"if-none-match")
+        if if_none_match is not None and variant.etag in [tag.strip() for tag in if_none_match.split(b",")]:
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        headers.append((b"content-length", str(variant.size).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif variant.size <= MAX_CACHED_SIZE:
+            await send({"type": "http.response.body", "body": variant.read()})
+        else:
+            await self.stream(send, variant.path)
+
+    async def stream(self, send, path):
+        with open(path, "rb") as file:
+            while True:
+                chunk = await asyncio.to_thread(file.read, CHUNK_SIZE)
+                more = len(chunk) == CHUNK_SIZE
+                await send({"type": "http.response.body", "body": chunk, "more_body": more})
+                if not more:
+                    return
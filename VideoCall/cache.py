@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+CallMembers = namedtuple('CallMembers', ['caller_id', 'receiver_id', 'status'])
+
+
+# Call ids are positive BIGINT primary keys.
+MAX_CALL_ID = 2 ** 63 - 1
+
+
+def normalize_call_id(call_id):
+    """``call_id`` as an int when it is one (not a bool) or a string of ASCII digits, else None."""
+    if isinstance(call_id, str) and call_id.isascii() and call_id.isdigit() and len(call_id) <= 19:
+        call_id = int(call_id)
+    elif isinstance(call_id, bool) or not isinstance(call_id, int):
+        return None
+    return call_id if 0 < call_id <= MAX_CALL_ID else None
+
+
+class CallMembershipCache:
+    """Maps video call id -> CallMembers so signaling relays can skip the database."""
+
+    def __init__(self):
+        self._calls = {}
+
+    def get(self, call_id):
+        return self._calls.get(normalize_call_id(call_id))
+
+    def set(self, call_id, caller_id, receiver_id, status):
+        members = CallMembers(caller_id, receiver_id, status)
+        self._calls[normalize_call_id(call_id)] = members
+        return members
+
+    def discard(self, call_id):
+        self._calls.pop(normalize_call_id(call_id), None)
+
+    def clear(self):
+        self._calls.clear()
+
+    def __contains__(self, call_id):
+        return normalize_call_id(call_id) in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+
+# Shared by every consumer running in this process.
+process_call_cache = CallMembershipCache()
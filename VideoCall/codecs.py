@@ -0,0 +1,93 @@
+import json
+from abc import ABC, abstractmethod
+
+import msgpack
+
+MSGPACK_SUBPROTOCOL = "vc.msgpack"
+
+
+class CodecError(ValueError):
+    """A frame body the codec could not decode."""
+
+
+class Frame:
+    """A server payload whose wire encoding is computed once per codec."""
+
+    __slots__ = ('payload', 'encoded')
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.encoded = {}
+
+
+class Codec(ABC):
+    name = None
+    subprotocol = None
+    # Key of the websocket.receive / websocket.send event holding the frame.
+    key = None
+
+    @abstractmethod
+    def loads(self, body):
+        """The payload decoded from a frame body; raises CodecError if it is malformed."""
+
+    @abstractmethod
+    def dumps(self, payload):
+        """The frame body encoding ``payload``."""
+
+    def decode(self, event):
+        body = event.get(self.key, None)
+        if not body:
+            return None
+        return self.loads(body)
+
+    def encode(self, payload):
+        if isinstance(payload, Frame):
+            body = payload.encoded.get(self.name)
+            if body is None:
+                body = payload.encoded[self.name] = self.dumps(payload.payload)
+        else:
+            body = self.dumps(payload)
+        return {
+            "type": "websocket.send",
+            self.key: body
+        }
+
+
+class JSONCodec(Codec):
+    name = "json"
+    key = "text"
+
+    def loads(self, body):
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise CodecError(str(e)) from e
+
+    def dumps(self, payload):
+        return json.dumps(payload)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+    key = "bytes"
+
+    def loads(self, body):
+        try:
+            return msgpack.unpackb(body)
+        except (ValueError, msgpack.UnpackException) as e:
+            raise CodecError(str(e)) from e
+
+    def dumps(self, payload):
+        return msgpack.packb(payload)
+
+
+json_codec = JSONCodec()
+msgpack_codec = MsgpackCodec()
+
+
+def select_codec(subprotocols):
+    """JSON text frames unless the client offered the msgpack subprotocol."""
+    if MSGPACK_SUBPROTOCOL in (subprotocols or ()):
+        return msgpack_codec
+    return json_codec
@@ -1,545 +1,1006 @@
-from asgiref.sync import sync_to_async
-from channels.db import database_sync_to_async
-from channels.exceptions import StopConsumer
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import deque
+from urllib.parse import parse_qs
+
+from channels.exceptions import ChannelFull, StopConsumer
 from channels.generic.websocket import AsyncConsumer
-from django.db.models import Q
-import json
-from datetime import datetime
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics, repository, signaling
+from .cache import CallMembershipCache, normalize_call_id, process_call_cache
+from .codecs import CodecError, select_codec
+from .journal import get_journal
+from .presence import BUSY, OFFLINE, get_presence, presence_group
+from .ratelimit import get_rate_limiter
+from .resume import SESSIONS, buffer_size, get_grace_timers, get_session_store, grace_period
+from .ringing import get_ring_scheduler
+from .rooms import ROOM_NAME, RoomState, room_group
+from .sfu import get_sfu
+from .signaling import PendingRelay, actions
+
+logger = logging.getLogger(__name__)
+
+DEVICE_ID = re.compile(r"[\w-]{1,64}")
+
+SEND_SECONDS = metrics.CHANNEL_SEND_SECONDS.labels("send")
+GROUP_SEND_SECONDS = metrics.CHANNEL_SEND_SECONDS.labels("group_send")
+# First retry delay when a peer's channel is full; doubles with each retry.
+SEND_BACKOFF = 0.05
 
 
 class VideoCallConsumer(AsyncConsumer):
     async def websocket_connect(self, event):
         self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            # No valid connection token (VideoCall.tokens): refuse the handshake.
+            await self.send({"type": "websocket.close"})
+            return
+        metrics.OPEN_SOCKETS.inc()
         self.room_id = f"videocall_{self.user.id}"
+        self.calls = CallMembershipCache()
+        self.peer_channels = {}
+        self.pending_relays = {}
+        # The call this connection is in, hung up (or parked) when it disconnects.
+        self.active_call_id = None
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        features = ",".join(query.get("features", [])).split(",")
+        self.batch_candidates = "batch" in features
+        # Numbered frames, the last few kept, so a dropped connection can "resume" its call.
+        self.resumable = "resume" in features
+        self.session_id = uuid.uuid4().hex if self.resumable else None
+        self.seq = 0
+        self.sent_frames = deque(maxlen=buffer_size())
+        # call id -> messages held back while the peer reconnects
+        self.parked_peers = {}
+        # Stable per browser (the client keeps it in localStorage); one is made up otherwise.
+        device = query.get("device", [""])[0]
+        self.device_id = device if DEVICE_ID.fullmatch(device) else uuid.uuid4().hex
+        self.codec = select_codec(self.scope.get("subprotocols", None))
+        self.presence = get_presence()
+        self.ring_timeouts = get_ring_scheduler()
+        self.journal = get_journal()
+        # user id -> username of everyone whose presence this connection follows
+        self.presence_subscriptions = {}
+        # room name -> RoomState of each group room this connection is in
+        self.joined_rooms = {}
+        self.sfu = get_sfu()
+        self.rate_limiter = get_rate_limiter()
 
         await self.channel_layer.group_add(
             self.room_id,
             self.channel_name
         )
-        await self.send({
-            "type": "websocket.accept"
-        })
+        if await self.presence.connect(self.user.id):
+            await self.publish_presence(self.user.id)
+        accept = {"type": "websocket.accept"}
+        if self.codec.subprotocol:
+            accept["subprotocol"] = self.codec.subprotocol
+        await self.send(accept)
+        if self.resumable:
+            # Not numbered: it starts the sequence.
+            await self.send(self.codec.encode({"action": "session", "session_id": self.session_id, "grace": grace_period()}))
 
     async def websocket_receive(self, event):
-        text_data = event.get("text", None)
-
-        if text_data:
-            data = json.loads(text_data)
-            action = data.get("action", None)
-
-            if action == "initiate_call":
-                receiver_username = data.get("receiver_username", None)
-                if not receiver_username:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Receiver username required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.create_video_call(receiver_username)
-                if status_code == 201:
-                    response = {
-                        "action": "call_initiated",
-                        "status_code": status_code,
-                        "video_call_id": video_call.id if video_call else None,
-                        "message": "Send request to user for contacting..."
-                    }
-                    if video_call.status == "RINGING":
-                        await self.channel_layer.group_send(
-                            f"videocall_{video_call.receiver_id}",
-                            {
-                                "type": "chat_message",
-                                "text": json.dumps({
-                                    "action": "incoming_call",
-                                    "video_call_id": video_call.id,
-                                    "caller_username": video_call.caller.username
-                                })
-                            }
-                        )
-                elif status_code == 404:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'User not found'
-                    }
-                elif status_code == 409:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'User already in another call'
-                    }
-                else:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'Unknown error'
-                    }
-                await self.send({
-                    "type": "websocket.send",
-                    "text": json.dumps(response)
-                })
+        try:
+            data = self.codec.decode(event)
+        except CodecError:
+            data = None
+        if not isinstance(data, dict):
+            metrics.MESSAGES.labels("invalid").inc()
+            await self.send_frame(signaling.INVALID_MESSAGE)
+            return
 
-            elif action == "cancel_call":
-                video_call_id = data.get("video_call_id", None)
-                if not video_call_id:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.change_video_call_status(video_call_id, "MISSED")
-                if status_code == 200:
-                    if self.user not in [video_call.caller, video_call.receiver]:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    self.scope["session"]["video_call_id"] = None
-                    await sync_to_async(self.scope["session"].save)()
-                    response = {
-                        "action": "call_canceled",
-                        "status_code": status_code
-                    }
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.receiver_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps({
-                                "action": "call_canceled",
-                                "status_code": status_code
-                            })
-                        }
-                    )
-                elif status_code == 404:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'Video call not found'
-                    }
-                else:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'Unknown error'
-                    }
-                await self.send({
-                    "type": "websocket.send",
-                    "text": json.dumps(response)
-                })
+        action = actions.get(data.get("action", None))
+        if action is None:
+            metrics.MESSAGES.labels("unknown").inc()
+            await self.send_frame(signaling.INVALID_MESSAGE)
+            return
+        metrics.MESSAGES.labels(action.name).inc()
+        if not self.rate_limiter.allow(action.name):
+            await self.reject_frame(action.name)
+            return
+        start = time.perf_counter()
+        for field in action.required:
+            value = data.get(field, None)
+            if field == "video_call_id":
+                # Handlers get the id as an int; anything else is answered like a missing id.
+                value = data[field] = normalize_call_id(value)
+            if not value:
+                await self.send_frame(action.missing)
+                break
+        else:
+            await action.handler(self, data)
+        metrics.ACTION_SECONDS.labels(action.name).observe(time.perf_counter() - start)
+
+    async def reject_frame(self, action):
+        """Drop a rate-limited frame: warn once per burst and close connections that keep flooding."""
+        metrics.RATE_LIMITED.labels(action).inc()
+        if self.rate_limiter.first_drop(action):
+            await self.send_frame(signaling.RATE_LIMITED)
+        close_after = getattr(settings, "VIDEO_CALL_RATE_LIMIT_CLOSE_AFTER", 0)
+        if close_after and self.rate_limiter.dropped == close_after:
+            logger.warning("Closing %s of user %s after %d rate-limited frames", self.channel_name, self.user.id, close_after)
+            # 1008: policy violation
+            await self.send({"type": "websocket.close", "code": 1008})
+
+    async def send_frame(self, frame):
+        if frame.payload["action"] == "error":
+            metrics.ERROR_FRAMES.labels(frame.payload["status_code"]).inc()
+        await self.send(self.codec.encode(frame))
+
+    async def send_response(self, response):
+        if self.resumable:
+            self.seq += 1
+            response = {**response, "seq": self.seq}
+            self.sent_frames.append((self.seq, response))
+        await self.send(self.codec.encode(response))
+
+    async def layer_send(self, channel, message, retries=None):
+        """
+        Send to one channel. While it is full, retry up to ``retries`` times
+        (VIDEO_CALL_SEND_RETRIES) with doubling backoff, then give up.
+        Returns whether the message was sent.
+        """
+        if retries is None:
+            retries = getattr(settings, "VIDEO_CALL_SEND_RETRIES", 3)
+        for attempt in range(retries + 1):
+            try:
+                with SEND_SECONDS.time():
+                    await self.channel_layer.send(channel, message)
+                return True
+            except ChannelFull:
+                metrics.CHANNEL_FULL.inc()
+                if attempt < retries:
+                    await asyncio.sleep(SEND_BACKOFF * 2 ** attempt)
+        if retries:
+            logger.warning("Dropped %s for %s: channel full", message.get("type"), channel)
+        return False
+
+    async def layer_group_send(self, group, message):
+        with GROUP_SEND_SECONDS.time():
+            await self.channel_layer.group_send(group, message)
+
+    async def notify_user(self, user_id, payload, **extra):
+        # Payloads travel unserialized; each recipient encodes for its own socket.
+        await self.layer_group_send(
+            f"videocall_{user_id}",
+            {
+                "type": "chat_message",
+                "payload": payload,
+                **extra
+            }
+        )
+
+    async def notify_peer(self, video_call_id, user_id, payload, **extra):
+        """
+        Notify the other side of a call: only the device pinned to the call
+        once its channel is known, every device of ``user_id`` before.
+        """
+        event = {"type": "chat_message", "payload": payload, **extra}
+        held = self.parked_peers.get(normalize_call_id(video_call_id))
+        if held is not None:
+            held.append(event)
+            return
+        channel = self.peer_channels.get(normalize_call_id(video_call_id))
+        if channel:
+            await self.layer_send(channel, event)
+        else:
+            await self.layer_group_send(f"videocall_{user_id}", event)
+
+    async def notify_other_devices(self, payload, **extra):
+        """Notify this user's other connections, not this one."""
+        await self.notify_user(self.user.id, payload, except_channel=self.channel_name, **extra)
+
+    async def send_to_peer(self, call_id, user_id, event):
+        """
+        Point-to-point once the peer's channel is known, per-user group until
+        then. Returns False if the peer's channel was full; the caller retries.
+        """
+        event["peer_channel"] = self.channel_name
+        event["call_id"] = call_id
+        held = self.parked_peers.get(call_id)
+        if held is not None:
+            held.append(event)
+            return True
+        channel = self.peer_channels.get(call_id)
+        if channel:
+            return await self.layer_send(channel, event, retries=0)
+        await self.layer_group_send(f"videocall_{user_id}", event)
+        return True
+
+    async def publish_presence(self, *user_ids):
+        statuses = await self.presence.statuses(user_ids)
+        for user_id, status in statuses.items():
+            await self.layer_group_send(presence_group(user_id), {
+                "type": "presence.update",
+                "user_id": user_id,
+                "status": status
+            })
+
+    async def update_busy(self, video_call):
+        participants = (video_call.caller_id, video_call.receiver_id)
+        for user_id in participants:
+            if video_call.status == "CONNECTED":
+                await self.presence.set_busy(user_id, video_call.id)
+            else:
+                await self.presence.clear_busy(user_id, video_call.id)
+        await self.publish_presence(*participants)
+
+    @actions.register("initiate_call", required=("receiver_username",), missing=signaling.RECEIVER_REQUIRED)
+    async def initiate_call(self, data):
+        receiver_id = await repository.get_user_id(data["receiver_username"])
+        if receiver_id is None:
+            await self.send_frame(signaling.USER_NOT_FOUND)
+            return
+        # Presence answers offline / busy without touching the call table.
+        presence = await self.presence.status(receiver_id)
+        if presence == OFFLINE:
+            await self.send_frame(signaling.USER_OFFLINE)
+            return
+        if presence == BUSY:
+            await self.send_frame(signaling.USER_BUSY)
+            return
+        status_code, video_call = await repository.create_video_call(self.user, receiver_id)
+        if status_code != 201:
+            await self.send_frame(signaling.user_error(status_code))
+            return
+        self.remember_call(video_call.id, video_call.caller_id, video_call.receiver_id, video_call.status)
+        self.set_active_call(video_call.id)
+        if video_call.status == "RINGING":
+            self.ring_timeouts.schedule(video_call.id, video_call.call_start_time)
+            await self.notify_user(video_call.receiver_id, {
+                "action": "incoming_call",
+                "video_call_id": video_call.id,
+                "caller_username": self.user.username
+            }, peer_channel=self.channel_name, call_id=video_call.id, call=self.call_state(video_call))
+        await self.send_response({
+            "action": "call_initiated",
+            "status_code": status_code,
+            "video_call_id": video_call.id,
+            "message": "Send request to user for contacting..."
+        })
 
-            elif action == "change_status":
-                video_call_id = data.get("video_call_id", None)
-                new_status = data.get("status", None)
-                if not video_call_id or not new_status:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID and status required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.change_video_call_status(video_call_id, new_status)
-                if status_code == 200:
-                    if self.user not in [video_call.caller, video_call.receiver]:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    response = {
-                        "action": "status_changed",
-                        "status_code": status_code,
-                        "new_status": new_status
-                    }
-                elif status_code == 404:
-                    response = {
-                        'action': 'error',
-                        "status_code": status_code,
-                        'message': 'Video call not found'
-                    }
-                else:
-                    response = {
-                        'action': 'error',
-                        'status_code': status_code,
-                        'message': 'Unknown error'
-                    }
-                await self.send({
-                    "type": "websocket.send",
-                    "text": json.dumps(response)
+    @actions.register("cancel_call")
+    async def cancel_call(self, data):
+        status_code, video_call = await self.change_video_call_status(data["video_call_id"], "MISSED")
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        self.ring_timeouts.cancel(video_call.id)
+        pinned = self.active_call_id == video_call.id
+        await self.clear_active_call(video_call)
+        response = {
+            "action": "call_canceled",
+            "status_code": status_code,
+            "video_call_id": video_call.id
+        }
+        if self.user.id == video_call.caller_id:
+            # Every device of the receiver is still ringing.
+            await self.notify_user(video_call.receiver_id, response, forget_call=video_call.id)
+            if not pinned:
+                # Canceled from another device than the one ringing out.
+                await self.notify_other_devices(response, forget_call=video_call.id)
+        else:
+            # Rejected on this device: tell the caller and stop the receiver's other devices ringing.
+            await self.notify_peer(video_call.id, video_call.caller_id, response, forget_call=video_call.id)
+            await self.notify_other_devices(response, forget_call=video_call.id)
+        self.forget_call(video_call.id)
+        await self.send_response(response)
+
+    @actions.register("change_status", required=("video_call_id", "status"), missing=signaling.CALL_ID_AND_STATUS_REQUIRED)
+    async def change_status(self, data):
+        new_status = data["status"]
+        status_code, video_call = await self.change_video_call_status(data["video_call_id"], new_status)
+        if status_code == 400:
+            await self.send_frame(signaling.INVALID_STATUS)
+            return
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        await self.update_busy(video_call)
+        await self.send_response({
+            "action": "status_changed",
+            "status_code": status_code,
+            "new_status": new_status
+        })
+
+    @actions.register("start_call")
+    async def start_call(self, data):
+        video_call_id = data["video_call_id"]
+        status_code, video_call = await self.start_video_call(video_call_id)
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        self.ring_timeouts.cancel(video_call.id)
+        self.set_active_call(video_call.id)
+        self.remember_call(video_call.id, video_call.caller_id, video_call.receiver_id, video_call.status)
+        await self.update_busy(video_call)
+        response = {
+            "action": "call_started",
+            "status_code": status_code,
+            "video_call_id": video_call.id,
+            "message": "Call started"
+        }
+        # The call is pinned to this device from here on; the caller learns its channel.
+        await self.send_response(response)
+        await self.notify_peer(video_call.id, video_call.caller_id, response, peer_channel=self.channel_name,
+                               call_id=video_call.id, call=self.call_state(video_call))
+        await self.notify_other_devices({
+            "action": "call_answered_elsewhere",
+            "video_call_id": video_call.id,
+            "device_id": self.device_id
+        }, forget_call=video_call.id)
+
+    @actions.register("end_call")
+    async def end_call(self, data):
+        status_code, video_call = await self.end_video_call(data["video_call_id"])
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        pinned = self.active_call_id == video_call.id
+        await self.clear_active_call(video_call)
+        response = {
+            "action": "call_ended",
+            "status_code": status_code,
+            "video_call_id": video_call.id,
+            "message": "Call ended"
+        }
+        peer_id = video_call.receiver_id if self.user.id == video_call.caller_id else video_call.caller_id
+        await self.notify_peer(video_call.id, peer_id, response, forget_call=video_call.id)
+        if not pinned:
+            # Hung up from another device: the one in the call has to hear it too.
+            await self.notify_other_devices(response, forget_call=video_call.id)
+        self.forget_call(video_call.id)
+        await self.send_response(response)
+
+    @actions.register("resume", required=("session_id",), missing=signaling.SESSION_REQUIRED)
+    async def resume(self, data):
+        """Take over the call of a dropped connection and replay the frames it missed."""
+        session_id = str(data["session_id"])
+        last_seq = data.get("last_seq", 0)
+        if not isinstance(last_seq, int):
+            last_seq = 0
+        record = await get_session_store().claim(session_id, self.user.id)
+        if record is None:
+            await self.send_frame(signaling.SESSION_EXPIRED)
+            return
+        get_grace_timers().cancel(session_id)
+        call_id = record["call_id"]
+        status_code, members = await self.get_call_members(call_id)
+        if status_code != 200 or members.status != "CONNECTED":
+            await self.send_frame(signaling.SESSION_EXPIRED)
+            return
+        SESSIONS.labels("resumed").inc()
+        self.set_active_call(call_id)
+        self.peer_channels[call_id] = record["peer_channel"]
+        frames = record["frames"]
+        missed = [frame for seq, frame in frames if seq > last_seq]
+        await self.send_response({
+            "action": "resumed",
+            "status_code": 200,
+            "video_call_id": call_id,
+            "replayed": len(missed),
+            # Frames older than the buffer were lost too: the client should renegotiate.
+            "gap": bool(frames) and frames[0][0] > last_seq + 1
+        })
+        for frame in missed:
+            await self.send_response({key: value for key, value in frame.items() if key != "seq"})
+        # Every device of the peer hears it; the one in the call sends back what it held.
+        await self.layer_group_send(f"videocall_{record['peer_id']}", {
+            "type": "call.peer_resumed",
+            "call_id": call_id,
+            "peer_channel": self.channel_name
+        })
+
+    @actions.register("subscribe_presence", required=("usernames",), missing=signaling.USERNAMES_REQUIRED)
+    async def subscribe_presence(self, data):
+        usernames = data["usernames"]
+        if not isinstance(usernames, list):
+            await self.send_frame(signaling.USERNAMES_INVALID)
+            return
+        room = getattr(settings, "VIDEO_CALL_PRESENCE_MAX_SUBSCRIPTIONS", 200) - len(self.presence_subscriptions)
+        usernames = [username for username in usernames if isinstance(username, str)][:max(room, 0)]
+        users = await repository.get_user_ids(usernames) if usernames else {}
+        for user_id in users:
+            if user_id not in self.presence_subscriptions:
+                await self.channel_layer.group_add(presence_group(user_id), self.channel_name)
+        self.presence_subscriptions.update(users)
+        statuses = await self.presence.statuses(users)
+        await self.send_response({
+            "action": "presence",
+            "users": [{"username": users[user_id], "status": status} for user_id, status in statuses.items()]
+        })
+
+    @actions.register("unsubscribe_presence", required=("usernames",), missing=signaling.USERNAMES_REQUIRED)
+    async def unsubscribe_presence(self, data):
+        usernames = data["usernames"]
+        if not isinstance(usernames, list):
+            await self.send_frame(signaling.USERNAMES_INVALID)
+            return
+        for user_id, username in list(self.presence_subscriptions.items()):
+            if username in usernames:
+                del self.presence_subscriptions[user_id]
+                await self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+
+    @actions.register("join_room", required=("room",), missing=signaling.ROOM_REQUIRED)
+    async def join_room(self, data):
+        name = data["room"]
+        if not isinstance(name, str) or not ROOM_NAME.fullmatch(name):
+            await self.send_frame(signaling.ROOM_NAME_INVALID)
+            return
+        mode = data.get("mode", None)
+        if mode not in (None, "MESH", "SFU"):
+            await self.send_frame(signaling.ROOM_MODE_INVALID)
+            return
+        status_code, room, members = await repository.enter_room(self.user, name, self.channel_name, mode)
+        if status_code != 200:
+            await self.send_frame(signaling.room_error(status_code))
+            return
+        state = self.joined_rooms[name] = RoomState(room.id, name, room.mode, members)
+        await self.channel_layer.group_add(room_group(room.id), self.channel_name)
+        await self.notify_room(state, {
+            "action": "participant_joined",
+            "room": name,
+            "username": self.user.username
+        }, joined=(self.user.id, self.user.username, self.channel_name))
+        # Mesh: the newcomer offers to each of these. SFU: it publishes once and subscribes.
+        await self.send_response({
+            "action": "room_joined",
+            "status_code": status_code,
+            "room": name,
+            "mode": room.mode,
+            "participants": [username for user_id, (username, channel) in members.items() if user_id != self.user.id]
+        })
+
+    @actions.register("leave_room", required=("room",), missing=signaling.ROOM_REQUIRED)
+    async def leave_room(self, data):
+        room = self.joined_room(data["room"])
+        if room is None:
+            await self.send_frame(signaling.NOT_IN_ROOM)
+            return
+        await self.leave(room)
+        await self.send_response({
+            "action": "room_left",
+            "status_code": 200,
+            "room": room.name
+        })
+
+    @actions.register("publish", required=("room",), missing=signaling.ROOM_REQUIRED)
+    async def publish(self, data):
+        room = self.joined_room(data["room"])
+        if room is None:
+            await self.send_frame(signaling.NOT_IN_ROOM)
+            return
+        candidates = data.get("candidates", None) or []
+        if not isinstance(candidates, list):
+            await self.send_frame(signaling.CANDIDATES_INVALID)
+            return
+        sdp = data.get("sdp", None)
+        if room.mode == "MESH":
+            # Offers, answers and candidates go straight to the one participant they are for.
+            peer = room.find(data.get("to", None))
+            if peer is None or peer[0] == self.user.id:
+                await self.send_frame(signaling.PARTICIPANT_NOT_FOUND)
+                return
+            await self.signal_participant(room, peer[1], {
+                "action": "room_signal",
+                "room": room.name,
+                "from": self.user.username,
+                "sdp": sdp,
+                "candidates": candidates
+            })
+            return
+        if candidates:
+            await self.sfu.add_candidates(room.id, self.user.id, candidates)
+        if sdp is None:
+            return
+        answer = await self.sfu.publish(room.id, self.user.id, sdp)
+        await self.send_response({
+            "action": "room_signal",
+            "room": room.name,
+            "from": None,
+            "sdp": answer,
+            "candidates": []
+        })
+        await self.notify_room(room, {
+            "action": "track_published",
+            "room": room.name,
+            "username": self.user.username
+        }, publisher=self.user.id)
+
+    @actions.register("subscribe", required=("room",), missing=signaling.ROOM_REQUIRED)
+    async def subscribe(self, data):
+        room = self.joined_room(data["room"])
+        if room is None:
+            await self.send_frame(signaling.NOT_IN_ROOM)
+            return
+        if room.mode == "SFU" and data.get("sdp", None) is not None:
+            # The answer to an offer from an earlier subscribe.
+            await self.sfu.answer(room.id, self.user.id, data["sdp"])
+            return
+        usernames = data.get("publishers", None)
+        if usernames is None:
+            publishers = [(user_id, channel) for user_id, (username, channel) in room.members.items()]
+        elif isinstance(usernames, list):
+            publishers = [room.find(username) for username in usernames if isinstance(username, str)]
+        else:
+            await self.send_frame(signaling.USERNAMES_INVALID)
+            return
+        publishers = [publisher for publisher in publishers if publisher is not None and publisher[0] != self.user.id]
+        if room.mode == "MESH":
+            # Ask each publisher to send this participant an offer.
+            for user_id, channel in publishers:
+                await self.signal_participant(room, channel, {
+                    "action": "subscribe_request",
+                    "room": room.name,
+                    "from": self.user.username
                 })
+            return
+        offer = await self.sfu.subscribe(room.id, self.user.id, [user_id for user_id, channel in publishers])
+        await self.send_response({
+            "action": "room_signal",
+            "room": room.name,
+            "from": None,
+            "sdp": offer,
+            "candidates": []
+        })
+
+    def joined_room(self, name):
+        try:
+            return self.joined_rooms.get(name)
+        except TypeError:
+            return None
+
+    async def leave(self, room):
+        del self.joined_rooms[room.name]
+        await self.channel_layer.group_discard(room_group(room.id), self.channel_name)
+        if room.mode == "SFU":
+            await self.sfu.leave(room.id, self.user.id)
+        await repository.exit_room(room.id, self.user.id, self.channel_name)
+        await self.notify_room(room, {
+            "action": "participant_left",
+            "room": room.name,
+            "username": self.user.username
+        }, left=(self.user.id, self.channel_name))
+
+    async def notify_room(self, room, payload, **extra):
+        """Tell everyone else in ``room``; ``joined`` / ``left`` update their member maps."""
+        await self.layer_group_send(room_group(room.id), {
+            "type": "room.event",
+            "room": room.name,
+            "payload": payload,
+            "except_channel": self.channel_name,
+            **extra
+        })
+
+    async def signal_participant(self, room, channel, payload):
+        await self.layer_send(channel, {"type": "room.signal", "room": room.name, "payload": payload})
+
+    async def room_event(self, event):
+        room = self.joined_rooms.get(event["room"])
+        if room is None:
+            return
+        if "joined" in event:
+            user_id, username, channel = event["joined"]
+            if user_id == self.user.id and channel != self.channel_name:
+                # Rejoined from another device, which takes over the participant.
+                del self.joined_rooms[room.name]
+                await self.channel_layer.group_discard(room_group(room.id), self.channel_name)
+                await self.send_response({"action": "room_joined_elsewhere", "room": room.name})
+                return
+            room.members[user_id] = (username, channel)
+        elif "left" in event:
+            user_id, channel = event["left"]
+            if room.members.get(user_id, (None, None))[1] == channel:
+                del room.members[user_id]
+        if event.get("except_channel") == self.channel_name:
+            return
+        payload = event["payload"]
+        if "publisher" in event:
+            # Subscribe to the new track straight away; the frame carries the SFU's offer.
+            offer = await self.sfu.subscribe(room.id, self.user.id, [event["publisher"]])
+            payload = {**payload, "sdp": offer}
+        await self.send_response(payload)
+
+    async def room_signal(self, event):
+        if event["room"] in self.joined_rooms:
+            await self.send_response(event["payload"])
+
+    async def presence_update(self, event):
+        username = self.presence_subscriptions.get(event["user_id"])
+        if username is None:
+            return
+        await self.send_response({
+            "action": "presence",
+            "users": [{"username": username, "status": event["status"]}]
+        })
+
+    @actions.register("caller_data")
+    async def caller_data(self, data):
+        await self.relay(data, "caller")
+
+    @actions.register("receiver_data")
+    async def receiver_data(self, data):
+        await self.relay(data, "receiver")
+
+    @actions.register("candidates_batch")
+    async def candidates_batch(self, data):
+        candidates = data.get("candidates", None) or []
+        if not isinstance(candidates, list):
+            await self.send_frame(signaling.CANDIDATES_INVALID)
+            return
+        video_call_id = data["video_call_id"]
+        status_code, members = await self.get_call_members(video_call_id, pinned=True)
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        if self.user.id == members.caller_id:
+            await self.queue_relay(video_call_id, members.receiver_id, "caller", data.get("sdp", None), candidates)
+        else:
+            await self.queue_relay(video_call_id, members.caller_id, "receiver", data.get("sdp", None), candidates)
+
+    async def relay(self, data, role):
+        video_call_id = data["video_call_id"]
+        status_code, members = await self.get_call_members(video_call_id, pinned=True)
+        if status_code != 200:
+            await self.send_frame(signaling.call_error(status_code))
+            return
+        if role == "caller":
+            sender_id, peer_id = members.caller_id, members.receiver_id
+        else:
+            sender_id, peer_id = members.receiver_id, members.caller_id
+        if self.user.id != sender_id:
+            await self.send_frame(signaling.PERMISSION_DENIED)
+            return
+        candidate = data.get("candidate", None)
+        await self.queue_relay(video_call_id, peer_id, role, data.get("sdp", None), [candidate] if candidate else [])
+
+    async def queue_relay(self, call_id, peer_id, role, sdp, candidates):
+        """
+        Coalesce SDP and candidates bound for the same peer for
+        VIDEO_CALL_RELAY_WINDOW seconds, then send them as one channel message.
+        A new SDP always starts a new batch so it stays ahead of its candidates.
+        """
+        call_id = normalize_call_id(call_id)
+        pending = self.pending_relays.get(call_id)
+        if pending is not None and sdp is not None:
+            if not pending.attempts:
+                await self.flush_relay(call_id)
+            # A batch still waiting on the peer's full channel is superseded by the new SDP.
+            stale = self.pending_relays.pop(call_id, None)
+            if stale is not None:
+                if stale.timer is not None:
+                    stale.timer.cancel()
+                metrics.DROPPED_CANDIDATES.inc(len(stale.candidates))
+            pending = None
+        if pending is None:
+            pending = self.pending_relays[call_id] = PendingRelay(peer_id, role, sdp)
+        dropped = pending.add_candidates(candidates, getattr(settings, "VIDEO_CALL_RELAY_MAX_CANDIDATES", 64))
+        if dropped:
+            metrics.DROPPED_CANDIDATES.inc(dropped)
+
+        window = getattr(settings, "VIDEO_CALL_RELAY_WINDOW", 0)
+        if pending.attempts:
+            return  # waiting out a full channel; the retry timer sends it
+        if window <= 0:
+            await self.flush_relay(call_id)
+        elif pending.timer is None:
+            pending.timer = asyncio.create_task(self.flush_relay_later(call_id, window))
 
-            elif action == "start_call":
-                video_call_id = data.get("video_call_id", None)
-                if not video_call_id:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.start_video_call(video_call_id)
-                if status_code == 200:
-                    if self.user not in [video_call.caller, video_call.receiver]:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    self.scope["session"]["video_call_id"] = video_call_id
-                    await sync_to_async(self.scope["session"].save)()
-                    response = {
-                        "action": "call_started",
-                        "status_code": status_code,
-                        "video_call_id": video_call.id if video_call else None,
-                        "message": "Call started"
-                    }
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.receiver_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.caller_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                else:
-                    if status_code == 404:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Video call not found'
-                        }
-                    else:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Unknown error'
-                        }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-
-            elif action == "end_call":
-                video_call_id = data.get("video_call_id", None)
-                if not video_call_id:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.end_video_call(video_call_id)
-                if status_code == 200:
-                    if self.user not in [video_call.caller, video_call.receiver]:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    self.scope["session"]["video_call_id"] = None
-                    await sync_to_async(self.scope["session"].save)()
-                    response = {
-                        "action": "call_ended",
-                        "status_code": status_code,
-                        "video_call_id": video_call.id if video_call else None,
-                        "message": "Call ended"
-                    }
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.receiver_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.caller_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                else:
-                    if status_code == 404:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Video call not found'
-                        }
-                    else:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Unknown error'
-                        }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-
-            elif action == "caller_data":
-                video_call_id = data.get("video_call_id", None)
-                if not video_call_id:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.get_video_call(video_call_id)
-                if status_code == 200:
-                    if self.user != video_call.caller:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    response = {
-                        "action": "receiver_data",
-                        "status_code": status_code,
-                        "video_call_id": video_call.id if video_call else None,
-                        "sdp": data.get("sdp", None),
-                        "candidate": data.get("candidate", None),
-                        "message": "Caller data received"
-                    }
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.receiver_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                else:
-                    if status_code == 404:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Video call not found'
-                        }
-                    else:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Unknown error'
-                        }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-
-            elif action == "receiver_data":
-                video_call_id = data.get("video_call_id", None)
-                if not video_call_id:
-                    response = {
-                        'action': 'error',
-                        'status_code': 400,
-                        'message': 'Video call ID required'
-                    }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
-                    return
-                status_code, video_call = await self.get_video_call(video_call_id)
-                if status_code == 200:
-                    if self.user != video_call.receiver:
-                        response = {
-                            'action': 'error',
-                            'status_code': 403,
-                            'message': 'Permission denied'
-                        }
-                        await self.send({
-                            "type": "websocket.send",
-                            "text": json.dumps(response)
-                        })
-                        return
-                    response = {
-                        "action": "caller_data",
-                        "status_code": status_code,
-                        "video_call_id": video_call.id if video_call else None,
-                        "sdp": data.get("sdp", None),
-                        "candidate": data.get("candidate", None),
-                        "message": "Receiver data received"
-                    }
-                    await self.channel_layer.group_send(
-                        f"videocall_{video_call.caller_id}",
-                        {
-                            "type": "chat_message",
-                            "text": json.dumps(response)
-                        }
-                    )
-                else:
-                    if status_code == 404:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Video call not found'
-                        }
-                    else:
-                        response = {
-                            'action': 'error',
-                            'status_code': status_code,
-                            'message': 'Unknown error'
-                        }
-                    await self.send({
-                        "type": "websocket.send",
-                        "text": json.dumps(response)
-                    })
+    async def flush_relay_later(self, call_id, delay):
+        await asyncio.sleep(delay)
+        pending = self.pending_relays.get(call_id)
+        if pending is not None:
+            pending.timer = None
+            await self.flush_relay(call_id)
+
+    async def flush_relay(self, call_id):
+        pending = self.pending_relays.pop(call_id, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        if pending.sdp is None and not pending.candidates:
+            return
+        peer_role = "receiver" if pending.role == "caller" else "caller"
+        sent = await self.send_to_peer(call_id, pending.peer_id, {
+            "type": "relay.batch",
+            "action": f"{peer_role}_data",
+            "message": f"{pending.role.capitalize()} data received",
+            "sdp": pending.sdp,
+            "candidates": pending.candidates
+        })
+        if not sent:
+            self.requeue_relay(call_id, pending)
+
+    def requeue_relay(self, call_id, pending):
+        """
+        Put back a batch the peer's full channel refused, ahead of anything
+        queued since, and retry it after a backoff. Candidates beyond
+        VIDEO_CALL_RELAY_MAX_CANDIDATES are dropped oldest first; the batch is
+        dropped after VIDEO_CALL_SEND_RETRIES attempts or once a newer SDP
+        supersedes it.
+        """
+        pending.attempts += 1
+        newer = self.pending_relays.get(call_id)
+        if pending.attempts > getattr(settings, "VIDEO_CALL_SEND_RETRIES", 3) or (newer is not None and newer.sdp is not None):
+            metrics.DROPPED_CANDIDATES.inc(len(pending.candidates))
+            logger.warning("Dropped relay batch for call %s: peer channel full", call_id)
+            return
+        if newer is not None:
+            if newer.timer is not None:
+                newer.timer.cancel()
+            dropped = pending.add_candidates(newer.candidates, getattr(settings, "VIDEO_CALL_RELAY_MAX_CANDIDATES", 64))
+            if dropped:
+                metrics.DROPPED_CANDIDATES.inc(dropped)
+        self.pending_relays[call_id] = pending
+        pending.timer = asyncio.create_task(self.flush_relay_later(call_id, SEND_BACKOFF * 2 ** (pending.attempts - 1)))
+
+    def drop_pending_relays(self, call_id=None):
+        call_ids = list(self.pending_relays) if call_id is None else [normalize_call_id(call_id)]
+        for key in call_ids:
+            pending = self.pending_relays.pop(key, None)
+            if pending is not None and pending.timer is not None:
+                pending.timer.cancel()
+
+    async def park_session(self, call_id):
+        """
+        On a dropped connection, keep its CONNECTED call for a "resume":
+        park the session and have the peer hold back what it sends. Returns
+        False when the call cannot be resumed and is to be hung up now.
+        """
+        call_id = normalize_call_id(call_id)
+        members = self.cached_members(call_id)
+        peer_channel = self.peer_channels.get(call_id)
+        grace = grace_period()
+        if not self.resumable or grace <= 0 or members is None or members.status != "CONNECTED" or not peer_channel:
+            return False
+        await get_session_store().park(self.session_id, {
+            "user_id": self.user.id,
+            "call_id": call_id,
+            "peer_id": members.receiver_id if self.user.id == members.caller_id else members.caller_id,
+            "peer_channel": peer_channel,
+            "frames": list(self.sent_frames),
+        }, grace + 10)  # outlives the grace timer, which claims it
+        get_grace_timers().schedule(self.session_id, grace)
+        SESSIONS.labels("parked").inc()
+        await self.layer_send(peer_channel, {"type": "call.peer_parked", "call_id": call_id}, retries=0)
+        return True
 
     async def websocket_disconnect(self, event):
+        if not self.user.is_authenticated:
+            raise StopConsumer()
+        self.drop_pending_relays()
         try:
             await self.channel_layer.group_discard(
                 self.room_id,
                 self.channel_name
             )
-        except Exception as e:
-            print(f"Error in group_discard: {e}")
+            for user_id in self.presence_subscriptions:
+                await self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+        except Exception:
+            metrics.CONSUMER_ERRORS.labels("group_discard").inc()
+            logger.exception("Failed to leave groups for %s", self.channel_name)
         try:
-            video_call_id = self.scope["session"].get("video_call_id")
-            if video_call_id:
-                status_code, video_call = await self.get_video_call(video_call_id)
-                if status_code == 200:
-                    await self.end_video_call(video_call_id)
+            video_call_id = self.active_call_id
+            if video_call_id and not await self.park_session(video_call_id):
+                video_call = await self.hang_up_call(video_call_id)
+                if video_call is not None:
+                    self.ring_timeouts.cancel(video_call.id)
+                    peer_id = video_call.receiver_id if self.user.id == video_call.caller_id else video_call.caller_id
                     try:
-                        await self.channel_layer.group_send(
-                            f"videocall_{video_call.caller.id}",
-                            {"type": "chat_message", "text": json.dumps({"action": "disconnected"})}
-                        )
-                        await self.channel_layer.group_send(
-                            f"videocall_{video_call.receiver.id}",
-                            {"type": "chat_message", "text": json.dumps({"action": "disconnected"})}
-                        )
-                    except:
-                        pass
-                self.scope["session"]["video_call_id"] = None
-                await sync_to_async(self.scope["session"].save)()
-        except Exception as e:
-            print(f"Error in cleanup: {e}")
+                        await self.notify_peer(video_call.id, peer_id, {"action": "disconnected"}, forget_call=video_call.id)
+                    except Exception:
+                        metrics.CONSUMER_ERRORS.labels("notify_disconnect").inc()
+                        logger.exception("Failed to notify participants of call %s", video_call.id)
+                    await self.clear_active_call(video_call)
+                self.forget_call(video_call_id)
+                self.active_call_id = None
+        except Exception:
+            metrics.CONSUMER_ERRORS.labels("cleanup").inc()
+            logger.exception("Failed to clean up call for user %s", self.user.id)
+        for room in list(self.joined_rooms.values()):
+            try:
+                await self.leave(room)
+            except Exception:
+                metrics.CONSUMER_ERRORS.labels("rooms").inc()
+                logger.exception("Failed to leave room %s for user %s", room.name, self.user.id)
+        try:
+            if await self.presence.disconnect(self.user.id):
+                await self.publish_presence(self.user.id)
+        except Exception:
+            metrics.CONSUMER_ERRORS.labels("presence").inc()
+            logger.exception("Failed to update presence for user %s", self.user.id)
+        metrics.OPEN_SOCKETS.dec()
         raise StopConsumer()
 
     async def chat_message(self, event):
-        await self.send({
-            "type": "websocket.send",
-            "text": event["text"]
+        if event.get("except_channel") == self.channel_name:
+            return
+        if "call" in event:
+            self.remember_call(*event["call"])
+        if "forget_call" in event:
+            self.forget_call(event["forget_call"])
+        elif "peer_channel" in event:
+            self.learn_peer_channel(event)
+        await self.send_response(event["payload"])
+
+    async def relay_batch(self, event):
+        call_id = normalize_call_id(event["call_id"])
+        if call_id == self.active_call_id:
+            self.learn_peer_channel(event)
+        if self.peer_channels.get(call_id) != event["peer_channel"]:
+            # From a device of the peer that is not in the call, or for a call this one is not in.
+            metrics.STRAY_RELAYS.inc()
+            return
+        if self.batch_candidates:
+            await self.send_response({
+                "action": "candidates_batch",
+                "relay_action": event["action"],
+                "status_code": 200,
+                "video_call_id": event["call_id"],
+                "sdp": event["sdp"],
+                "candidates": event["candidates"]
+            })
+            return
+        # Clients without the batch feature get one frame per SDP / candidate.
+        frame = {
+            "action": event["action"],
+            "status_code": 200,
+            "video_call_id": event["call_id"],
+            "sdp": None,
+            "candidate": None,
+            "message": event["message"]
+        }
+        if event["sdp"] is not None:
+            frame["sdp"] = event["sdp"]
+            await self.send_response(frame)
+            frame["sdp"] = None
+        for candidate in event["candidates"]:
+            frame["candidate"] = candidate
+            await self.send_response(frame)
+
+    def learn_peer_channel(self, event):
+        """Pin the call to the peer's channel the first time it is heard from; later events cannot move it."""
+        self.peer_channels.setdefault(normalize_call_id(event["call_id"]), event["peer_channel"])
+
+    def repin_peer_channel(self, event):
+        """Move the pin to the channel the peer resumed the call on."""
+        self.peer_channels[normalize_call_id(event["call_id"])] = event["peer_channel"]
+
+    async def call_peer_parked(self, event):
+        call_id = normalize_call_id(event["call_id"])
+        if call_id != self.active_call_id:
+            return
+        self.parked_peers.setdefault(call_id, deque(maxlen=buffer_size()))
+        await self.send_response({"action": "peer_reconnecting", "video_call_id": call_id})
+
+    async def call_peer_resumed(self, event):
+        call_id = normalize_call_id(event["call_id"])
+        if call_id != self.active_call_id:
+            return
+        self.repin_peer_channel(event)
+        # The peer's record may hold an old channel of ours if both sides dropped.
+        await self.layer_send(event["peer_channel"], {
+            "type": "call.peer_channel",
+            "call_id": call_id,
+            "peer_channel": self.channel_name
         })
+        for held in self.parked_peers.pop(call_id, ()):
+            await self.layer_send(event["peer_channel"], held)
+        await self.send_response({"action": "peer_resumed", "video_call_id": call_id})
 
-    @database_sync_to_async
-    def get_video_call(self, call_id):
-        from .models import VideoCall
-        try:
-            video_call = VideoCall.objects.get(id=call_id)
-            if self.user not in [video_call.caller, video_call.receiver]:
-                return 403, None
-            return 200, video_call
-        except VideoCall.DoesNotExist:
-            return 404, None
-
-    @database_sync_to_async
-    def create_video_call(self, receiver_username):
-        from .models import VideoCall, User
-        try:
-            receiver = User.objects.get(username=receiver_username)
-        except User.DoesNotExist:
-            return 404, None
-        if VideoCall.objects.filter(Q(receiver=receiver, status='CONNECTED') | Q(caller=receiver, status='CONNECTED')).exists():
-            return 409, None
-        video_call = VideoCall.objects.create(caller=self.user, receiver=receiver)
-        self.scope["session"]["video_call_id"] = video_call.id
-        self.scope["session"].save()
-        return 201, video_call
-
-    @database_sync_to_async
-    def change_video_call_status(self, video_call_id, status):
-        from .models import VideoCall
-        try:
-            video_call = VideoCall.objects.get(id=video_call_id)
-            if self.user not in [video_call.caller, video_call.receiver]:
-                return 403, None
-            video_call.status = status
-            video_call.save()
-            return 200, video_call
-        except VideoCall.DoesNotExist:
-            return 404, None
-
-    @database_sync_to_async
-    def start_video_call(self, video_call_id):
-        from .models import VideoCall
-        try:
-            video_call = VideoCall.objects.get(id=video_call_id)
-            if self.user not in [video_call.caller, video_call.receiver]:
-                return 403, None
-            video_call.status = 'CONNECTED'
-            video_call.start_time = datetime.now()
-            video_call.save()
-            return 200, video_call
-        except VideoCall.DoesNotExist:
-            return 404, None
-
-    @database_sync_to_async
-    def end_video_call(self, video_call_id):
+    async def call_peer_channel(self, event):
+        if normalize_call_id(event["call_id"]) == self.active_call_id:
+            self.repin_peer_channel(event)
+
+    def set_active_call(self, call_id):
+        self.active_call_id = call_id
+
+    async def clear_active_call(self, video_call):
+        self.active_call_id = None
+        await self.update_busy(video_call)
+
+    def remember_call(self, call_id, caller_id, receiver_id, status):
+        members = self.calls.set(call_id, caller_id, receiver_id, status)
+        if getattr(settings, "VIDEO_CALL_SHARED_CACHE", True):
+            process_call_cache.set(call_id, caller_id, receiver_id, status)
+        return members
+
+    def forget_call(self, call_id):
+        self.calls.discard(call_id)
+        self.peer_channels.pop(normalize_call_id(call_id), None)
+        self.parked_peers.pop(normalize_call_id(call_id), None)
+        self.drop_pending_relays(call_id)
+        if self.active_call_id == normalize_call_id(call_id):
+            self.active_call_id = None
+        if getattr(settings, "VIDEO_CALL_SHARED_CACHE", True):
+            process_call_cache.discard(call_id)
+
+    @staticmethod
+    def call_state(video_call):
+        """What a notification carries so recipients can update their cached call state."""
+        return video_call.id, video_call.caller_id, video_call.receiver_id, video_call.status
+
+    def cached_members(self, call_id):
+        members = self.calls.get(call_id)
+        if members is None and getattr(settings, "VIDEO_CALL_SHARED_CACHE", True):
+            members = process_call_cache.get(call_id)
+            if members is not None:
+                self.calls.set(call_id, *members)
+        return members
+
+    async def get_call_members(self, call_id, pinned=False):
+        """
+        The members of a call this user is in. With ``pinned``, only the
+        connection pinned to the call (the caller's that initiated it, the
+        receiver's that answered) gets them; the user's other devices get 403.
+        """
+        members = self.cached_members(call_id)
+        if members is None:
+            status_code, video_call = await repository.get_video_call(self.user.id, call_id)
+            if status_code != 200:
+                return status_code, None
+            members = self.remember_call(video_call.id, video_call.caller_id, video_call.receiver_id, video_call.status)
+        if self.user.id not in (members.caller_id, members.receiver_id):
+            return 403, None
+        if pinned and normalize_call_id(call_id) != self.active_call_id:
+            return 403, None
+        return 200, members
+
+    def journal_transition(self, video_call_id, status):
+        """
+        Decide a transition from the cached call state and hand the write to
+        the journal. Returns None when only the database can decide.
+        """
         from .models import VideoCall
-        try:
-            video_call = VideoCall.objects.get(id=video_call_id)
-            if self.user not in [video_call.caller, video_call.receiver]:
-                return 403, None
-            video_call.status = 'ENDED'
-            video_call.call_end_time = datetime.now()
-            video_call.save()
-            return 200, video_call
-        except VideoCall.DoesNotExist:
-            return 404, None
\ No newline at end of file
+        members = self.cached_members(video_call_id)
+        if members is None:
+            return None
+        if not isinstance(status, str) or status not in VideoCall.TRANSITIONS:
+            return 400, None
+        if self.user.id not in (members.caller_id, members.receiver_id):
+            return 403, None
+        if members.status not in VideoCall.TRANSITIONS[status]:
+            # The database is behind this worker while our own writes are queued.
+            return (409, None) if self.journal.has_pending(video_call_id) else None
+        now = timezone.now()
+        video_call = VideoCall(
+            id=normalize_call_id(video_call_id),
+            caller_id=members.caller_id,
+            receiver_id=members.receiver_id,
+            status=status,
+            call_end_time=now if status in VideoCall.FINAL_STATUSES else None
+        )
+        self.journal.record(video_call.id, status, now)
+        self.remember_call(video_call.id, video_call.caller_id, video_call.receiver_id, status)
+        return 200, video_call
+
+    async def transition_call(self, video_call_id, status):
+        if self.journal is not None:
+            result = self.journal_transition(video_call_id, status)
+            if result is not None:
+                return result
+        return await repository.transition_video_call(self.user.id, video_call_id, status)
+
+    async def change_video_call_status(self, video_call_id, status):
+        return await self.transition_call(video_call_id, status)
+
+    async def start_video_call(self, video_call_id):
+        return await self.transition_call(video_call_id, "CONNECTED")
+
+    async def end_video_call(self, video_call_id):
+        return await self.transition_call(video_call_id, "ENDED")
+
+    async def hang_up_call(self, video_call_id):
+        members = self.cached_members(video_call_id) if self.journal is not None else None
+        if members is not None and members.status in ("RINGING", "CONNECTED"):
+            result = self.journal_transition(video_call_id, "MISSED" if members.status == "RINGING" else "ENDED")
+            if result is not None:
+                return result[1]
+        return await repository.hang_up_video_call(self.user.id, video_call_id)
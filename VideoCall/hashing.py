@@ -0,0 +1,20 @@
+"""
+What the password hasher pool (passwords.py) runs in its processes.
+
+The pool starts its processes with forkserver or spawn, so they import this
+module afresh and never run django.setup(). It must only import what works
+without Django's settings or app registry: the hasher instances unpickled
+alongside these calls already carry their configuration.
+"""
+
+
+def encode(hasher, password, salt):
+    return hasher.encode(password, salt)
+
+
+def verify(hasher, password, encoded, harden):
+    if hasher.verify(password, encoded):
+        return True
+    if harden:
+        hasher.harden_runtime(password, encoded)
+    return False
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import formats, timezone
+
+from .models import VideoCall
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(call):
+    microseconds = (call.call_start_time - EPOCH) // timedelta(microseconds=1)
+    return f"{microseconds}_{call.pk}"
+
+
+# Largest primary key a 64-bit id column holds; bigger ones overflow the database driver.
+MAX_PK = 2 ** 63 - 1
+
+
+def decode_cursor(cursor):
+    """``(call_start_time, id)`` from a cursor string, or None if it is malformed or out of range."""
+    try:
+        microseconds, pk = (int(part) for part in cursor.split("_"))
+        start_time = EPOCH + timedelta(microseconds=microseconds)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+    if not 0 < pk <= MAX_PK:
+        return None
+    return start_time, pk
+
+
+def history_page(user, before=None):
+    """One page of ``user``'s call history and the cursor of the next one."""
+    limit = getattr(settings, "VIDEO_CALL_HISTORY_PAGE_SIZE", 20)
+    calls, has_more = VideoCall.objects.history(user.id, before=before, limit=limit)
+    next_cursor = encode_cursor(calls[-1]) if has_more else None
+    return calls, next_cursor
+
+
+def history_entry(call, user):
+    """A call as shown in ``user``'s history list (same fields as the page template)."""
+    peer = call.caller if call.receiver_id == user.id else call.receiver
+    return {
+        "id": call.pk,
+        "username": peer.username,
+        "duration": str(call.duration),
+        "time": formats.time_format(timezone.localtime(call.call_start_time).time()),
+        "status": call.status,
+    }
@@ -0,0 +1,223 @@
+"""
+Write-behind journal for call status transitions (VIDEO_CALL_WRITE_BEHIND).
+
+A transition the consumer can decide from its cached call state is appended
+to a local log file and an in-memory queue, and the peers are notified right
+away. A background task applies the queue to the database every
+VIDEO_CALL_JOURNAL_FLUSH_INTERVAL seconds, in one transaction per batch.
+
+Each worker appends to its own segment file under VIDEO_CALL_JOURNAL_DIR and
+holds an exclusive lock on it. A batch starts a new segment and the old one
+is deleted once the batch is committed. At startup, segments nobody holds a
+lock on (left by a worker that crashed) are replayed. Replaying is safe to
+repeat: every event is applied as a conditional transition, so events the
+database already has change nothing.
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics, repository
+from .cache import normalize_call_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locks, so only one worker may use a journal directory.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JournalEvent = namedtuple('JournalEvent', ['call_id', 'status', 'at'])
+
+FLUSH_SECONDS = metrics.registry.register(metrics.Histogram(
+    "videocall_journal_flush_seconds", "Time to apply one journal batch to the database."))
+FLUSHED_EVENTS = metrics.registry.register(metrics.Counter(
+    "videocall_journal_events_total", "Call transitions written to the database by the journal."))
+
+
+def apply_events(events):
+    """Apply journal events in order, in one transaction. Returns how many changed a row."""
+    from .models import VideoCall
+    applied = 0
+    with transaction.atomic():
+        for event in events:
+            values = {'status': event.status}
+            if event.status in VideoCall.FINAL_STATUSES:
+                values['call_end_time'] = event.at
+            applied += VideoCall.objects.filter(
+                pk=event.call_id, status__in=VideoCall.TRANSITIONS[event.status]
+            ).update(**values)
+    return applied
+
+
+def read_segment(path):
+    events = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                call_id, status, at = json.loads(line)
+                events.append(JournalEvent(call_id, status, datetime.fromisoformat(at)))
+            except ValueError:
+                # A line cut short by a crash mid-write.
+                logger.warning("Skipping unreadable journal line in %s", path)
+    return events
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.file.close()
+                raise
+
+    def append(self, event, fsync=False):
+        self.file.write(json.dumps([event.call_id, event.status, event.at.isoformat()]) + '\n')
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def delete(self):
+        self.file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class CallJournal:
+    def __init__(self, directory, flush_interval=0.05, fsync=False):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.prefix = f"journal-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.sequence = 0
+        self.queue = []
+        self.pending = {}  # call id -> events waiting for the database
+        self.current = None
+        self.sealed = []  # segments whose events are queued but not yet flushed
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.current is None:
+            self.current = self.new_segment()
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final journal flush failed; segments are left for replay")
+            return
+        if self.current is not None:
+            self.current.delete()
+            self.current = None
+
+    def new_segment(self):
+        self.sequence += 1
+        return Segment(self.directory / f"{self.prefix}.{self.sequence}.log")
+
+    def record(self, call_id, status, at):
+        """Journal a transition; it reaches the database with the next flush."""
+        self.start()
+        event = JournalEvent(normalize_call_id(call_id), status, at)
+        self.current.append(event, self.fsync)
+        self.queue.append(event)
+        self.pending[event.call_id] = self.pending.get(event.call_id, 0) + 1
+        self.wakeup.set()
+
+    def has_pending(self, call_id):
+        return normalize_call_id(call_id) in self.pending
+
+    def __len__(self):
+        return len(self.queue)
+
+    async def run(self):
+        try:
+            await self.replay()
+        except Exception:
+            logger.exception("Journal replay failed")
+        while True:
+            await self.wakeup.wait()
+            # Let the batch fill up for one interval.
+            await asyncio.sleep(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Journal flush failed; retrying")
+                self.wakeup.set()
+
+    async def flush(self):
+        if not self.queue:
+            return
+        batch, self.queue = self.queue, []
+        segments, self.sealed = [*self.sealed, self.current], []
+        self.current = self.new_segment()
+        try:
+            with FLUSH_SECONDS.time():
+                await repository.run_sync(apply_events, batch)
+        except Exception:
+            self.queue = batch + self.queue
+            self.sealed = segments + self.sealed
+            raise
+        FLUSHED_EVENTS.inc(len(batch))
+        for event in batch:
+            remaining = self.pending[event.call_id] - 1
+            if remaining:
+                self.pending[event.call_id] = remaining
+            else:
+                del self.pending[event.call_id]
+        for segment in segments:
+            segment.delete()
+
+    async def replay(self):
+        """Apply and delete segments left behind by workers that are gone."""
+        for path in sorted(self.directory.glob("journal-*.log"), key=os.path.getmtime):
+            if path.name.startswith(self.prefix):
+                continue
+            try:
+                segment = Segment(path)
+            except BlockingIOError:
+                continue  # a live worker's segment
+            events = read_segment(path)
+            if events:
+                applied = await repository.run_sync(apply_events, events)
+                logger.warning("Replayed %s: %d events, %d applied", path.name, len(events), applied)
+            segment.delete()
+
+
+_journal = None
+
+
+def get_journal():
+    """The process journal when VIDEO_CALL_WRITE_BEHIND is on, else None."""
+    global _journal
+    if _journal is None and getattr(settings, "VIDEO_CALL_WRITE_BEHIND", False):
+        _journal = CallJournal(
+            getattr(settings, "VIDEO_CALL_JOURNAL_DIR", Path(settings.BASE_DIR) / "journal"),
+            getattr(settings, "VIDEO_CALL_JOURNAL_FLUSH_INTERVAL", 0.05),
+            getattr(settings, "VIDEO_CALL_JOURNAL_FSYNC", False),
+        )
+    return _journal
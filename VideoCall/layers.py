@@ -0,0 +1,286 @@
+"""
+A channel layer that skips Redis for peers on the same worker.
+
+HybridChannelLayer hands messages for channels created in this process
+straight to their queue, with no network hop and no msgpack. Everything else
+goes through a remote layer (channels_redis by default), sharded over
+``hosts`` by consistent hashing:
+
+- Each process receives on one remote channel, ``hybrid.<process id>``,
+  on every shard. Channels from new_channel() embed the process id, so a
+  send to a channel of another process goes to that process channel, on
+  the shard the target channel hashes to, and that process hands it over.
+- Groups are tracked locally. The remote group only holds the process
+  channels of the workers that have members, on the shard that owns the
+  group name. group_send delivers to local members at once, then forwards
+  one message per other worker instead of one per member channel.
+
+Adding or removing a shard only moves the groups and processes that hash to
+it. Every worker sharing the shards must use this layer. Messages delivered
+locally are shallow copies of what was sent: treat them as read-only.
+"""
+import asyncio
+import logging
+import random
+import string
+import time
+import uuid
+from bisect import bisect
+from hashlib import blake2b
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LAYER_MESSAGES = metrics.registry.register(metrics.Counter(
+    "videocall_layer_messages_total", "Channel layer sends and group sends, by route (local or remote).", ["route"]))
+LOCAL_MESSAGES = LAYER_MESSAGES.labels("local")
+REMOTE_MESSAGES = LAYER_MESSAGES.labels("remote")
+
+# Seconds between sweeps for expired messages and group memberships.
+CLEAN_INTERVAL = 1.0
+
+
+def ring_hash(name):
+    # crc32 clusters on names that differ only in a counter, like videocall_<id>.
+    return int.from_bytes(blake2b(name.encode(), digest_size=4).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of names onto ``nodes``, with ``replicas`` points per node."""
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted(
+            (ring_hash(f"{node}#{replica}"), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.indexes = [index for _, index in points]
+
+    def index(self, name):
+        position = bisect(self.hashes, ring_hash(name))
+        return self.indexes[position % len(self.indexes)]
+
+
+class HybridChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(self, remote="channels_redis.core.RedisChannelLayer", hosts=None, expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, replicas=64, **remote_config):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.group_expiry = group_expiry
+        backend = import_string(remote) if isinstance(remote, str) else remote
+        config = dict(expiry=expiry, group_expiry=group_expiry, capacity=capacity, channel_capacity=channel_capacity,
+                      **remote_config)
+        self.shards = [backend(hosts=[host], **config) for host in hosts] if hosts else [backend(**config)]
+        self.ring = HashRing(hosts or ["default"], replicas)
+        self.process_id = uuid.uuid4().hex[:12]
+        self.process_channel = f"hybrid.{self.process_id}"
+        self.channels = {}  # local channel -> asyncio.Queue of (expires, message)
+        self.groups = {}  # group -> {local channel: joined at}
+        self.subscribed = {}  # group -> when this process last joined it remotely
+        self.pumps = []
+        self.cleaned_at = 0.0
+
+    # Routing
+
+    def shard(self, name):
+        return self.shards[self.ring.index(name)]
+
+    def owner(self, channel):
+        """Process id of a channel from HybridChannelLayer.new_channel(), else None."""
+        if "!" not in channel:
+            return None
+        return channel.split("!", 1)[0].rpartition(".")[2]
+
+    def is_local(self, channel):
+        return self.owner(channel) == self.process_id
+
+    # Local delivery
+
+    def local_queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def put_local(self, channel, message):
+        queue = self.local_queue(channel)
+        if queue.full():
+            self.drop_expired(channel, queue)
+            queue = self.local_queue(channel)
+        try:
+            queue.put_nowait((time.time() + self.expiry, dict(message)))
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def deliver_to_group(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            try:
+                self.put_local(channel, message)
+            except ChannelFull:
+                metrics.CHANNEL_FULL.inc()
+
+    def deliver(self, envelope):
+        """Hand a message forwarded by another process to the local channel or group members."""
+        if "group" in envelope:
+            # group_send already delivered to this process's members directly.
+            if envelope["origin"] != self.process_id:
+                self.deliver_to_group(envelope["group"], envelope["message"])
+            return
+        try:
+            self.put_local(envelope["channel"], envelope["message"])
+        except ChannelFull:
+            metrics.CHANNEL_FULL.inc()
+
+    async def pump(self, shard):
+        while True:
+            try:
+                envelope = await shard.receive(self.process_channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Receiving on %s failed", self.process_channel)
+                await asyncio.sleep(1)
+                continue
+            self.deliver(envelope)
+
+    def start_pumps(self):
+        loop = asyncio.get_running_loop()
+        if self.pumps and self.pumps[0].get_loop() is loop and not self.pumps[0].done():
+            return
+        self.pumps = [loop.create_task(self.pump(shard)) for shard in self.shards]
+
+    async def stop_pumps(self):
+        # Pumps of an earlier event loop died with it.
+        loop = asyncio.get_running_loop()
+        pumps = [task for task in self.pumps if task.get_loop() is loop]
+        self.pumps = []
+        for task in pumps:
+            task.cancel()
+        await asyncio.gather(*pumps, return_exceptions=True)
+
+    # Expiry
+
+    def drop_expired(self, channel, queue):
+        now = time.time()
+        expired = False
+        while not queue.empty() and queue._queue[0][0] < now:
+            queue.get_nowait()
+            expired = True
+        if expired:
+            # Nobody is reading it: the consumer is gone, like InMemoryChannelLayer assumes.
+            for members in self.groups.values():
+                members.pop(channel, None)
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def clean_expired(self):
+        now = time.time()
+        if now - self.cleaned_at < CLEAN_INTERVAL:
+            return
+        self.cleaned_at = now
+        for channel, queue in list(self.channels.items()):
+            self.drop_expired(channel, queue)
+        timeout = now - self.group_expiry
+        for group, members in list(self.groups.items()):
+            for channel, joined in list(members.items()):
+                if joined < timeout:
+                    del members[channel]
+            if not members:
+                await self.unsubscribe(group)
+
+    async def unsubscribe(self, group):
+        self.groups.pop(group, None)
+        if self.subscribed.pop(group, None) is not None:
+            await self.shard(group).group_discard(group, self.process_channel)
+
+    # Channel layer API
+
+    async def new_channel(self, prefix="specific."):
+        self.start_pumps()
+        token = "".join(random.choices(string.ascii_letters, k=12))
+        return f"{prefix.rstrip('.')}.{self.process_id}!{token}"
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        owner = self.owner(channel)
+        if owner == self.process_id:
+            LOCAL_MESSAGES.inc()
+            self.put_local(channel, message)
+            return
+        REMOTE_MESSAGES.inc()
+        if owner is None:
+            await self.shard(channel).send(channel, message)
+        else:
+            # Any shard reaches the owner; hashing the channel keeps its messages in order.
+            await self.shard(channel).send(f"hybrid.{owner}", {"channel": channel, "message": message})
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if not self.is_local(channel):
+            return await self.shard(channel).receive(channel)
+        await self.clean_expired()
+        queue = self.local_queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if not self.is_local(channel):
+            raise ValueError(f"{channel!r} was not created by this process's channel layer")
+        now = time.time()
+        self.groups.setdefault(group, {})[channel] = now
+        # Refresh the remote membership well before channels_redis expires it.
+        if now - self.subscribed.get(group, 0) > self.group_expiry / 2:
+            self.start_pumps()
+            await self.shard(group).group_add(group, self.process_channel)
+            self.subscribed[group] = now
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        members = self.groups.get(group)
+        if members is None:
+            return
+        members.pop(channel, None)
+        if not members:
+            await self.unsubscribe(group)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        await self.clean_expired()
+        if group in self.groups:
+            LOCAL_MESSAGES.inc()
+            self.deliver_to_group(group, message)
+        REMOTE_MESSAGES.inc()
+        await self.shard(group).group_send(group, {"group": group, "origin": self.process_id, "message": message})
+
+    async def flush(self):
+        await self.stop_pumps()
+        self.channels = {}
+        self.groups = {}
+        self.subscribed = {}
+        for shard in self.shards:
+            if hasattr(shard, "flush"):
+                await shard.flush()
+
+    async def close(self):
+        await self.stop_pumps()
+        for shard in self.shards:
+            if hasattr(shard, "close"):
+                await shard.close()
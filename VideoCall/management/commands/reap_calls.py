@@ -0,0 +1,64 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from VideoCall.presence import get_presence
+from VideoCall.reaper import (DEFAULT_BATCH_SIZE, close_orphans, find_orphans, find_stale_participants, reap_batch,
+                              release_calls, release_participants, stale_report)
+
+
+class Command(BaseCommand):
+    help = (
+        "Close calls left RINGING or CONNECTED by a worker that died: RINGING "
+        "past VIDEO_CALL_RING_TIMEOUT becomes MISSED, CONNECTED past "
+        "VIDEO_CALL_MAX_DURATION becomes ENDED. With shared presence, also ends "
+        "calls and leaves rooms whose participants went offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report stale calls without closing them.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Calls closed per UPDATE.")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds to wait between batches.")
+        parser.add_argument("--no-notify", action="store_true", help="Do not message participants or clear presence.")
+
+    def handle(self, *args, **options):
+        report = stale_report()
+        # Presence local to this process would show everyone offline.
+        shared = get_presence().shared
+        orphans = async_to_sync(find_orphans)(options["batch_size"]) if shared else []
+        participants = async_to_sync(find_stale_participants)(options["batch_size"]) if shared else []
+        if not report and not orphans and not participants:
+            self.stdout.write("No stale calls.")
+            return
+        for status, row in sorted(report.items()):
+            self.stdout.write(f"{status}: {row['count']} stale, oldest started {row['oldest']:%Y-%m-%d %H:%M:%S}")
+        if orphans:
+            self.stdout.write(f"CONNECTED: {len(orphans)} with a participant offline")
+        if participants:
+            self.stdout.write(f"Rooms: {len(participants)} participants offline")
+        if options["dry_run"]:
+            return
+
+        total = 0
+        while True:
+            closed = reap_batch(options["batch_size"])
+            total += self.release(closed, options)
+            if len(closed) < options["batch_size"]:
+                break
+            time.sleep(options["pause"])
+        for start in range(0, len(orphans), options["batch_size"]):
+            if start:
+                time.sleep(options["pause"])
+            total += self.release(close_orphans(orphans[start:start + options["batch_size"]]), options)
+        if participants:
+            async_to_sync(release_participants)(participants, notify=not options["no_notify"])
+        self.stdout.write(self.style.SUCCESS(f"Closed {total} stale calls, removed {len(participants)} room participants."))
+
+    def release(self, closed, options):
+        if closed and not options["no_notify"]:
+            async_to_sync(release_calls)(closed)
+        if options["verbosity"] > 1:
+            for video_call in closed:
+                self.stdout.write(f"  {video_call.id}: {video_call.status}")
+        return len(closed)
@@ -0,0 +1,32 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from VideoCall.analytics import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily call stats (DailyCallStats, UserDailyCallStats) "
+        "from the finished calls. Run it nightly; by default it refreshes "
+        "today and yesterday."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=2, help="Days to refresh, counting back from today.")
+        parser.add_argument("--since", type=date.fromisoformat, help="Backfill from this date (YYYY-MM-DD) instead.")
+        parser.add_argument("--until", type=date.fromisoformat, help="Last day to refresh (default: today).")
+
+    def handle(self, *args, **options):
+        last_day = options["until"] or timezone.localdate()
+        first_day = options["since"] or last_day - timedelta(days=options["days"] - 1)
+        if first_day > last_day:
+            raise CommandError(f"--since {first_day} is after {last_day}")
+        start = time.perf_counter()
+        days, user_days = rollup(first_day, last_day)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {days} days ({first_day} to {last_day}), {user_days} user days "
+            f"in {time.perf_counter() - start:.2f}s."
+        ))
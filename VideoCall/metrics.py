@@ -0,0 +1,273 @@
+"""
+In-process metrics rendered in the Prometheus text format.
+
+Every worker keeps its own registry; scrape each worker (or aggregate in
+Prometheus) for totals. Updates take one uncontended lock, so they are safe
+from both the event loop and the database executor threads.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Seconds; spans a cached relay (sub-millisecond) to a slow database write.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    A metric family. ``labels(*values)`` returns the child for one label set;
+    keep it around on hot paths to skip the lookup.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self.new_child())
+        return child
+
+    @abstractmethod
+    def new_child(self):
+        """The object holding the value of one label set."""
+
+    def samples(self):
+        """Yield ``(name, label values, extra labels, value)`` tuples."""
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield self.name, key, (), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With ``function`` the gauge is computed at
+    scrape time instead: it returns a number, or a dict of label values -> number.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def samples(self):
+        if self.function is None:
+            yield from super().samples()
+            return
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, key if isinstance(key, tuple) else (key,), (), value
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket, the last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", key, (("le", format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), cumulative
+
+
+def timed(histogram):
+    """Decorator observing how long each call of a sync function takes."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name!r} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+
+def live_calls():
+    from django.db.models import Count
+
+    from .models import VideoCall
+    counts = dict.fromkeys(VideoCall.LIVE_STATUSES, 0)
+    counts.update(
+        VideoCall.objects.live()
+        .values_list("status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    return {(status,): count for status, count in counts.items()}
+
+
+MESSAGES = registry.register(Counter(
+    "videocall_messages_total", "Signaling messages received, by action.", ["action"]))
+ACTION_SECONDS = registry.register(Histogram(
+    "videocall_action_seconds", "Time spent handling a signaling action.", ["action"]))
+ERROR_FRAMES = registry.register(Counter(
+    "videocall_error_frames_total", "Error frames sent to clients, by status code.", ["status_code"]))
+DB_SECONDS = registry.register(Histogram(
+    "videocall_db_seconds", "Time spent in a consumer database helper.", ["helper"]))
+CHANNEL_SEND_SECONDS = registry.register(Histogram(
+    "videocall_channel_send_seconds", "Channel layer send latency.", ["method"]))
+CONSUMER_ERRORS = registry.register(Counter(
+    "videocall_consumer_errors_total", "Exceptions swallowed by the consumer, by stage.", ["stage"]))
+RATE_LIMITED = registry.register(Counter(
+    "videocall_rate_limited_total", "Frames dropped by the per-connection rate limiter, by action.", ["action"]))
+CHANNEL_FULL = registry.register(Counter(
+    "videocall_channel_full_total", "Channel layer sends refused because the channel was full."))
+DROPPED_CANDIDATES = registry.register(Counter(
+    "videocall_dropped_candidates_total", "ICE candidates dropped from a full relay queue."))
+STRAY_RELAYS = registry.register(Counter(
+    "videocall_stray_relays_total", "Relayed SDP / candidates dropped for not coming from the call's pinned device."))
+OPEN_SOCKETS = registry.register(Gauge(
+    "videocall_open_websockets", "Websocket connections open on this worker."))
+ACTIVE_CALLS = registry.register(Gauge(
+    "videocall_active_calls", "Calls that are ringing or connected.", ["status"], function=live_calls))
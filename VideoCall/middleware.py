@@ -0,0 +1,39 @@
+from .analytics import get_rollup_job
+from .journal import get_journal
+from .presence import get_presence_heartbeat
+from .reaper import get_reaper
+from .ringing import get_ring_scheduler
+
+
+class CallTimersMiddleware:
+    """
+    Runs the ring timeout scheduler, the stale call reaper, the call stats
+    rollup, the presence heartbeat and, in write-behind mode, the call
+    journal next to the ASGI app.
+    Servers that speak the lifespan protocol start and stop them there;
+    others start them with the first connection.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        services = [get_ring_scheduler(), get_reaper(), get_rollup_job(), get_presence_heartbeat()]
+        journal = get_journal()
+        if journal is not None:
+            services.append(journal)
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    for service in services:
+                        service.start()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    for service in services:
+                        await service.stop()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        for service in services:
+            service.start()
+        return await self.app(scope, receive, send)
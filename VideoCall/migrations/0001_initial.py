@@ -0,0 +1,114 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCallStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('ended', models.PositiveIntegerField(default=0)),
+                ('missed', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('p95_seconds', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'daily call stats',
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('mode', models.CharField(choices=[('MESH', 'Mesh'), ('SFU', 'SFU')], default='MESH', max_length=4)),
+                ('max_participants', models.PositiveSmallIntegerField(default=8)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rooms_owned', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Participant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel_name', models.CharField(max_length=255)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('left_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_participations', to=settings.AUTH_USER_MODEL)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='VideoCall.room')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserDailyCallStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('calls_made', models.PositiveIntegerField(default=0)),
+                ('calls_received', models.PositiveIntegerField(default=0)),
+                ('missed', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('p95_seconds', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_call_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'user daily call stats',
+                'ordering': ['-day', 'user'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VideoCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_start_time', models.DateTimeField(auto_now_add=True)),
+                ('call_end_time', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('RINGING', 'Ringing'), ('CONNECTED', 'Connected'), ('ENDED', 'Ended'), ('MISSED', 'Missed')], default='RINGING', max_length=10)),
+                ('caller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calls_made', to=settings.AUTH_USER_MODEL)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calls_received', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='room',
+            constraint=models.UniqueConstraint(condition=models.Q(('closed_at__isnull', True)), fields=('name',), name='room_open_name_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='participant',
+            constraint=models.UniqueConstraint(condition=models.Q(('left_at__isnull', True)), fields=('room', 'user'), name='participant_present_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='userdailycallstats',
+            index=models.Index(fields=['user', '-day'], name='userdailystats_user_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdailycallstats',
+            constraint=models.UniqueConstraint(fields=('day', 'user'), name='userdailycallstats_day_user_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['caller', '-call_start_time'], name='videocall_caller_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['receiver', '-call_start_time'], name='videocall_receiver_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videocall',
+            index=models.Index(fields=['status', 'call_start_time'], name='videocall_status_start_idx'),
+        ),
+    ]
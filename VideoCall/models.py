@@ -1,24 +1,177 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.sql import UpdateQuery
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+
+def supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+class VideoCallQuerySet(models.QuerySet):
+    def update_returning(self, **values):
+        """
+        Like ``update(**values)`` but returns the updated rows as instances.
+        Uses UPDATE ... RETURNING where the backend has it, so the write and
+        the read are a single statement.
+        """
+        connection = connections[self.db]
+        if not supports_update_returning(connection):
+            with transaction.atomic(using=self.db):
+                pks = list(self.select_for_update().values_list('pk', flat=True))
+                if not pks:
+                    return []
+                manager = self.model._default_manager.using(self.db)
+                manager.filter(pk__in=pks).update(**values)
+                return list(manager.filter(pk__in=pks))
+
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        sql, params = query.get_compiler(self.db).as_sql()
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(field.column) for field in self.model._meta.concrete_fields)
+        return list(self.model._default_manager.db_manager(self.db).raw(f'{sql} RETURNING {columns}', params))
+
+    def live(self):
+        """Calls that are still RINGING or CONNECTED."""
+        return self.filter(status__in=self.model.LIVE_STATUSES)
+
+    def for_user(self, user_id):
+        return self.filter(Q(caller_id=user_id) | Q(receiver_id=user_id))
+
+    def history(self, user_id, before=None, limit=20):
+        """
+        Up to ``limit`` calls made or received by ``user_id``, newest first and
+        strictly older than the ``before`` cursor ``(call_start_time, id)``.
+
+        Made and received calls are each read through their own
+        (user, -call_start_time) index and merged, so a page costs the same
+        however long the user's history is. Returns ``(calls, has_more)``.
+        """
+        queryset = self.select_related('caller', 'receiver').order_by('-call_start_time', '-id')
+        if before is not None:
+            start_time, pk = before
+            queryset = queryset.filter(Q(call_start_time__lt=start_time) | Q(call_start_time=start_time, pk__lt=pk))
+        made = queryset.filter(caller_id=user_id)[:limit + 1]
+        received = queryset.filter(receiver_id=user_id).exclude(caller_id=user_id)[:limit + 1]
+        calls = sorted([*made, *received], key=lambda call: (call.call_start_time, call.pk), reverse=True)
+        return calls[:limit], len(calls) > limit
+
+    def transition(self, call_id, status, user_id=None):
+        """
+        Move call ``call_id`` to ``status`` with one conditional UPDATE.
+
+        Returns the updated VideoCall, or None when the call does not exist,
+        ``user_id`` is not one of its participants, or its current status
+        does not allow the transition.
+        """
+        sources = self.model.TRANSITIONS.get(status)
+        if not sources:
+            raise ValueError(f"Unknown call status {status!r}")
+        values = {'status': status}
+        if status in self.model.FINAL_STATUSES:
+            values['call_end_time'] = timezone.now()
+        queryset = self.filter(pk=call_id, status__in=sources)
+        if user_id is not None:
+            queryset = queryset.for_user(user_id)
+        rows = queryset.update_returning(**values)
+        return rows[0] if rows else None
+
+    def close(self):
+        """
+        Close every live call in this queryset in one statement: RINGING
+        becomes MISSED and CONNECTED becomes ENDED. Returns the closed calls.
+        """
+        RINGING, CONNECTED, ENDED, MISSED = self.model.RINGING, self.model.CONNECTED, self.model.ENDED, self.model.MISSED
+        return self.filter(status__in=(RINGING, CONNECTED)).update_returning(
+            status=Case(When(status=RINGING, then=Value(MISSED)), default=Value(ENDED)),
+            call_end_time=timezone.now(),
+        )
+
+    def hang_up(self, call_id, user_id=None):
+        """Close call ``call_id`` if it is still live; returns it or None."""
+        queryset = self.filter(pk=call_id)
+        if user_id is not None:
+            queryset = queryset.for_user(user_id)
+        rows = queryset.close()
+        return rows[0] if rows else None
+
+    def stale(self, ringing_before, connected_before):
+        """Calls still RINGING since before ``ringing_before`` or CONNECTED since before ``connected_before``."""
+        return self.filter(
+            Q(status=self.model.RINGING, call_start_time__lt=ringing_before)
+            | Q(status=self.model.CONNECTED, call_start_time__lt=connected_before)
+        )
+
+    def expire_ringing(self, started_before=None):
+        """
+        Mark every call in this queryset that is still RINGING (and, with
+        ``started_before``, older than it) MISSED. Returns the expired calls.
+        """
+        queryset = self.filter(status=self.model.RINGING)
+        if started_before is not None:
+            queryset = queryset.filter(call_start_time__lt=started_before)
+        return queryset.update_returning(status=self.model.MISSED, call_end_time=timezone.now())
+
+    def transition_error(self, call_id, user_id=None):
+        """Status code explaining why a transition of ``call_id`` matched no row."""
+        call = self.filter(pk=call_id).values('caller_id', 'receiver_id').first()
+        if call is None:
+            return 404
+        if user_id is not None and user_id not in (call['caller_id'], call['receiver_id']):
+            return 403
+        return 409
+
+
 class VideoCall(models.Model):
+    RINGING = 'RINGING'
+    CONNECTED = 'CONNECTED'
+    ENDED = 'ENDED'
+    MISSED = 'MISSED'
+
     caller = models.ForeignKey(User, related_name='calls_made', on_delete=models.CASCADE)
     receiver = models.ForeignKey(User, related_name='calls_received', on_delete=models.CASCADE)
     call_start_time = models.DateTimeField(auto_now_add=True)
     call_end_time = models.DateTimeField(null=True, blank=True)
     status_list = [
-        ('RINGING', 'Ringing'),
-        ('CONNECTED', 'Connected'),
-        ('ENDED', 'Ended'),
-        ('MISSED', 'Missed'),
+        (RINGING, 'Ringing'),
+        (CONNECTED, 'Connected'),
+        (ENDED, 'Ended'),
+        (MISSED, 'Missed'),
     ]
-    status = models.CharField(max_length=10, choices=status_list, default='RINGING')
+    status = models.CharField(max_length=10, choices=status_list, default=RINGING)
+
+    # Target status -> statuses it may be reached from.
+    TRANSITIONS = {
+        CONNECTED: (RINGING,),
+        ENDED: (CONNECTED,),
+        MISSED: (RINGING,),
+    }
+    FINAL_STATUSES = (ENDED, MISSED)
+    LIVE_STATUSES = (RINGING, CONNECTED)
+
+    objects = VideoCallQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['caller', '-call_start_time'], name='videocall_caller_start_idx'),
+            models.Index(fields=['receiver', '-call_start_time'], name='videocall_receiver_start_idx'),
+            # Finds live calls by age for the ring timeout sweep and the reaper.
+            models.Index(fields=['status', 'call_start_time'], name='videocall_status_start_idx'),
+        ]
 
     def end_call(self, status):
-        self.call_end_time = models.DateTimeField(auto_now=True)
-        self.status = status
-        self.save()
+        updated = VideoCall.objects.transition(self.pk, status)
+        if updated is None:
+            return False
+        self.status = updated.status
+        self.call_end_time = updated.call_end_time
+        return True
 
     @property
     def duration(self):
@@ -28,3 +181,112 @@ class VideoCall(models.Model):
 
     def __str__(self):
         return f"Call from {self.caller.username} to {self.receiver.username} at {self.call_start_time}"
+
+
+class Room(models.Model):
+    """A multi-party meeting. Open rooms (closed_at unset) have unique names."""
+    # Every participant negotiates with every other one; fine for a handful of people.
+    MESH = 'MESH'
+    # Every participant negotiates once, with the SFU, which forwards the media.
+    SFU = 'SFU'
+
+    name = models.CharField(max_length=64)
+    owner = models.ForeignKey(User, related_name='rooms_owned', on_delete=models.CASCADE)
+    mode_list = [
+        (MESH, 'Mesh'),
+        (SFU, 'SFU'),
+    ]
+    mode = models.CharField(max_length=4, choices=mode_list, default=MESH)
+    max_participants = models.PositiveSmallIntegerField(default=8)
+    created_at = models.DateTimeField(auto_now_add=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name'], condition=Q(closed_at__isnull=True), name='room_open_name_unique'),
+        ]
+
+    def __str__(self):
+        return f"Room {self.name} ({self.mode})"
+
+
+class Participant(models.Model):
+    room = models.ForeignKey(Room, related_name='participants', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='room_participations', on_delete=models.CASCADE)
+    # The connection the participant joined from; signaling for them goes there.
+    channel_name = models.CharField(max_length=255)
+    joined_at = models.DateTimeField(auto_now_add=True)
+    left_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], condition=Q(left_at__isnull=True), name='participant_present_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.room.name}"
+
+
+class DailyCallStats(models.Model):
+    """
+    One day of finished calls, by start date in TIME_ZONE. Filled by
+    ``manage.py rollup_calls`` and the periodic rollup (analytics.py), so
+    reports never scan VideoCall. Durations run from call_start_time, so they
+    include the ringing time.
+    """
+    day = models.DateField(unique=True)
+    calls = models.PositiveIntegerField(default=0)
+    ended = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    p95_seconds = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name_plural = 'daily call stats'
+
+    @property
+    def minutes(self):
+        return round(self.total_seconds / 60, 1)
+
+    @property
+    def missed_rate(self):
+        return self.missed / self.calls if self.calls else 0
+
+    def __str__(self):
+        return f"Calls on {self.day}"
+
+
+class UserDailyCallStats(models.Model):
+    """Like DailyCallStats, for the calls one user made or received that day."""
+    day = models.DateField()
+    user = models.ForeignKey(User, related_name='daily_call_stats', on_delete=models.CASCADE)
+    calls_made = models.PositiveIntegerField(default=0)
+    calls_received = models.PositiveIntegerField(default=0)
+    # Calls to this user that nobody answered.
+    missed = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    p95_seconds = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day', 'user']
+        verbose_name_plural = 'user daily call stats'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user'], name='userdailycallstats_day_user_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-day'], name='userdailystats_user_day_idx'),
+        ]
+
+    @property
+    def minutes(self):
+        return round(self.total_seconds / 60, 1)
+
+    @property
+    def missed_rate(self):
+        return self.missed / self.calls_received if self.calls_received else 0
+
+    def __str__(self):
+        return f"Calls of {self.user.username} on {self.day}"
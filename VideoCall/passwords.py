@@ -0,0 +1,128 @@
+"""
+Password hashing off the event loop and off the shared sync thread.
+
+A PBKDF2 check costs hundreds of milliseconds of CPU. Run in a sync view
+it holds one of the threads the consumers' database calls wait for, and
+Django's own async authenticate() runs it on the event loop itself.
+Here the hashing runs on a ProcessPoolExecutor of
+VIDEO_CALL_HASHER_PROCESSES processes, so a login burst queues there and
+the worker keeps serving signaling.
+
+The hashers and their settings are picked in the web worker. The pool
+only gets a hasher instance and strings, and runs the functions in
+hashing.py, so it needs no Django setup of its own. Its processes come
+from forkserver (spawn where that is missing) rather than fork, which
+would copy the worker's event loop, threads and open connections. If a
+process dies the pool is replaced and the hash retried once, then run on
+a thread.
+
+LoginView calls aauthenticate() below rather than adding an auth backend:
+ModelBackend stays the configured one, so the sessions it already signed
+in remain valid.
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import (UNUSABLE_PASSWORD_SUFFIX_LENGTH, get_hasher, identify_hasher,
+                                         is_password_usable)
+from django.contrib.auth.signals import user_login_failed
+from django.utils.crypto import get_random_string
+
+from . import metrics
+from .hashing import encode, verify
+
+logger = logging.getLogger(__name__)
+
+HASH_SECONDS = metrics.registry.register(metrics.Histogram(
+    "videocall_password_hash_seconds", "Time from queueing a password hash to its result, by operation.", ["op"]))
+
+
+_pool = None
+
+
+def get_hasher_pool():
+    global _pool
+    if _pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(
+            max_workers=getattr(settings, "VIDEO_CALL_HASHER_PROCESSES", 2),
+            mp_context=multiprocessing.get_context(method),
+        )
+    return _pool
+
+
+def drop_hasher_pool(pool):
+    """Forget ``pool`` once broken, so the next get_hasher_pool() starts a new one."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_hasher(op, func, *args):
+    loop = asyncio.get_running_loop()
+    with HASH_SECONDS.labels(op).time():
+        for _ in range(2):
+            pool = get_hasher_pool()
+            try:
+                return await loop.run_in_executor(pool, func, *args)
+            except BrokenProcessPool:
+                logger.warning("Password hasher pool broke; starting a new one")
+                drop_hasher_pool(pool)
+        logger.error("Password hasher pool broke twice; hashing on a thread")
+        return await asyncio.to_thread(func, *args)
+
+
+async def amake_password(password):
+    hasher = get_hasher("default")
+    return await run_hasher("encode", encode, hasher, password, hasher.salt())
+
+
+async def averify_password(password, encoded):
+    """``(is_correct, must_update)`` like django.contrib.auth.hashers.verify_password."""
+    preferred = get_hasher("default")
+    try:
+        hasher = identify_hasher(encoded) if password is not None and is_password_usable(encoded) else None
+    except ValueError:
+        hasher = None
+    if hasher is None:
+        # As verify_password does: hash once so a missing password costs as long as a wrong one.
+        await amake_password(get_random_string(UNUSABLE_PASSWORD_SUFFIX_LENGTH))
+        return False, False
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = await run_hasher("verify", verify, hasher, password, encoded, must_update and not hasher_changed)
+    return is_correct, must_update
+
+
+async def aauthenticate(request, username, password):
+    """
+    What ModelBackend.aauthenticate() does, hashing on the hasher pool. The
+    user comes back with ``backend`` set to the first AUTHENTICATION_BACKENDS
+    entry (ModelBackend), so the session it logs into is the usual one.
+    """
+    UserModel = get_user_model()
+    try:
+        user = await UserModel._default_manager.aget_by_natural_key(username)
+    except UserModel.DoesNotExist:
+        # Hash anyway, so an unknown username takes as long as a wrong password (#20760).
+        await amake_password(password)
+        user = None
+    else:
+        is_correct, must_update = await averify_password(password, user.password)
+        if not is_correct or not ModelBackend().user_can_authenticate(user):
+            user = None
+        elif must_update:
+            user.password = await amake_password(password)
+            await user.asave(update_fields=["password"])
+    if user is None:
+        await user_login_failed.asend(sender=__name__, credentials={"username": username}, request=request)
+        return None
+    user.backend = settings.AUTHENTICATION_BACKENDS[0]
+    return user
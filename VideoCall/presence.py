@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OFFLINE = "offline"
+ONLINE = "online"
+BUSY = "busy"
+
+
+def presence_group(user_id):
+    return f"presence_{user_id}"
+
+
+class InMemoryPresence:
+    """
+    Presence kept in this process only. Fine for tests and single-worker
+    setups; use RedisPresence when more than one worker serves websockets.
+    """
+    # Whether other processes (such as manage.py reap_calls) see the same presence.
+    shared = False
+
+    def __init__(self, **config):
+        self.online = Counter()
+        self.busy = {}
+
+    async def connect(self, user_id):
+        """Count one more connection for ``user_id``; True if they just came online."""
+        self.online[user_id] += 1
+        return self.online[user_id] == 1
+
+    async def disconnect(self, user_id):
+        """Count one fewer connection for ``user_id``; True if they just went offline."""
+        self.online[user_id] -= 1
+        if self.online[user_id] > 0:
+            return False
+        del self.online[user_id]
+        return True
+
+    async def set_busy(self, user_id, call_id):
+        self.busy[user_id] = call_id
+
+    async def clear_busy(self, user_id, call_id=None):
+        if call_id is None or self.busy.get(user_id) == call_id:
+            self.busy.pop(user_id, None)
+
+    async def statuses(self, user_ids):
+        return {
+            user_id: BUSY if user_id in self.busy else ONLINE if self.online.get(user_id) else OFFLINE
+            for user_id in user_ids
+        }
+
+    async def status(self, user_id):
+        return (await self.statuses([user_id]))[user_id]
+
+    async def heartbeat(self):
+        """Nothing to expire: this process's counts die with it."""
+        return []
+
+
+# KEYS: online, this worker's counts, workers. ARGV: user id, now, worker id.
+CONNECT = """
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[3])
+return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+"""
+
+# KEYS: online, this worker's counts. ARGV: user id. 1 if the user went offline.
+DISCONNECT = """
+local mine = redis.call('HINCRBY', KEYS[2], ARGV[1], -1)
+if mine <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+end
+if mine < 0 then
+    -- Already taken off by a sweep that thought this worker was dead.
+    return 0
+end
+if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: busy. ARGV: user id, call id.
+CLEAR_BUSY = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# KEYS: online, busy, workers. ARGV: heartbeat cutoff, worker key prefix.
+# Takes the counts of every worker not heard from since the cutoff off the
+# totals; returns the users that left offline.
+SWEEP = """
+local offline = {}
+for _, worker in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])) do
+    local key = ARGV[2] .. worker
+    local counts = redis.call('HGETALL', key)
+    for i = 1, #counts, 2 do
+        if redis.call('HINCRBY', KEYS[1], counts[i], -tonumber(counts[i + 1])) <= 0 then
+            redis.call('HDEL', KEYS[1], counts[i])
+            redis.call('HDEL', KEYS[2], counts[i])
+            table.insert(offline, counts[i])
+        end
+    end
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[3], worker)
+end
+return offline
+"""
+
+
+class RedisPresence:
+    """
+    Presence in Redis hashes, shared by every worker: ``<prefix>:online``
+    maps user id -> open connection count and ``<prefix>:busy`` maps
+    user id -> call id.
+
+    Each worker also keeps its own share of the counts in
+    ``<prefix>:worker:<id>`` and its last heartbeat in ``<prefix>:workers``.
+    PresenceHeartbeat refreshes that every VIDEO_CALL_PRESENCE_HEARTBEAT
+    seconds and sweeps workers silent for longer than ``worker_timeout``,
+    so the users of a worker that crashed go offline instead of staying
+    online for good. Every update is one Lua script, so connects and
+    disconnects on different workers cannot interleave. The scripts build
+    worker keys themselves, so the keys must live on one Redis node.
+    """
+    shared = True
+
+    def __init__(self, hosts=None, prefix="videocall:presence", worker_timeout=90, **config):
+        import redis.asyncio as redis
+
+        host = (hosts or [("127.0.0.1", 6379)])[0]
+        if isinstance(host, str):
+            self.redis = redis.Redis.from_url(host)
+        else:
+            self.redis = redis.Redis(host=host[0], port=host[1])
+        self.online_key = f"{prefix}:online"
+        self.busy_key = f"{prefix}:busy"
+        self.workers_key = f"{prefix}:workers"
+        self.worker_prefix = f"{prefix}:worker:"
+        self.worker_id = uuid.uuid4().hex
+        self.worker_key = self.worker_prefix + self.worker_id
+        self.worker_timeout = worker_timeout
+        self.connect_script = self.redis.register_script(CONNECT)
+        self.disconnect_script = self.redis.register_script(DISCONNECT)
+        self.clear_busy_script = self.redis.register_script(CLEAR_BUSY)
+        self.sweep_script = self.redis.register_script(SWEEP)
+
+    async def connect(self, user_id):
+        count = await self.connect_script(
+            keys=[self.online_key, self.worker_key, self.workers_key], args=[user_id, time.time(), self.worker_id])
+        return count == 1
+
+    async def disconnect(self, user_id):
+        return await self.disconnect_script(keys=[self.online_key, self.worker_key], args=[user_id]) == 1
+
+    async def set_busy(self, user_id, call_id):
+        await self.redis.hset(self.busy_key, user_id, call_id)
+
+    async def clear_busy(self, user_id, call_id=None):
+        if call_id is None:
+            await self.redis.hdel(self.busy_key, user_id)
+        else:
+            await self.clear_busy_script(keys=[self.busy_key], args=[user_id, int(call_id)])
+
+    async def statuses(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(self.online_key, user_ids)
+            pipe.hmget(self.busy_key, user_ids)
+            online, busy = await pipe.execute()
+        return {
+            user_id: BUSY if is_busy is not None else ONLINE if count and int(count) > 0 else OFFLINE
+            for user_id, count, is_busy in zip(user_ids, online, busy)
+        }
+
+    async def status(self, user_id):
+        return (await self.statuses([user_id]))[user_id]
+
+    async def heartbeat(self):
+        """Mark this worker alive and sweep dead ones; returns the user ids that went offline."""
+        now = time.time()
+        await self.redis.zadd(self.workers_key, {self.worker_id: now})
+        offline = await self.sweep_script(
+            keys=[self.online_key, self.busy_key, self.workers_key],
+            args=[now - self.worker_timeout, self.worker_prefix])
+        return [int(user_id) for user_id in offline]
+
+
+_presence = None
+
+
+def get_presence():
+    """The presence backend configured by VIDEO_CALL_PRESENCE (in-memory by default)."""
+    global _presence
+    if _presence is None:
+        config = getattr(settings, "VIDEO_CALL_PRESENCE", {})
+        backend = import_string(config.get("BACKEND", "VideoCall.presence.InMemoryPresence"))
+        _presence = backend(**config.get("CONFIG", {}))
+    return _presence
+
+
+class PresenceHeartbeat:
+    """
+    Calls the presence backend's heartbeat every ``interval`` seconds and
+    tells the followers of anyone it took offline.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.task = None
+
+    def start(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.task = loop.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.beat()
+            except Exception:
+                logger.exception("Presence heartbeat failed")
+            await asyncio.sleep(self.interval)
+
+    async def beat(self):
+        offline = await get_presence().heartbeat()
+        if offline:
+            logger.warning("Took %d users of dead workers offline", len(offline))
+            channel_layer = get_channel_layer()
+            for user_id in offline:
+                await channel_layer.group_send(presence_group(user_id), {
+                    "type": "presence.update",
+                    "user_id": user_id,
+                    "status": OFFLINE
+                })
+        return offline
+
+
+_heartbeat = None
+
+
+def get_presence_heartbeat():
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = PresenceHeartbeat(getattr(settings, "VIDEO_CALL_PRESENCE_HEARTBEAT", 30))
+    return _heartbeat
@@ -0,0 +1,132 @@
+"""
+Token buckets limiting how fast one connection may send each action.
+
+VIDEO_CALL_RATE_LIMITS maps an action name to ``(per_second, burst)``.
+"default" applies to each action not listed (on its own bucket) and "*" to
+every action of the connection together. A missing entry means no limit.
+
+ConcurrencyLimiter caps requests in progress per key instead: the login
+view uses it to bound the password hashes one client IP has queued.
+"""
+import ipaddress
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    def __init__(self, limits):
+        self.limits = limits
+        now = time.monotonic()
+        self.total = TokenBucket(*limits["*"], now) if "*" in limits else None
+        self.buckets = {}
+        self.dropped = 0
+        self.limited = set()  # actions dropped since their last frame that got through
+
+    def bucket(self, action, now):
+        try:
+            return self.buckets[action]
+        except KeyError:
+            limit = self.limits.get(action, self.limits.get("default"))
+            bucket = self.buckets[action] = TokenBucket(*limit, now) if limit else None
+            return bucket
+
+    def allow(self, action):
+        now = time.monotonic()
+        bucket = self.bucket(action, now)
+        if (bucket is None or bucket.take(now)) and (self.total is None or self.total.take(now)):
+            self.limited.discard(action)
+            return True
+        self.dropped += 1
+        return False
+
+    def first_drop(self, action):
+        """True for the first dropped frame of ``action`` since one got through."""
+        if action in self.limited:
+            return False
+        self.limited.add(action)
+        return True
+
+
+def get_rate_limiter():
+    """A fresh limiter with VIDEO_CALL_RATE_LIMITS, for one connection."""
+    return RateLimiter(getattr(settings, "VIDEO_CALL_RATE_LIMITS", {}))
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` requests in progress per key (a client IP) in this process."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = {}
+
+    def acquire(self, key):
+        count = self.active.get(key, 0)
+        if self.limit and count >= self.limit:
+            return False
+        self.active[key] = count + 1
+        return True
+
+    def release(self, key):
+        count = self.active.pop(key, 0) - 1
+        if count > 0:
+            self.active[key] = count
+
+
+def client_ip(request):
+    """
+    The address a request came from. Behind a proxy listed in
+    VIDEO_CALL_TRUSTED_PROXIES (addresses or networks) REMOTE_ADDR is the
+    proxy's, so this takes the right-most X-Forwarded-For entry that is not
+    a trusted proxy itself. Entries further left are set by the client and
+    could be forged.
+    """
+    trusted = [ipaddress.ip_network(proxy, strict=False) for proxy in getattr(settings, "VIDEO_CALL_TRUSTED_PROXIES", ())]
+
+    def is_trusted(address):
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(address in network for network in trusted)
+
+    address = request.META.get("REMOTE_ADDR", "")
+    if not is_trusted(address):
+        return address
+    for hop in reversed(request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")):
+        hop = hop.strip()
+        if not hop:
+            continue
+        if not is_trusted(hop):
+            return hop
+        address = hop
+    return address
+
+
+_login_limiter = None
+
+
+def get_login_limiter():
+    """Per-IP limit of the logins and signups hashing at once (VIDEO_CALL_LOGIN_CONCURRENCY)."""
+    global _login_limiter
+    if _login_limiter is None:
+        _login_limiter = ConcurrencyLimiter(getattr(settings, "VIDEO_CALL_LOGIN_CONCURRENCY", 2))
+    return _login_limiter
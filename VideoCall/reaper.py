@@ -0,0 +1,242 @@
+"""
+Closes calls orphaned by a worker that died before websocket_disconnect ran.
+
+A call is stale once it has been RINGING longer than VIDEO_CALL_RING_TIMEOUT
+or CONNECTED longer than VIDEO_CALL_MAX_DURATION. Each batch is found and
+closed by a single UPDATE ... WHERE id IN (SELECT ... LIMIT n) over the live
+call index, so no statement holds the SQLite write lock for long. Used by
+``manage.py reap_calls`` and, every VIDEO_CALL_REAPER_INTERVAL seconds, by
+StaleCallReaper inside the ASGI process.
+
+A CONNECTED call is also orphaned, long before VIDEO_CALL_MAX_DURATION,
+once it is older than VIDEO_CALL_ORPHAN_TIMEOUT and presence shows one of
+its participants offline: a participant in a call stays busy until it is
+hung up, even while parked for a resume, so offline means their worker went
+away without cleaning up (RedisPresence sweeps such workers' connections).
+The same goes for a room participant: still present in the room but
+offline means their worker died before leaving it, so the seat would stay
+taken and the room never close. Both the command and StaleCallReaper only
+check these against presence every worker shares.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from . import metrics, repository
+from .presence import OFFLINE, get_presence, presence_group
+
+logger = logging.getLogger(__name__)
+
+REAPED_CALLS = metrics.registry.register(metrics.Counter(
+    "videocall_reaped_calls_total", "Stale calls closed by the reaper."))
+REAPED_PARTICIPANTS = metrics.registry.register(metrics.Counter(
+    "videocall_reaped_participants_total", "Offline room participants taken out of their room by the reaper."))
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def stale_calls(now=None):
+    from .models import VideoCall
+    now = now or timezone.now()
+    ring_timeout = getattr(settings, "VIDEO_CALL_RING_TIMEOUT", 30)
+    max_duration = getattr(settings, "VIDEO_CALL_MAX_DURATION", 4 * 60 * 60)
+    return VideoCall.objects.stale(
+        ringing_before=now - timedelta(seconds=ring_timeout),
+        connected_before=now - timedelta(seconds=max_duration),
+    )
+
+
+def stale_report(now=None):
+    """``{status: {"count": n, "oldest": datetime}}`` for the stale calls, without touching them."""
+    rows = stale_calls(now).values("status").annotate(count=Count("id"), oldest=Min("call_start_time")).order_by()
+    return {row["status"]: {"count": row["count"], "oldest": row["oldest"]} for row in rows}
+
+
+def connected_batch(after_pk, batch_size, started_before):
+    """``(id, caller_id, receiver_id)`` of up to ``batch_size`` CONNECTED calls after ``after_pk``."""
+    from .models import VideoCall
+    return list(VideoCall.objects.filter(
+        status=VideoCall.CONNECTED, call_start_time__lt=started_before, pk__gt=after_pk,
+    ).order_by("pk").values_list("pk", "caller_id", "receiver_id")[:batch_size])
+
+
+async def find_orphans(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Ids of CONNECTED calls older than VIDEO_CALL_ORPHAN_TIMEOUT with a participant offline."""
+    presence = get_presence()
+    timeout = getattr(settings, "VIDEO_CALL_ORPHAN_TIMEOUT", 2 * 60)
+    started_before = (now or timezone.now()) - timedelta(seconds=timeout)
+    orphans = []
+    after_pk = 0
+    while True:
+        rows = await repository.run_sync(connected_batch, after_pk, batch_size, started_before)
+        statuses = await presence.statuses({user_id for _, *participants in rows for user_id in participants})
+        orphans += [pk for pk, *participants in rows if any(statuses[user_id] == OFFLINE for user_id in participants)]
+        if len(rows) < batch_size:
+            return orphans
+        after_pk = rows[-1][0]
+
+
+def present_batch(after_pk, batch_size, joined_before):
+    """
+    ``(id, room_id, room_name, user_id, username, channel_name)`` of up to
+    ``batch_size`` participants still in a room, after ``after_pk``.
+    """
+    from .models import Participant
+    return list(Participant.objects.filter(
+        left_at__isnull=True, joined_at__lt=joined_before, pk__gt=after_pk,
+    ).order_by("pk").values_list("pk", "room_id", "room__name", "user_id", "user__username", "channel_name")[:batch_size])
+
+
+async def find_stale_participants(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Participants (as from present_batch) who joined over VIDEO_CALL_ORPHAN_TIMEOUT ago and are offline."""
+    presence = get_presence()
+    timeout = getattr(settings, "VIDEO_CALL_ORPHAN_TIMEOUT", 2 * 60)
+    joined_before = (now or timezone.now()) - timedelta(seconds=timeout)
+    stale = []
+    after_pk = 0
+    while True:
+        rows = await repository.run_sync(present_batch, after_pk, batch_size, joined_before)
+        statuses = await presence.statuses({row[3] for row in rows})
+        stale += [row for row in rows if statuses[row[3]] == OFFLINE]
+        if len(rows) < batch_size:
+            return stale
+        after_pk = rows[-1][0]
+
+
+async def release_participants(participants, notify=True):
+    """
+    Take each participant out of their room, closing rooms left empty, and
+    unless not ``notify``, tell the rest of the room.
+    """
+    from .rooms import leave_room, room_group
+    channel_layer = get_channel_layer()
+    for _, room_id, room_name, user_id, username, channel_name in participants:
+        await repository.run_sync(leave_room, room_id, user_id, channel_name)
+        if not notify:
+            continue
+        await channel_layer.group_send(room_group(room_id), {
+            "type": "room.event",
+            "room": room_name,
+            "payload": {"action": "participant_left", "room": room_name, "username": username},
+            "left": (user_id, channel_name)
+        })
+    REAPED_PARTICIPANTS.inc(len(participants))
+
+
+def close_orphans(call_ids):
+    """Close the calls ``call_ids`` that are still live; returns the closed calls."""
+    from .models import VideoCall
+    closed = VideoCall.objects.filter(pk__in=call_ids).close()
+    REAPED_CALLS.inc(len(closed))
+    return closed
+
+
+def reap_batch(batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Close up to ``batch_size`` of the oldest stale calls; returns the closed calls."""
+    from .models import VideoCall
+    batch = stale_calls(now).order_by("call_start_time").values("pk")[:batch_size]
+    closed = VideoCall.objects.filter(pk__in=batch).close()
+    REAPED_CALLS.inc(len(closed))
+    return closed
+
+
+async def release_calls(video_calls):
+    """
+    Tell both parties of each closed call and, for calls that were
+    connected, clear their busy presence.
+    """
+    from .models import VideoCall
+    channel_layer = get_channel_layer()
+    presence = get_presence()
+    for video_call in video_calls:
+        if video_call.status == VideoCall.MISSED:
+            payload = {"action": "call_missed", "status_code": 408, "video_call_id": video_call.id, "message": "No answer"}
+        else:
+            payload = {"action": "call_ended", "status_code": 200, "video_call_id": video_call.id, "message": "Call ended"}
+        participants = (video_call.caller_id, video_call.receiver_id)
+        for user_id in participants:
+            await channel_layer.group_send(f"videocall_{user_id}", {
+                "type": "chat_message",
+                "payload": payload,
+                "forget_call": video_call.id
+            })
+        if video_call.status == VideoCall.ENDED:
+            for user_id in participants:
+                await presence.clear_busy(user_id, video_call.id)
+            for user_id, status in (await presence.statuses(participants)).items():
+                await channel_layer.group_send(presence_group(user_id), {
+                    "type": "presence.update",
+                    "user_id": user_id,
+                    "status": status
+                })
+
+
+class StaleCallReaper:
+    def __init__(self, interval, batch_size=DEFAULT_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.task = None
+
+    def start(self):
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.task = loop.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("Stale call reaper failed")
+
+    async def reap(self):
+        total = 0
+        while True:
+            closed = await repository.run_sync(reap_batch, self.batch_size)
+            await release_calls(closed)
+            total += len(closed)
+            if len(closed) < self.batch_size:
+                break
+        participants = []
+        # Presence local to this worker shows users of every other worker offline.
+        if get_presence().shared:
+            orphans = await find_orphans(self.batch_size)
+            for start in range(0, len(orphans), self.batch_size):
+                closed = await repository.run_sync(close_orphans, orphans[start:start + self.batch_size])
+                await release_calls(closed)
+                total += len(closed)
+            participants = await find_stale_participants(self.batch_size)
+            await release_participants(participants)
+        if total:
+            logger.warning("Reaped %d stale calls", total)
+        if participants:
+            logger.warning("Took %d offline participants out of their rooms", len(participants))
+        return total
+
+
+_reaper = None
+
+
+def get_reaper():
+    global _reaper
+    if _reaper is None:
+        _reaper = StaleCallReaper(getattr(settings, "VIDEO_CALL_REAPER_INTERVAL", 5 * 60))
+    return _reaper
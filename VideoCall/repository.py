@@ -0,0 +1,192 @@
+"""
+Async data layer for the consumer.
+
+Single-statement lookups and inserts use Django's async queryset API (aget,
+afirst, acreate, ...). Django 5.2 still runs those through asgiref's shared
+sync thread, one query at a time for the whole process, so they are kept to
+quick statements. Anything that needs a transaction or a raw statement runs
+as a plain sync function on the bounded DatabaseExecutor instead: its
+VIDEO_CALL_DB_THREADS threads each keep their own connection, so up to that
+many transactions run at once and everything else queues where
+``videocall_db_queue_depth`` can see it. Set VIDEO_CALL_DB_THREADS to 0 to
+run those on the shared thread too, as database_sync_to_async does.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics
+from .cache import normalize_call_id
+
+QUEUE_DEPTH = metrics.registry.register(metrics.Gauge(
+    "videocall_db_queue_depth", "Database jobs waiting for an executor thread."))
+BUSY_THREADS = metrics.registry.register(metrics.Gauge(
+    "videocall_db_busy_threads", "Executor threads running a database job."))
+QUEUE_SECONDS = metrics.registry.register(metrics.Histogram(
+    "videocall_db_queue_seconds", "Time a database job waited for an executor thread."))
+
+
+class DatabaseExecutor(ThreadPoolExecutor):
+    """A thread pool that tracks how many jobs are queued and running."""
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix="videocall-db")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted = time.perf_counter()
+        with self.lock:
+            self.queued += 1
+            QUEUE_DEPTH.inc()
+
+        def job():
+            QUEUE_SECONDS.observe(time.perf_counter() - submitted)
+            with self.lock:
+                self.queued -= 1
+                self.running += 1
+            QUEUE_DEPTH.dec()
+            BUSY_THREADS.inc()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                BUSY_THREADS.dec()
+
+        return super().submit(job)
+
+
+_executor = None
+
+
+def get_executor():
+    """The DatabaseExecutor sized by VIDEO_CALL_DB_THREADS, or None when it is 0."""
+    global _executor
+    threads = getattr(settings, "VIDEO_CALL_DB_THREADS", 4)
+    if _executor is None and threads:
+        _executor = DatabaseExecutor(threads)
+    return _executor
+
+
+def run_in_connection(func, *args, **kwargs):
+    # What database_sync_to_async does around each call: drop connections
+    # past CONN_MAX_AGE or broken, so a long-lived thread never reuses them.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run the sync database function ``func`` on the database executor."""
+    executor = get_executor()
+    call = functools.partial(run_in_connection, func, *args, **kwargs)
+    if executor is None:
+        return await sync_to_async(call)()
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+def db_task(name):
+    """
+    Turn a sync database function into a coroutine function that runs it
+    with run_sync and records its time under DB_SECONDS ``name``.
+    """
+    histogram = metrics.DB_SECONDS.labels(name)
+
+    def decorator(func):
+        timed = metrics.timed(histogram)(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await run_sync(timed, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_query(name):
+    """Record the time of an async query under DB_SECONDS ``name``."""
+    histogram = metrics.DB_SECONDS.labels(name)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time():
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@timed_query("get_video_call")
+async def get_video_call(user_id, call_id):
+    """``(status_code, video_call)``: 404 when it does not exist, 403 when ``user_id`` is not in it."""
+    from .models import VideoCall
+    if normalize_call_id(call_id) is None:
+        return 404, None
+    try:
+        video_call = await VideoCall.objects.aget(id=call_id)
+    except VideoCall.DoesNotExist:
+        return 404, None
+    if user_id not in (video_call.caller_id, video_call.receiver_id):
+        return 403, None
+    return 200, video_call
+
+
+@timed_query("get_user_id")
+async def get_user_id(username):
+    from .models import User
+    return await User.objects.filter(username=username).values_list("id", flat=True).afirst()
+
+
+@timed_query("get_user_ids")
+async def get_user_ids(usernames):
+    """``{user_id: username}`` for the usernames that exist."""
+    from .models import User
+    return {user_id: username async for user_id, username in User.objects.filter(username__in=usernames).values_list("id", "username")}
+
+
+@timed_query("create_video_call")
+async def create_video_call(caller, receiver_id):
+    from .models import VideoCall
+    return 201, await VideoCall.objects.acreate(caller=caller, receiver_id=receiver_id)
+
+
+@db_task("transition_video_call")
+def transition_video_call(user_id, video_call_id, status):
+    """``(status_code, video_call)`` after moving the call to ``status`` as ``user_id``."""
+    from .models import VideoCall
+    # Statuses come straight from the client: a list or object is not hashable.
+    if not isinstance(status, str) or status not in VideoCall.TRANSITIONS:
+        return 400, None
+    if normalize_call_id(video_call_id) is None:
+        return 404, None
+    video_call = VideoCall.objects.transition(video_call_id, status, user_id=user_id)
+    if video_call is None:
+        return VideoCall.objects.transition_error(video_call_id, user_id=user_id), None
+    return 200, video_call
+
+
+@db_task("hang_up_video_call")
+def hang_up_video_call(user_id, video_call_id):
+    from .models import VideoCall
+    return VideoCall.objects.hang_up(video_call_id, user_id=user_id)
+
+
+@db_task("enter_room")
+def enter_room(user, name, channel_name, mode):
+    from .rooms import join_room
+    return join_room(user, name, channel_name, mode)
+
+
+@db_task("exit_room")
+def exit_room(room_id, user_id, channel_name):
+    from .rooms import leave_room
+    return leave_room(room_id, user_id, channel_name)
@@ -0,0 +1,154 @@
+"""
+Resumable signaling sessions.
+
+A connection that opts into the "resume" feature gets a session id, and
+each frame it is sent carries a sequence number ("seq"). The last
+VIDEO_CALL_RESUME_BUFFER frames are kept. If the socket drops during a
+CONNECTED call, the consumer parks the session instead of hanging up. The
+parked record holds the call, the peer's channel and those recent frames,
+and the peer holds back what it sends. The call stays CONNECTED for
+VIDEO_CALL_RESUME_GRACE seconds.
+
+A new connection sends ``resume`` with the old session id and the last seq
+it saw. It gets the frames after that one, the peer gets its new channel,
+and the peer's held-back messages follow. If nobody resumes in time, the
+grace timer hangs the call up as a plain disconnect would have.
+
+Parked sessions live in the VIDEO_CALL_STATE_CACHE cache. With a cache
+every worker shares (Redis in the project settings) the resume can land on
+any worker; with a per-process one such as LocMemCache, or no cache at all,
+it must reach the worker that parked the session, so run one worker or pin
+clients to theirs. The grace timer runs on the worker that parked the
+session, and claiming the record decides between a resume and the timer.
+"""
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+from . import metrics, repository
+from .reaper import release_calls
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = metrics.registry.register(metrics.Counter(
+    "videocall_resume_sessions_total", "Parked signaling sessions, by outcome (parked, resumed, expired).", ["outcome"]))
+
+
+def grace_period():
+    return getattr(settings, "VIDEO_CALL_RESUME_GRACE", 20)
+
+
+def buffer_size():
+    return getattr(settings, "VIDEO_CALL_RESUME_BUFFER", 64)
+
+
+class LocalSessionStore:
+    """Process-local session id -> parked record map."""
+
+    def __init__(self):
+        self._sessions = {}
+
+    async def park(self, session_id, record, timeout):
+        self._sessions[session_id] = (time.monotonic() + timeout, record)
+
+    async def claim(self, session_id, user_id=None):
+        """Take the parked record of ``session_id`` (of ``user_id``, if given) out of the store."""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires, record = entry
+        if expires < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        if user_id is not None and record["user_id"] != user_id:
+            return None
+        del self._sessions[session_id]
+        return record
+
+
+class CacheSessionStore:
+    """Session id -> parked record map kept in a Django cache, shared by every worker."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    @staticmethod
+    def key(session_id):
+        return f"videocall:session:{session_id}"
+
+    async def park(self, session_id, record, timeout):
+        await self.cache.aset(self.key(session_id), record, timeout)
+
+    async def claim(self, session_id, user_id=None):
+        key = self.key(session_id)
+        record = await self.cache.aget(key)
+        if record is None or (user_id is not None and record["user_id"] != user_id):
+            return None
+        # Only one of two racing claims (two resumes, or a resume and the timer) deletes the key.
+        if not await self.cache.adelete(key):
+            return None
+        return record
+
+
+_store = None
+
+
+def get_session_store():
+    """Store in the VIDEO_CALL_STATE_CACHE cache, or a process-local map when that alias is unset."""
+    global _store
+    if _store is None:
+        alias = getattr(settings, "VIDEO_CALL_STATE_CACHE", None)
+        try:
+            cache = caches[alias] if alias else None
+        except InvalidCacheBackendError:
+            cache = None
+        _store = LocalSessionStore() if cache is None else CacheSessionStore(cache)
+    return _store
+
+
+class GraceTimers:
+    """Hangs up the call of each parked session nobody resumed within the grace period."""
+
+    def __init__(self):
+        self.handles = {}
+        self.tasks = set()
+
+    def schedule(self, session_id, delay):
+        loop = asyncio.get_running_loop()
+        self.handles[session_id] = loop.call_later(delay, self.fire, session_id)
+
+    def cancel(self, session_id):
+        handle = self.handles.pop(session_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def fire(self, session_id):
+        self.handles.pop(session_id, None)
+        task = asyncio.get_running_loop().create_task(self.expire(session_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def expire(self, session_id):
+        try:
+            record = await get_session_store().claim(session_id)
+            if record is None:
+                return  # resumed
+            SESSIONS.labels("expired").inc()
+            video_call = await repository.hang_up_video_call(record["user_id"], record["call_id"])
+            if video_call is not None:
+                await release_calls([video_call])
+        except Exception:
+            logger.exception("Failed to expire parked session %s", session_id)
+
+
+_timers = None
+
+
+def get_grace_timers():
+    global _timers
+    if _timers is None:
+        _timers = GraceTimers()
+    return _timers
@@ -0,0 +1,135 @@
+"""
+Server-side ring timeout.
+
+Every call that starts RINGING gets a deadline VIDEO_CALL_RING_TIMEOUT seconds
+after it was created. One task per worker sleeps until the earliest deadline,
+then marks everything due within RESOLUTION seconds MISSED in a single UPDATE
+and tells both parties. Deadlines only live in memory, so the task starts by
+sweeping the table: rows already past their deadline (left behind by a
+crashed or restarted worker) are expired and the rest are rescheduled.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics, repository
+from .cache import normalize_call_id
+from .reaper import release_calls
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_CALLS = metrics.registry.register(metrics.Counter(
+    "videocall_ring_timeouts_total", "Ringing calls marked MISSED by the ring timeout."))
+
+
+class RingTimeoutScheduler:
+    # Calls due within this many seconds of each other are expired together.
+    RESOLUTION = 0.5
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.deadlines = {}  # call id -> loop deadline
+        self.heap = []  # (deadline, call id); entries not in self.deadlines are stale
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        """Start the scheduler on the running loop unless it is already running there."""
+        loop = asyncio.get_running_loop()
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.deadlines.clear()
+        self.heap.clear()
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def schedule(self, call_id, started_at):
+        self.start()
+        call_id = normalize_call_id(call_id)
+        remaining = self.timeout - (timezone.now() - started_at).total_seconds()
+        deadline = asyncio.get_running_loop().time() + max(remaining, 0)
+        self.deadlines[call_id] = deadline
+        heapq.heappush(self.heap, (deadline, call_id))
+        if self.heap[0][1] == call_id:
+            self.wakeup.set()
+
+    def cancel(self, call_id):
+        self.deadlines.pop(normalize_call_id(call_id), None)
+
+    async def run(self):
+        try:
+            await self.sweep()
+        except Exception:
+            logger.exception("Ring timeout startup sweep failed")
+        loop = asyncio.get_running_loop()
+        while True:
+            self.wakeup.clear()
+            delay = self.heap[0][0] - loop.time() if self.heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due = self.pop_due(loop.time() + self.RESOLUTION)
+            if due:
+                try:
+                    await self.expire(due)
+                except Exception:
+                    logger.exception("Failed to expire ringing calls %s", due)
+
+    def pop_due(self, horizon):
+        due = []
+        while self.heap and self.heap[0][0] <= horizon:
+            deadline, call_id = heapq.heappop(self.heap)
+            if self.deadlines.get(call_id) == deadline:
+                del self.deadlines[call_id]
+                due.append(call_id)
+        return due
+
+    async def sweep(self):
+        expired, ringing = await repository.run_sync(self.sweep_rows)
+        await self.notify(expired)
+        for call_id, started_at in ringing:
+            self.schedule(call_id, started_at)
+
+    async def expire(self, call_ids):
+        await self.notify(await repository.run_sync(self.expire_rows, call_ids))
+
+    def sweep_rows(self):
+        from .models import VideoCall
+        expired = VideoCall.objects.expire_ringing(started_before=timezone.now() - timedelta(seconds=self.timeout))
+        ringing = list(VideoCall.objects.filter(status=VideoCall.RINGING).values_list("id", "call_start_time"))
+        return expired, ringing
+
+    def expire_rows(self, call_ids):
+        from .models import VideoCall
+        return VideoCall.objects.filter(pk__in=call_ids).expire_ringing()
+
+    async def notify(self, video_calls):
+        if video_calls:
+            EXPIRED_CALLS.inc(len(video_calls))
+            await release_calls(video_calls)
+
+
+_scheduler = None
+
+
+def get_ring_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RingTimeoutScheduler(getattr(settings, "VIDEO_CALL_RING_TIMEOUT", 30))
+    return _scheduler
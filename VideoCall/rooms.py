@@ -0,0 +1,95 @@
+"""
+Group rooms.
+
+Everyone in a room is in the ``room_<id>`` channel group, which carries
+joins, leaves and publications. Each connection keeps a RoomState per room it
+is in: the room's mode and a map of participant -> (username, channel),
+updated from those group events, so addressing a participant costs no query.
+
+MESH rooms relay offers, answers and candidates participant to participant:
+each of N people negotiates with the N - 1 others. SFU rooms negotiate every
+participant once, with the SFU (see sfu.py), which keeps the signaling per
+participant constant as the room grows. New rooms are MESH up to
+VIDEO_CALL_ROOM_MESH_LIMIT participants and SFU above, unless the creator
+picks a mode.
+"""
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+ROOM_NAME = re.compile(r"[\w-]{1,64}")
+
+
+def room_group(room_id):
+    return f"room_{room_id}"
+
+
+def default_mode(max_participants):
+    from .models import Room
+    return Room.MESH if max_participants <= getattr(settings, "VIDEO_CALL_ROOM_MESH_LIMIT", 4) else Room.SFU
+
+
+class RoomState:
+    """What one connection knows about a room it is in."""
+
+    __slots__ = ('id', 'name', 'mode', 'members')
+
+    def __init__(self, room_id, name, mode, members):
+        self.id = room_id
+        self.name = name
+        self.mode = mode
+        self.members = members  # user id -> (username, channel name)
+
+    def find(self, username):
+        """``(user_id, channel)`` of the participant called ``username``, or None."""
+        for user_id, (name, channel) in self.members.items():
+            if name == username:
+                return user_id, channel
+        return None
+
+
+def join_room(user, name, channel_name, mode=None):
+    """
+    Put ``user`` in the open room ``name``, creating it if there is none.
+    Joining again (from another device) moves the participant to
+    ``channel_name``. Returns ``(status_code, room, members)``.
+    """
+    from .models import Participant, Room
+    max_participants = getattr(settings, "VIDEO_CALL_ROOM_MAX_PARTICIPANTS", 8)
+    with transaction.atomic():
+        # Locked until commit, so two joins cannot both see a free seat.
+        room, created = Room.objects.select_for_update().get_or_create(name=name, closed_at__isnull=True, defaults={
+            'owner': user,
+            'mode': mode or default_mode(max_participants),
+            'max_participants': max_participants,
+        })
+        present = room.participants.filter(left_at__isnull=True)
+        rejoined = present.filter(user=user).update(channel_name=channel_name)
+        if not rejoined:
+            if present.count() >= room.max_participants:
+                return 409, None, None
+            Participant.objects.create(room=room, user=user, channel_name=channel_name)
+        members = {
+            user_id: (username, channel)
+            for user_id, username, channel in present.values_list('user_id', 'user__username', 'channel_name')
+        }
+    return 200, room, members
+
+
+def leave_room(room_id, user_id, channel_name):
+    """
+    Take ``user_id`` out of the room unless they have rejoined from another
+    channel since, and close the room once nobody is left. True if it closed.
+    """
+    from .models import Participant, Room
+    now = timezone.now()
+    with transaction.atomic():
+        Participant.objects.filter(
+            room_id=room_id, user_id=user_id, channel_name=channel_name, left_at__isnull=True
+        ).update(left_at=now)
+        present = Participant.objects.filter(room_id=room_id, left_at__isnull=True)
+        return bool(Room.objects.filter(pk=room_id, closed_at__isnull=True).exclude(Exists(present)).update(closed_at=now))
+
@@ -0,0 +1,91 @@
+"""
+SFU backends for SFU-mode rooms.
+
+A backend is the server side of each participant's single peer connection:
+``publish`` answers the participant's offer for their own tracks,
+``subscribe`` returns an offer carrying the tracks of the given publishers
+and ``answer`` takes the participant's answer to it. VIDEO_CALL_SFU picks the
+backend, the same way VIDEO_CALL_PRESENCE does; an adapter for a real SFU
+implements these methods.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class LocalSFU:
+    """
+    In-process stand-in for an SFU. It keeps the negotiation state a real
+    SFU would and answers with placeholder SDP, but forwards no media. Use
+    it for development, tests and signaling benchmarks.
+    """
+
+    def __init__(self, **config):
+        self.rooms = defaultdict(dict)  # room id -> user id -> Publication
+
+    def publication(self, room_id, user_id):
+        return self.rooms[room_id].setdefault(user_id, Publication())
+
+    async def publish(self, room_id, user_id, offer):
+        publication = self.publication(room_id, user_id)
+        publication.offer = offer
+        publication.version += 1
+        return {"type": "answer", "sdp": self.sdp(room_id, user_id, publication.version, [user_id])}
+
+    async def add_candidates(self, room_id, user_id, candidates):
+        self.publication(room_id, user_id).candidates.extend(candidates)
+
+    async def subscribe(self, room_id, user_id, publisher_ids):
+        publication = self.publication(room_id, user_id)
+        room = self.rooms[room_id]
+        # Only tracks that have been published can be forwarded.
+        publication.subscriptions.update(
+            publisher_id for publisher_id in publisher_ids
+            if publisher_id != user_id and publisher_id in room and room[publisher_id].offer is not None
+        )
+        publication.version += 1
+        return {"type": "offer", "sdp": self.sdp(room_id, user_id, publication.version, sorted(publication.subscriptions))}
+
+    async def answer(self, room_id, user_id, answer):
+        self.publication(room_id, user_id).answer = answer
+
+    async def leave(self, room_id, user_id):
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        room.pop(user_id, None)
+        for publication in room.values():
+            publication.subscriptions.discard(user_id)
+        if not room:
+            del self.rooms[room_id]
+
+    @staticmethod
+    def sdp(room_id, user_id, version, stream_ids):
+        lines = ["v=0", f"o=- {room_id}{user_id} {version} IN IP4 127.0.0.1", f"s=room {room_id}", "t=0 0"]
+        lines += [f"a=msid-semantic: WMS {' '.join(f'user-{stream_id}' for stream_id in stream_ids)}"]
+        return "\r\n".join(lines) + "\r\n"
+
+
+class Publication:
+    __slots__ = ('offer', 'answer', 'candidates', 'subscriptions', 'version')
+
+    def __init__(self):
+        self.offer = None
+        self.answer = None
+        self.candidates = []
+        self.subscriptions = set()
+        self.version = 0
+
+
+_sfu = None
+
+
+def get_sfu():
+    """The SFU backend configured by VIDEO_CALL_SFU (LocalSFU by default)."""
+    global _sfu
+    if _sfu is None:
+        config = getattr(settings, "VIDEO_CALL_SFU", {})
+        backend = import_string(config.get("BACKEND", "VideoCall.sfu.LocalSFU"))
+        _sfu = backend(**config.get("CONFIG", {}))
+    return _sfu
@@ -0,0 +1,127 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from .codecs import Frame
+
+
+def error_frame(status_code, message):
+    return Frame({
+        'action': 'error',
+        'status_code': status_code,
+        'message': message
+    })
+
+
+# Error frames are built once and serialized at most once per codec.
+INVALID_MESSAGE = error_frame(400, 'Invalid message')
+RECEIVER_REQUIRED = error_frame(400, 'Receiver username required')
+CALL_ID_REQUIRED = error_frame(400, 'Video call ID required')
+CALL_ID_AND_STATUS_REQUIRED = error_frame(400, 'Video call ID and status required')
+PERMISSION_DENIED = error_frame(403, 'Permission denied')
+CALL_NOT_FOUND = error_frame(404, 'Video call not found')
+USER_NOT_FOUND = error_frame(404, 'User not found')
+USER_BUSY = error_frame(409, 'User already in another call')
+INVALID_TRANSITION = error_frame(409, 'Call is not in a state that allows this')
+CANDIDATES_INVALID = error_frame(400, 'Candidates must be a list')
+INVALID_STATUS = error_frame(400, 'Unknown call status')
+USERNAMES_REQUIRED = error_frame(400, 'Usernames required')
+USERNAMES_INVALID = error_frame(400, 'Usernames must be a list')
+# 480 is SIP's "Temporarily Unavailable".
+USER_OFFLINE = error_frame(480, 'User is offline')
+ROOM_REQUIRED = error_frame(400, 'Room name required')
+ROOM_NAME_INVALID = error_frame(400, 'Room names are 1-64 letters, digits, "_" or "-"')
+ROOM_MODE_INVALID = error_frame(400, 'Room mode must be MESH or SFU')
+NOT_IN_ROOM = error_frame(403, 'Not in this room')
+PARTICIPANT_NOT_FOUND = error_frame(404, 'Participant not in this room')
+ROOM_FULL = error_frame(409, 'Room is full')
+RATE_LIMITED = error_frame(429, 'Too many messages')
+SESSION_REQUIRED = error_frame(400, 'Session id required')
+# 410 Gone: the session expired, was already resumed or its call is over.
+SESSION_EXPIRED = error_frame(410, 'Session can no longer be resumed')
+
+CALL_ERRORS = {
+    403: PERMISSION_DENIED,
+    404: CALL_NOT_FOUND,
+    409: INVALID_TRANSITION,
+}
+USER_ERRORS = {
+    403: PERMISSION_DENIED,
+    404: USER_NOT_FOUND,
+    409: USER_BUSY,
+}
+ROOM_ERRORS = {
+    403: NOT_IN_ROOM,
+    404: PARTICIPANT_NOT_FOUND,
+    409: ROOM_FULL,
+}
+
+
+@lru_cache(maxsize=None)
+def unknown_error(status_code):
+    return error_frame(status_code, 'Unknown error')
+
+
+def call_error(status_code):
+    return CALL_ERRORS.get(status_code) or unknown_error(status_code)
+
+
+def user_error(status_code):
+    return USER_ERRORS.get(status_code) or unknown_error(status_code)
+
+
+def room_error(status_code):
+    return ROOM_ERRORS.get(status_code) or unknown_error(status_code)
+
+
+class PendingRelay:
+    """SDP and ICE candidates waiting to be sent to one peer as a single batch."""
+
+    __slots__ = ('peer_id', 'role', 'sdp', 'candidates', 'timer', 'attempts')
+
+    def __init__(self, peer_id, role, sdp=None):
+        self.peer_id = peer_id
+        self.role = role
+        self.sdp = sdp
+        self.candidates = []
+        self.timer = None
+        self.attempts = 0  # sends refused because the peer's channel was full
+
+    def add_candidates(self, candidates, limit):
+        """Queue ``candidates``, dropping the oldest beyond ``limit``; returns how many were dropped."""
+        self.candidates.extend(candidates)
+        dropped = len(self.candidates) - limit
+        if dropped > 0:
+            del self.candidates[:dropped]
+            return dropped
+        return 0
+
+
+Action = namedtuple('Action', ['name', 'handler', 'required', 'missing'])
+
+
+class ActionRegistry:
+    """Maps a client "action" string to its handler and the fields it requires."""
+
+    def __init__(self):
+        self.actions = {}
+
+    def register(self, name, required=("video_call_id",), missing=CALL_ID_REQUIRED):
+        def decorator(handler):
+            self.actions[name] = Action(name, handler, tuple(required), missing)
+            return handler
+        return decorator
+
+    def get(self, name):
+        try:
+            return self.actions.get(name)
+        except TypeError:
+            return None
+
+    def __contains__(self, name):
+        return name in self.actions
+
+    def __iter__(self):
+        return iter(self.actions.values())
+
+
+actions = ActionRegistry()
@@ -21,27 +21,249 @@ let inCall = false;
 let PC = null;
 let video_call_id = 0;
 let is_caller = true;
+let pendingCandidates = [];
+let candidateTimer = null;
+const CANDIDATE_BATCH_WINDOW = 50; // ms to collect trickled ICE candidates
 
 // STUN configuration
 const configuration = {
     iceServers: [{ urls: "stun:stun.l.google.com:19302" }]
 };
 
+// -------------------------------
+// msgpack codec (subset used by the signaling protocol)
+// -------------------------------
+const msgpack = (() => {
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    function encode(value) {
+        const out = [];
+        write(value, out);
+        return new Uint8Array(out);
+    }
+
+    function pushUint(out, value, bytes) {
+        for (let i = bytes - 1; i >= 0; i--) {
+            out.push(Math.floor(value / 2 ** (8 * i)) & 0xff);
+        }
+    }
+
+    function pushLength(out, length, fix, fixMax, codes) {
+        if (fix !== null && length <= fixMax) out.push(fix | length);
+        else if (codes[0] !== null && length < 0x100) out.push(codes[0], length);
+        else if (length < 0x10000) { out.push(codes[1]); pushUint(out, length, 2); }
+        else { out.push(codes[2]); pushUint(out, length, 4); }
+    }
+
+    function write(value, out) {
+        if (value !== null && typeof value === 'object' && typeof value.toJSON === 'function') {
+            value = value.toJSON();
+        }
+        if (value === null || value === undefined) {
+            out.push(0xc0);
+        } else if (value === false) {
+            out.push(0xc2);
+        } else if (value === true) {
+            out.push(0xc3);
+        } else if (typeof value === 'number') {
+            if (Number.isInteger(value) && value >= 0 && value < 2 ** 32) {
+                if (value < 0x80) out.push(value);
+                else if (value < 0x100) out.push(0xcc, value);
+                else if (value < 0x10000) { out.push(0xcd); pushUint(out, value, 2); }
+                else { out.push(0xce); pushUint(out, value, 4); }
+            } else if (Number.isInteger(value) && value < 0 && value >= -(2 ** 31)) {
+                if (value >= -32) out.push(value & 0xff);
+                else if (value >= -128) out.push(0xd0, value & 0xff);
+                else if (value >= -32768) { out.push(0xd1); pushUint(out, value & 0xffff, 2); }
+                else { out.push(0xd2); pushUint(out, value >>> 0, 4); }
+            } else {
+                const view = new DataView(new ArrayBuffer(8));
+                view.setFloat64(0, value);
+                out.push(0xcb, ...new Uint8Array(view.buffer));
+            }
+        } else if (typeof value === 'string') {
+            const bytes = textEncoder.encode(value);
+            pushLength(out, bytes.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+            out.push(...bytes);
+        } else if (value instanceof Uint8Array) {
+            pushLength(out, value.length, null, 0, [0xc4, 0xc5, 0xc6]);
+            out.push(...value);
+        } else if (Array.isArray(value)) {
+            pushLength(out, value.length, 0x90, 15, [null, 0xdc, 0xdd]);
+            value.forEach(item => write(item, out));
+        } else {
+            const entries = Object.entries(value).filter(([, item]) => item !== undefined);
+            pushLength(out, entries.length, 0x80, 15, [null, 0xde, 0xdf]);
+            entries.forEach(([key, item]) => { write(key, out); write(item, out); });
+        }
+    }
+
+    function decode(buffer) {
+        const bytes = new Uint8Array(buffer);
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+
+        const take = (size, getter) => { const value = getter(offset); offset += size; return value; };
+        const u8 = () => take(1, o => view.getUint8(o));
+        const u16 = () => take(2, o => view.getUint16(o));
+        const u32 = () => take(4, o => view.getUint32(o));
+        const str = length => take(length, o => textDecoder.decode(bytes.subarray(o, o + length)));
+        const bin = length => take(length, o => bytes.slice(o, o + length));
+        const array = length => Array.from({ length }, () => read());
+        const map = length => {
+            const result = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                result[key] = read();
+            }
+            return result;
+        };
+
+        function read() {
+            const type = u8();
+            if (type < 0x80) return type;
+            if (type < 0x90) return map(type & 0x0f);
+            if (type < 0xa0) return array(type & 0x0f);
+            if (type < 0xc0) return str(type & 0x1f);
+            if (type >= 0xe0) return type - 0x100;
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(u8());
+                case 0xc5: return bin(u16());
+                case 0xc6: return bin(u32());
+                case 0xca: return take(4, o => view.getFloat32(o));
+                case 0xcb: return take(8, o => view.getFloat64(o));
+                case 0xcc: return u8();
+                case 0xcd: return u16();
+                case 0xce: return u32();
+                case 0xcf: return Number(take(8, o => view.getBigUint64(o)));
+                case 0xd0: return take(1, o => view.getInt8(o));
+                case 0xd1: return take(2, o => view.getInt16(o));
+                case 0xd2: return take(4, o => view.getInt32(o));
+                case 0xd3: return Number(take(8, o => view.getBigInt64(o)));
+                case 0xd9: return str(u8());
+                case 0xda: return str(u16());
+                case 0xdb: return str(u32());
+                case 0xdc: return array(u16());
+                case 0xdd: return array(u32());
+                case 0xde: return map(u16());
+                case 0xdf: return map(u32());
+            }
+            throw new Error('Unsupported msgpack type 0x' + type.toString(16));
+        }
+
+        return read();
+    }
+
+    return { encode, decode };
+})();
+
 // WebSocket connection
+// Offers the binary msgpack subprotocol; falls back to JSON text frames if the server declines it.
+const MSGPACK_SUBPROTOCOL = 'vc.msgpack';
 const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-const socket = new WebSocket(protocol + window.location.host + '/ws/video_call/');
+// Identifies this browser to the server so a call can be pinned to the device that answered it
+let deviceId = localStorage.getItem('videocall-device');
+if (!deviceId) {
+    deviceId = Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+    localStorage.setItem('videocall-device', deviceId);
+}
+// Signed, short-lived token that authenticates the websocket without a session lookup.
+// Refreshed at half its lifetime so a reconnect always has a valid one at hand.
+let wsToken = document.body.dataset.wsToken;
+const wsTokenTtl = Number(document.body.dataset.wsTokenTtl) || 600;
 
-socket.onopen = () => console.log("WebSocket connected ✅");
+async function refreshWsToken() {
+    try {
+        const response = await fetch('/ws-token/', { credentials: 'same-origin' });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        wsToken = (await response.json()).token;
+    } catch (err) {
+        console.error("Error refreshing connection token:", err);
+    }
+}
 
-socket.onclose = () => {
-    console.log("WebSocket disconnected");
-    if (inCall) endCall();
-};
+setInterval(refreshWsToken, wsTokenTtl * 500);
+
+// Resume state: the server numbers every frame ("seq") and, if the socket drops
+// mid-call, keeps the call for a few seconds so a new socket can take it over.
+let socket = null;
+let sessionId = null;
+let lastSeq = 0;
+let reconnectDelay = 500;
+
+function connectSocket(resume) {
+    let opened = false;
+    socket = new WebSocket(protocol + window.location.host + '/ws/video_call/?features=batch,resume&device=' + deviceId + '&token=' + encodeURIComponent(wsToken), [MSGPACK_SUBPROTOCOL]);
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => {
+        opened = true;
+        reconnectDelay = 500;
+        console.log("WebSocket connected ✅");
+        if (resume) {
+            socket.send(encodeFrame({ action: 'resume', session_id: resume, last_seq: lastSeq }));
+        }
+        subscribePresence(historyUsernames());
+    };
+    socket.onclose = async () => {
+        console.log("WebSocket disconnected");
+        // Presence subscriptions died with the socket.
+        for (const username in presenceStatus) delete presenceStatus[username];
+        // Once open, this socket got a session of its own.
+        const session = opened ? sessionId : resume;
+        if (!inCall || !session) {
+            if (inCall) endCall();
+            return;
+        }
+        infoText.innerHTML = "Reconnecting...";
+        // A socket that never opened may have been refused for an expired token.
+        if (!opened) await refreshWsToken();
+        setTimeout(() => connectSocket(session), reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 4000);
+    };
+    socket.onmessage = handleMessage;
+}
+
+function encodeFrame(msg) {
+    return socket.protocol === MSGPACK_SUBPROTOCOL ? msgpack.encode(msg) : JSON.stringify(msg);
+}
 
-socket.onmessage = async (event) => {
-    const message = JSON.parse(event.data);
+function decodeFrame(data) {
+    return typeof data === 'string' ? JSON.parse(data) : msgpack.decode(data);
+}
+
+async function handleMessage(event) {
+    const message = decodeFrame(event.data);
+    if (message.seq) lastSeq = message.seq;
 
     switch (message.action) {
+        case "session":
+            // A new sequence starts with every connection.
+            sessionId = message.session_id;
+            lastSeq = 0;
+            break;
+
+        case "resumed":
+            infoText.innerHTML = "Reconnected.";
+            if (message.gap && PC && is_caller) {
+                // Signaling was lost beyond the replay buffer: renegotiate.
+                const offer = await PC.createOffer({ iceRestart: true });
+                await PC.setLocalDescription(offer);
+                send_RTC_message({ sdp: PC.localDescription });
+            }
+            break;
+
+        case "peer_reconnecting":
+            infoText.innerHTML = "Peer is reconnecting...";
+            break;
+
+        case "peer_resumed":
+            infoText.innerHTML = "Peer reconnected.";
+            break;
+
         case "call_initiated":
             switch (message.status_code) {
                 case 404:
@@ -61,10 +283,6 @@ socket.onmessage = async (event) => {
             video_call_id = message.video_call_id;
             callerName.textContent = message.caller_username;
             incomingModal.style.display = 'flex';
-
-            setTimeout(() => {
-                if (!inCall) send_message({ action: 'cancel_call' });
-            }, 20000);
             break;
 
         case "call_started":
@@ -81,34 +299,71 @@ socket.onmessage = async (event) => {
 
         case "call_canceled":
             incomingModal.style.display = 'none';
+            video_call_id = 0;
             infoText.innerHTML = "Call canceled.";
             break;
 
+        case "call_answered_elsewhere":
+            incomingModal.style.display = 'none';
+            video_call_id = 0;
+            infoText.innerHTML = "Answered on another device.";
+            break;
+
+        case "call_missed":
+            incomingModal.style.display = 'none';
+            video_call_id = 0;
+            infoText.innerHTML = message.message;
+            break;
+
         case "error":
+            if (message.status_code === 410) endCall();
             infoText.innerHTML = message.message;
             break;
 
+        case "presence":
+            message.users.forEach(user => showPresence(user.username, user.status));
+            break;
+
         case "caller_data":
         case "receiver_data":
             if (message.sdp) {
-                console.log("📦 Received SDP");
-                await PC.setRemoteDescription(new RTCSessionDescription(message.sdp));
-                if (message.sdp.type === "offer") {
-                    const answer = await PC.createAnswer();
-                    await PC.setLocalDescription(answer);
-                    send_RTC_message({ sdp: PC.localDescription });
-                }
+                await handleRemoteSDP(message.sdp);
             } else if (message.candidate) {
-                console.log("📦 Received ICE Candidate");
-                try {
-                    await PC.addIceCandidate(new RTCIceCandidate(message.candidate));
-                } catch (err) {
-                    console.error("Error adding ICE candidate:", err);
-                }
+                await handleRemoteCandidate(message.candidate);
+            }
+            break;
+
+        case "candidates_batch":
+            if (message.sdp) {
+                await handleRemoteSDP(message.sdp);
+            }
+            for (const candidate of message.candidates) {
+                await handleRemoteCandidate(candidate);
             }
             break;
     }
-};
+}
+
+connectSocket(null);
+
+async function handleRemoteSDP(sdp) {
+    console.log("📦 Received SDP");
+    await PC.setRemoteDescription(new RTCSessionDescription(sdp));
+    if (sdp.type === "offer") {
+        const answer = await PC.createAnswer();
+        await PC.setLocalDescription(answer);
+        send_RTC_message({ sdp: PC.localDescription });
+    }
+}
+
+async function handleRemoteCandidate(candidate) {
+    console.log("📦 Received ICE Candidate");
+    try {
+        await PC.addIceCandidate(new RTCIceCandidate(candidate));
+    } catch (err) {
+        console.error("Error adding ICE candidate:", err);
+    }
+}
 
 // -------------------------------
 // Media handling
@@ -150,10 +405,11 @@ async function getMedia() {
 // -------------------------------
 // Call control functions
 // -------------------------------
-function ShowHistory(displayName, duration, datetime) {
+function ShowHistory(displayName, duration, datetime, append = false) {
             const div = document.createElement('div');
             div.className = 'history-item';
-            historyList.prepend(div);
+            if (append) historyList.append(div);
+            else historyList.prepend(div);
             var initials = displayName.split(' ').map(n => n[0]).join('').toUpperCase().slice(0, 2);
             div.innerHTML = `
                         <div class="history-avatar">${initials}</div>
@@ -162,9 +418,66 @@ function ShowHistory(displayName, duration, datetime) {
                             <p>Video call • ${duration} • ${datetime}</p>
                         </div>
                     `;
+            div.dataset.username = displayName;
             div.onclick = () => peerIdInput.value = displayName;
+            if (displayName in presenceStatus) showPresence(displayName, presenceStatus[displayName]);
         }
 
+// -------------------------------
+// Presence of the people in the call history
+// -------------------------------
+const presenceStatus = {};
+
+function historyUsernames() {
+    return [...new Set([...historyList.querySelectorAll('.history-item')].map(item => item.dataset.username))];
+}
+
+function subscribePresence(usernames) {
+    const unknown = usernames.filter(username => !(username in presenceStatus));
+    if (!unknown.length || socket.readyState !== WebSocket.OPEN) return;
+    unknown.forEach(username => presenceStatus[username] = 'offline');
+    socket.send(encodeFrame({ action: 'subscribe_presence', usernames: unknown }));
+}
+
+function showPresence(username, status) {
+    presenceStatus[username] = status;
+    historyList.querySelectorAll('.history-item').forEach(item => {
+        if (item.dataset.username !== username) return;
+        const avatar = item.querySelector('.history-avatar');
+        avatar.classList.toggle('online', status === 'online');
+        avatar.classList.toggle('busy', status === 'busy');
+    });
+}
+
+// Older history pages are fetched from /history/ as the list is scrolled
+let historyCursor = historyList.dataset.nextCursor || null;
+let historyLoading = false;
+
+async function loadMoreHistory() {
+    if (!historyCursor || historyLoading) return;
+    historyLoading = true;
+    try {
+        const response = await fetch('/history/?cursor=' + encodeURIComponent(historyCursor), {
+            credentials: 'same-origin'
+        });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        const page = await response.json();
+        page.calls.forEach(call => ShowHistory(call.username, call.duration, call.time, true));
+        historyCursor = page.next_cursor;
+        subscribePresence(historyUsernames());
+    } catch (err) {
+        console.error("Error loading call history:", err);
+    } finally {
+        historyLoading = false;
+    }
+}
+
+historyList.addEventListener('scroll', () => {
+    if (historyList.scrollTop + historyList.clientHeight >= historyList.scrollHeight - 100) {
+        loadMoreHistory();
+    }
+});
+
 function endCall() {
     if (PC) {
         PC.close();
@@ -177,6 +490,9 @@ function endCall() {
 
     video_call_id = 0;
     is_caller = true;
+    clearTimeout(candidateTimer);
+    candidateTimer = null;
+    pendingCandidates = [];
 }
 
 
@@ -239,7 +555,7 @@ async function StartWebRTC() {
     // Ice candidates
     PC.onicecandidate = (e) => {
         if (e.candidate) {
-            send_RTC_message({ candidate: e.candidate });
+            queue_candidate(e.candidate);
         }
     };
 
@@ -273,11 +589,30 @@ async function StartWebRTC() {
 // -------------------------------
 function send_message(msg) {
     msg.video_call_id = video_call_id;
-    socket.send(JSON.stringify(msg));
+    socket.send(encodeFrame(msg));
 }
 
 function send_RTC_message(msg) {
     msg.action = is_caller ? "caller_data" : "receiver_data";
     msg.video_call_id = video_call_id;
-    socket.send(JSON.stringify(msg));
+    socket.send(encodeFrame(msg));
+}
+
+// Trickled candidates are collected briefly and sent as one candidates_batch frame
+function queue_candidate(candidate) {
+    pendingCandidates.push(candidate);
+    if (!candidateTimer) {
+        candidateTimer = setTimeout(flush_candidates, CANDIDATE_BATCH_WINDOW);
+    }
+}
+
+function flush_candidates() {
+    candidateTimer = null;
+    if (!pendingCandidates.length) return;
+    socket.send(encodeFrame({
+        action: "candidates_batch",
+        video_call_id: video_call_id,
+        candidates: pendingCandidates
+    }));
+    pendingCandidates = [];
 }
\ No newline at end of file
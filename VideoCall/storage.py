@@ -0,0 +1,62 @@
+"""
+Static files storage that precompresses what collectstatic writes.
+
+On top of ManifestStaticFilesStorage (content-hashed copies such as
+``main.3f2a9c1d04e7.js`` and the staticfiles.json manifest), every text
+asset gets a ``.gz`` sibling and, when the optional ``brotli`` package is
+installed, a ``.br`` one. StaticAssetsMiddleware (assets.py) picks the
+variant matching the request's Accept-Encoding, so nothing is compressed
+per request.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE = (".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml")
+# Below this size the compressed file and its headers save nothing worth a lookup.
+MIN_SIZE = 512
+
+
+def compressors():
+    """``(suffix, compress)`` for each precompressed variant that can be made."""
+    yield ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield ".br", lambda data: brotli.compress(data, quality=brotli.MAX_QUALITY)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = {*paths, *self.hashed_files.values()}
+        for name in sorted(names):
+            for compressed_name in self.compress(name):
+                yield name, compressed_name, True
+
+    def compress(self, name):
+        """Write the compressed variants of ``name`` that come out smaller; returns their names."""
+        if not name.endswith(COMPRESSIBLE) or not self.exists(name):
+            return []
+        with self.open(name) as original:
+            data = original.read()
+        written = []
+        for suffix, compress in compressors():
+            compressed_name = name + suffix
+            # A variant left from an earlier collectstatic would be stale.
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            if len(data) < MIN_SIZE:
+                continue
+            compressed = compress(data)
+            if len(compressed) < len(data) * 0.95:
+                self._save(compressed_name, ContentFile(compressed))
+                written.append(compressed_name)
+        return written
@@ -0,0 +1,53 @@
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+
+from .. import journal, presence
+from ..consumers import VideoCallConsumer
+from ..ringing import get_ring_scheduler
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    VIDEO_CALL_PRESENCE={'BACKEND': 'VideoCall.presence.InMemoryPresence'},
+    # Run the consumer's queries on the test's thread, inside its transaction.
+    VIDEO_CALL_DB_THREADS=0,
+    VIDEO_CALL_RELAY_WINDOW=0,
+    VIDEO_CALL_WRITE_BEHIND=False,
+)
+class ConsumerTestCase(TestCase):
+    """Drives VideoCallConsumer over an in-memory channel layer and presence."""
+
+    def setUp(self):
+        presence._presence = None
+        journal._journal = None
+
+    async def connect(self, user, path='/ws/video_call/', subprotocols=None):
+        communicator = WebsocketCommunicator(VideoCallConsumer.as_asgi(), path, subprotocols=subprotocols)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def disconnect(self, *communicators):
+        for communicator in communicators:
+            await communicator.disconnect()
+        # Initiating a call starts the ring timeout task on this test's event loop.
+        await get_ring_scheduler().stop()
+        if journal._journal is not None:
+            await journal._journal.stop()
+
+    async def expect(self, communicator, action):
+        """The next frame with ``action``, skipping presence and other updates."""
+        while True:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame.get('action') == action:
+                return frame
+
+    async def call(self, caller, receiver, receiver_username):
+        await caller.send_json_to({'action': 'initiate_call', 'receiver_username': receiver_username})
+        call_id = (await self.expect(caller, 'call_initiated'))['video_call_id']
+        await self.expect(receiver, 'incoming_call')
+        await receiver.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+        await self.expect(receiver, 'call_started')
+        await self.expect(caller, 'call_started')
+        return call_id
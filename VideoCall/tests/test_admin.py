@@ -0,0 +1,53 @@
+from datetime import date, datetime, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..analytics import rollup
+from ..models import User, VideoCall
+
+
+class AdminPageTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def call(self, status, start, seconds=None):
+        call = VideoCall.objects.create(caller=self.alice, receiver=self.bob, status=status)
+        VideoCall.objects.filter(pk=call.pk).update(
+            call_start_time=start, call_end_time=None if seconds is None else start + timedelta(seconds=seconds))
+
+    def queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_call_list(self):
+        start = timezone.now() - timedelta(hours=1)
+        self.call(VideoCall.ENDED, start, 90)
+        response, few = self.queries('/admin/VideoCall/videocall/')
+        # The duration comes from the database, with the page's rows.
+        self.assertContains(response, '0:01:30')
+        self.assertEqual(list(response.context['cl'].result_list)[0].duration_value, timedelta(seconds=90))
+
+        for offset in range(10):
+            self.call(VideoCall.CONNECTED if offset % 2 else VideoCall.ENDED, start + timedelta(minutes=offset), 60)
+        self.assertEqual(self.queries('/admin/VideoCall/videocall/')[1], few)
+
+    def test_call_list_has_no_date_filter(self):
+        response, _ = self.queries('/admin/VideoCall/videocall/')
+        self.assertEqual([spec.title for spec in response.context['cl'].filter_specs], ['status'])
+
+    def test_stats_pages(self):
+        day = date(2024, 3, 1)
+        self.call(VideoCall.ENDED, timezone.make_aware(datetime(2024, 3, 1, 9)), 60)
+        rollup(day, day)
+        # One row for the day, one per participant for the per-user page.
+        for path, rows in (('/admin/VideoCall/dailycallstats/', 1), ('/admin/VideoCall/userdailycallstats/', 2)):
+            response, _ = self.queries(path + '?day__gte=2024-03-01')
+            self.assertEqual(response.context['cl'].result_count, rows)
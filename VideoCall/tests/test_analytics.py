@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+
+from django.test import TestCase
+
+from ..analytics import day_start, rollup
+from ..models import DailyCallStats, User, UserDailyCallStats, VideoCall
+
+DAY = date(2026, 3, 2)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def call(self, caller, receiver, status, start, seconds=None):
+        call = VideoCall.objects.create(caller=caller, receiver=receiver, status=status)
+        # call_start_time is auto_now_add.
+        VideoCall.objects.filter(pk=call.pk).update(
+            call_start_time=start, call_end_time=None if seconds is None else start + timedelta(seconds=seconds))
+
+    def test_rollup(self):
+        morning = day_start(DAY) + timedelta(hours=9)
+        self.call(self.alice, self.bob, VideoCall.ENDED, morning, 60)
+        self.call(self.alice, self.bob, VideoCall.ENDED, morning + timedelta(hours=1), 120)
+        self.call(self.bob, self.alice, VideoCall.ENDED, morning + timedelta(hours=2), 30)
+        self.call(self.alice, self.bob, VideoCall.MISSED, morning + timedelta(hours=3), 30)
+        self.call(self.alice, self.bob, VideoCall.RINGING, morning + timedelta(hours=4))
+        self.call(self.bob, self.alice, VideoCall.ENDED, morning + timedelta(days=1), 10)
+
+        self.assertEqual(rollup(DAY, DAY + timedelta(days=2)), (3, 4))
+        # Again: the days are replaced, not added to.
+        self.assertEqual(rollup(DAY, DAY + timedelta(days=2)), (3, 4))
+
+        stats = {row.day: row for row in DailyCallStats.objects.all()}
+        first, second, empty = (stats[DAY + timedelta(days=offset)] for offset in range(3))
+        self.assertEqual((first.calls, first.ended, first.missed), (4, 3, 1))
+        self.assertAlmostEqual(first.total_seconds, 210, places=1)
+        self.assertAlmostEqual(first.p95_seconds, 120, places=1)
+        self.assertEqual((second.calls, second.ended, second.missed), (1, 1, 0))
+        self.assertAlmostEqual(second.p95_seconds, 10, places=1)
+        self.assertEqual((empty.calls, empty.p95_seconds), (0, None))
+
+        users = {(row.day, row.user.username): row for row in UserDailyCallStats.objects.select_related('user')}
+        self.assertEqual(len(users), 4)
+        alice, bob = users[DAY, 'alice'], users[DAY, 'bob']
+        self.assertEqual((alice.calls_made, alice.calls_received, alice.missed), (3, 1, 0))
+        self.assertEqual((bob.calls_made, bob.calls_received, bob.missed), (1, 3, 1))
+        self.assertAlmostEqual(alice.total_seconds, 210, places=1)
+        self.assertAlmostEqual(bob.p95_seconds, 120, places=1)
+        self.assertEqual(users[DAY + timedelta(days=1), 'alice'].calls_received, 1)
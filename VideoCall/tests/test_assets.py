@@ -0,0 +1,82 @@
+import tempfile
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from ..assets import IMMUTABLE, StaticAssetsMiddleware, accepted_encodings
+
+
+class CollectedAssetsTests(SimpleTestCase):
+    """collectstatic with the hashed, precompressed storage, then StaticAssetsMiddleware serving the result."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(STATIC_ROOT=root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'VideoCall.storage.CompressedManifestStaticFilesStorage'},
+        }))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.hashed = staticfiles_storage.url('VideoCall/js/main.js')
+
+    async def fetch(self, path, method='GET', **headers):
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'headers': [(name.encode(), value.encode()) for name, value in headers.items()]}
+        await StaticAssetsMiddleware(app)(scope, None, send)
+        start, *bodies = messages
+        return start['status'], dict(start['headers']), b''.join(body['body'] for body in bodies)
+
+    def test_collectstatic_writes_hashed_and_compressed_copies(self):
+        name = self.hashed.removeprefix('/static/')
+        self.assertRegex(name, r'^VideoCall/js/main\.[0-9a-f]{12}\.js$')
+        for suffix in ('', '.gz'):
+            self.assertTrue(staticfiles_storage.exists(name + suffix))
+
+    async def test_hashed_names_are_immutable(self):
+        status, headers, body = await self.fetch(self.hashed)
+        self.assertEqual((status, headers[b'cache-control']), (200, IMMUTABLE))
+        self.assertEqual(headers[b'content-type'], b'text/javascript; charset=utf-8')
+        self.assertNotIn(b'content-encoding', headers)
+        self.assertEqual(int(headers[b'content-length']), len(body))
+        status, headers, _ = await self.fetch('/static/VideoCall/js/main.js')
+        self.assertEqual((status, headers[b'cache-control']), (200, b'public, max-age=60'))
+
+    async def test_compressed_variant(self):
+        status, headers, body = await self.fetch(self.hashed, **{'accept-encoding': 'gzip, deflate'})
+        self.assertEqual((status, headers[b'content-encoding'], headers[b'vary']), (200, b'gzip', b'Accept-Encoding'))
+        self.assertEqual(body[:2], b'\x1f\x8b')
+        status, headers, _ = await self.fetch(self.hashed, **{'accept-encoding': 'gzip;q=0'})
+        self.assertNotIn(b'content-encoding', headers)
+
+    async def test_conditional_and_head_requests(self):
+        _, headers, _ = await self.fetch(self.hashed)
+        status, _, body = await self.fetch(self.hashed, **{'if-none-match': headers[b'etag'].decode()})
+        self.assertEqual((status, body), (304, b''))
+        status, headers, body = await self.fetch(self.hashed, method='HEAD')
+        self.assertEqual((status, body), (200, b''))
+        self.assertGreater(int(headers[b'content-length']), 0)
+
+    async def test_other_paths_reach_django(self):
+        for path in ('/static/VideoCall/js/missing.js', '/login/'):
+            with self.subTest(path=path):
+                self.assertEqual(await self.fetch(path), (404, {}, b'django'))
+        self.assertEqual((await self.fetch(self.hashed, method='POST'))[0], 404)
+
+
+class AcceptEncodingTests(SimpleTestCase):
+
+    def test_accepted_encodings(self):
+        scope = {'headers': [(b'accept-encoding', b'br;q=0, GZIP;q=0.5, identity')]}
+        self.assertEqual(accepted_encodings(scope), {'gzip', 'identity'})
+        self.assertEqual(accepted_encodings({'headers': []}), set())
@@ -0,0 +1,28 @@
+from django.test import SimpleTestCase
+
+from ..cache import CallMembershipCache, normalize_call_id
+
+
+class NormalizeCallIdTests(SimpleTestCase):
+
+    def test_accepted(self):
+        for call_id, expected in ((7, 7), ('7', 7), ('0042', 42), (2 ** 63 - 1, 2 ** 63 - 1)):
+            with self.subTest(call_id=call_id):
+                self.assertEqual(normalize_call_id(call_id), expected)
+
+    def test_rejected(self):
+        for call_id in (True, False, 0, -3, '-3', '+3', ' 3', '3.0', 3.0, 3.7, '٣', '²', '', '9' * 20, 2 ** 63,
+                        None, [3], {'id': 3}, b'3'):
+            with self.subTest(call_id=call_id):
+                self.assertIsNone(normalize_call_id(call_id))
+
+
+class CallMembershipCacheTests(SimpleTestCase):
+
+    def test_keys_are_normalized(self):
+        calls = CallMembershipCache()
+        calls.set('7', 1, 2, 'RINGING')
+        self.assertEqual(calls.get(7), (1, 2, 'RINGING'))
+        self.assertIn(7, calls)
+        calls.discard('7')
+        self.assertIsNone(calls.get(7))
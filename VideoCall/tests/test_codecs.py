@@ -0,0 +1,30 @@
+import msgpack
+from django.test import SimpleTestCase
+
+from ..codecs import CodecError, MSGPACK_SUBPROTOCOL, json_codec, msgpack_codec, select_codec
+
+
+class CodecTests(SimpleTestCase):
+
+    def test_select_codec(self):
+        self.assertIs(select_codec(None), json_codec)
+        self.assertIs(select_codec(['other', MSGPACK_SUBPROTOCOL]), msgpack_codec)
+
+    def test_round_trip(self):
+        payload = {'action': 'end_call', 'video_call_id': 7}
+        for codec in (json_codec, msgpack_codec):
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.decode(codec.encode(payload)), payload)
+
+    def test_bad_json_frame(self):
+        for body in ('{"action": ', 'not json', '{"a": 1} trailing'):
+            with self.subTest(body=body), self.assertRaises(CodecError):
+                json_codec.decode({'text': body})
+
+    def test_bad_msgpack_frame(self):
+        for body in (b'\xc1', b'\x92\x01', msgpack.packb({1: 2}), msgpack.packb({}) + b'\x01'):
+            with self.subTest(body=body), self.assertRaises(CodecError):
+                msgpack_codec.decode({'bytes': body})
+
+    def test_codec_error_is_a_value_error(self):
+        self.assertTrue(issubclass(CodecError, ValueError))
@@ -0,0 +1,151 @@
+import tempfile
+
+import msgpack
+
+from django.test import override_settings
+
+from ..codecs import MSGPACK_SUBPROTOCOL
+from ..models import User, VideoCall
+from .helpers import ConsumerTestCase
+
+
+class VideoCallConsumerTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+
+    async def test_call_lifecycle(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+            initiated = await self.expect(alice, 'call_initiated')
+            self.assertEqual(initiated['status_code'], 201)
+            call_id = initiated['video_call_id']
+            incoming = await self.expect(bob, 'incoming_call')
+            self.assertEqual((incoming['video_call_id'], incoming['caller_username']), (call_id, 'alice'))
+
+            await bob.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+            self.assertEqual((await self.expect(bob, 'call_started'))['video_call_id'], call_id)
+            self.assertEqual((await self.expect(alice, 'call_started'))['video_call_id'], call_id)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.CONNECTED)
+
+            candidate = {'candidate': 'candidate:1 1 udp 2122260223 10.0.0.1 50000 typ host', 'sdpMid': '0'}
+            await alice.send_json_to({'action': 'caller_data', 'video_call_id': call_id, 'candidate': candidate})
+            # The receiver gets the caller's candidates as "receiver_data".
+            relayed = await self.expect(bob, 'receiver_data')
+            self.assertEqual((relayed['video_call_id'], relayed['candidate']), (call_id, candidate))
+
+            await bob.send_json_to({'action': 'end_call', 'video_call_id': call_id})
+            self.assertEqual((await self.expect(bob, 'call_ended'))['status_code'], 200)
+            self.assertEqual((await self.expect(alice, 'call_ended'))['video_call_id'], call_id)
+            call = await VideoCall.objects.aget(pk=call_id)
+            self.assertEqual(call.status, VideoCall.ENDED)
+            self.assertIsNotNone(call.call_end_time)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_error_frames(self):
+        alice, bob, carol = await self.connect(self.alice), await self.connect(self.bob), await self.connect(self.carol)
+        try:
+            await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'nobody'})
+            self.assertEqual(await self.expect(alice, 'error'),
+                             {'action': 'error', 'status_code': 404, 'message': 'User not found'})
+            await bob.send_json_to({'action': 'start_call', 'video_call_id': 10 ** 6})
+            self.assertEqual((await self.expect(bob, 'error'))['message'], 'Video call not found')
+
+            call_id = await self.call(alice, bob, 'bob')
+            await carol.send_json_to({'action': 'end_call', 'video_call_id': call_id})
+            self.assertEqual(await self.expect(carol, 'error'),
+                             {'action': 'error', 'status_code': 403, 'message': 'Permission denied'})
+            await bob.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+            self.assertEqual((await self.expect(bob, 'error'))['status_code'], 409)
+            await carol.send_json_to({'action': 'initiate_call', 'receiver_username': 'alice'})
+            self.assertEqual(await self.expect(carol, 'error'),
+                             {'action': 'error', 'status_code': 409, 'message': 'User already in another call'})
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.CONNECTED)
+        finally:
+            await self.disconnect(alice, bob, carol)
+
+    async def test_malformed_call_ids(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            call_id = await self.call(alice, bob, 'bob')
+            for malformed in (True, float(call_id), f'{call_id}.0', f' {call_id}', [call_id], {'id': call_id}):
+                with self.subTest(video_call_id=malformed):
+                    await alice.send_json_to({'action': 'end_call', 'video_call_id': malformed})
+                    self.assertEqual(await self.expect(alice, 'error'),
+                                     {'action': 'error', 'status_code': 400, 'message': 'Video call ID required'})
+            await alice.send_json_to({'action': 'end_call', 'video_call_id': str(call_id)})
+            self.assertEqual((await self.expect(bob, 'call_ended'))['video_call_id'], call_id)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def rejects_invalid_status(self, written=True):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            call_id = await self.call(alice, bob, 'bob')
+            for status in ('HELD', ['ENDED'], {'status': 'ENDED'}, 3):
+                with self.subTest(status=status):
+                    await alice.send_json_to({'action': 'change_status', 'video_call_id': call_id, 'status': status})
+                    self.assertEqual(await self.expect(alice, 'error'),
+                                     {'action': 'error', 'status_code': 400, 'message': 'Unknown call status'})
+            if written:
+                self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.CONNECTED)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_invalid_status(self):
+        await self.rejects_invalid_status()
+
+    async def test_invalid_status_write_behind(self):
+        # Decided from the cached call state by the journal instead of the database.
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(VIDEO_CALL_WRITE_BEHIND=True, VIDEO_CALL_JOURNAL_DIR=directory):
+                # start_call is still in the journal, not the database.
+                await self.rejects_invalid_status(written=False)
+
+    async def test_invalid_frames(self):
+        invalid = {'action': 'error', 'status_code': 400, 'message': 'Invalid message'}
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob, subprotocols=[MSGPACK_SUBPROTOCOL])
+        try:
+            for text in ('{"action": ', '[1, 2]', '"end_call"', '{"action": "ping"}'):
+                with self.subTest(text=text):
+                    await alice.send_to(text_data=text)
+                    self.assertEqual(await self.expect(alice, 'error'), invalid)
+            for body in (b'\xc1', msgpack.packb([1, 2]), msgpack.packb({'action': 'ping'})):
+                with self.subTest(body=body):
+                    await bob.send_to(bytes_data=body)
+                    self.assertEqual(msgpack.unpackb(await bob.receive_from(timeout=5)), invalid)
+            # The connection is still usable.
+            await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'nobody'})
+            self.assertEqual((await self.expect(alice, 'error'))['status_code'], 404)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_disconnect_while_ringing_marks_call_missed(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+            call_id = (await self.expect(alice, 'call_initiated'))['video_call_id']
+            await self.expect(bob, 'incoming_call')
+            await alice.disconnect()
+            await self.expect(bob, 'disconnected')
+            call = await VideoCall.objects.aget(pk=call_id)
+            self.assertEqual(call.status, VideoCall.MISSED)
+            self.assertIsNotNone(call.call_end_time)
+        finally:
+            await self.disconnect(bob)
+
+    async def test_disconnect_during_call_ends_it(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            call_id = await self.call(alice, bob, 'bob')
+            await bob.disconnect()
+            await self.expect(alice, 'disconnected')
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.ENDED)
+        finally:
+            await self.disconnect(alice)
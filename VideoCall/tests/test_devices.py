@@ -0,0 +1,65 @@
+from ..models import User, VideoCall
+from .helpers import ConsumerTestCase
+
+CANDIDATE = {'candidate': 'candidate:1 1 udp 2122260223 10.0.0.1 50000 typ host', 'sdpMid': '0'}
+
+
+class MultiDeviceTests(ConsumerTestCase):
+    """A user signed in on two devices: a call is pinned to the one that initiated or answered it."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    async def answered_on_b1(self):
+        alice, b1, b2 = await self.connect(self.alice), await self.connect(self.bob), await self.connect(self.bob)
+        await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+        call_id = (await self.expect(alice, 'call_initiated'))['video_call_id']
+        await self.expect(b1, 'incoming_call')
+        await self.expect(b2, 'incoming_call')
+        await b1.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+        await self.expect(b1, 'call_started')
+        await self.expect(alice, 'call_started')
+        await self.expect(b2, 'call_answered_elsewhere')
+        return call_id, alice, b1, b2
+
+    async def test_relay_from_other_device_is_denied(self):
+        call_id, alice, b1, b2 = await self.answered_on_b1()
+        try:
+            await b2.send_json_to({'action': 'receiver_data', 'video_call_id': call_id, 'candidate': CANDIDATE})
+            self.assertEqual(await self.expect(b2, 'error'),
+                             {'action': 'error', 'status_code': 403, 'message': 'Permission denied'})
+            await b1.send_json_to({'action': 'receiver_data', 'video_call_id': call_id, 'candidate': CANDIDATE})
+            self.assertEqual((await self.expect(alice, 'caller_data'))['candidate'], CANDIDATE)
+            # The caller's relays reach the answering device only.
+            await alice.send_json_to({'action': 'caller_data', 'video_call_id': call_id, 'candidate': CANDIDATE})
+            self.assertEqual((await self.expect(b1, 'receiver_data'))['candidate'], CANDIDATE)
+            self.assertTrue(await b2.receive_nothing(timeout=0.1))
+        finally:
+            await self.disconnect(alice, b1, b2)
+
+    async def test_end_call_from_other_device_reaches_the_pinned_one(self):
+        call_id, alice, b1, b2 = await self.answered_on_b1()
+        try:
+            await b2.send_json_to({'action': 'end_call', 'video_call_id': call_id})
+            self.assertEqual((await self.expect(b2, 'call_ended'))['status_code'], 200)
+            self.assertEqual((await self.expect(alice, 'call_ended'))['video_call_id'], call_id)
+            self.assertEqual((await self.expect(b1, 'call_ended'))['video_call_id'], call_id)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.ENDED)
+        finally:
+            await self.disconnect(alice, b1, b2)
+
+    async def test_cancel_from_other_caller_device_reaches_the_ringing_one(self):
+        a1, a2, bob = await self.connect(self.alice), await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await a1.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+            call_id = (await self.expect(a1, 'call_initiated'))['video_call_id']
+            await self.expect(bob, 'incoming_call')
+            await a2.send_json_to({'action': 'cancel_call', 'video_call_id': call_id})
+            self.assertEqual((await self.expect(a2, 'call_canceled'))['status_code'], 200)
+            self.assertEqual((await self.expect(bob, 'call_canceled'))['video_call_id'], call_id)
+            self.assertEqual((await self.expect(a1, 'call_canceled'))['video_call_id'], call_id)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.MISSED)
+        finally:
+            await self.disconnect(a1, a2, bob)
@@ -0,0 +1,39 @@
+from django.test import TestCase, override_settings
+
+from ..history import MAX_PK, decode_cursor, encode_cursor
+from ..models import User, VideoCall
+
+
+@override_settings(VIDEO_CALL_HISTORY_PAGE_SIZE=2)
+class CallHistoryTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.calls = [
+            VideoCall.objects.create(caller=self.alice, receiver=self.bob, status=VideoCall.ENDED) for _ in range(3)
+        ]
+
+    def test_cursor_round_trip(self):
+        call = VideoCall.objects.get(pk=self.calls[0].pk)
+        self.assertEqual(decode_cursor(encode_cursor(call)), (call.call_start_time, call.pk))
+
+    def test_malformed_cursors(self):
+        for cursor in (None, '', 'abc', '1_2_3', '12', '1.5_2', f'{10 ** 30}_1', f'1_{MAX_PK + 1}', '1_0', '1_-4'):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+    def test_pages(self):
+        self.client.force_login(self.alice)
+        first = self.client.get('/history/').json()
+        self.assertEqual([call['id'] for call in first['calls']], [self.calls[2].pk, self.calls[1].pk])
+        second = self.client.get('/history/', {'cursor': first['next_cursor']}).json()
+        self.assertEqual([call['id'] for call in second['calls']], [self.calls[0].pk])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.alice)
+        for cursor in ('garbage', f'{10 ** 30}_1', f'1_{MAX_PK + 1}'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/history/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
@@ -0,0 +1,65 @@
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ..journal import CallJournal, JournalEvent, Segment, apply_events
+from ..models import User, VideoCall
+
+
+@override_settings(VIDEO_CALL_DB_THREADS=0)
+class CallJournalTests(TestCase):
+
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    async def new_call(self):
+        return (await VideoCall.objects.acreate(caller=self.alice, receiver=self.bob)).pk
+
+    async def status(self, pk):
+        return (await VideoCall.objects.aget(pk=pk)).status
+
+    async def test_flush_on_stop(self):
+        call_id = await self.new_call()
+        journal = CallJournal(self.directory, flush_interval=60)
+        journal.record(call_id, VideoCall.CONNECTED, timezone.now())
+        self.assertTrue(journal.has_pending(call_id))
+        self.assertEqual(await self.status(call_id), VideoCall.RINGING)
+        await journal.stop()
+        self.assertEqual(await self.status(call_id), VideoCall.CONNECTED)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    async def test_replay_after_a_crash(self):
+        connected, missed = await self.new_call(), await self.new_call()
+        ended_at = timezone.now()
+        # A worker that crashed: its segment is on disk, unlocked, never flushed.
+        crashed = Segment(self.directory / 'journal-1-dead.1.log')
+        crashed.append(JournalEvent(connected, VideoCall.CONNECTED, ended_at))
+        crashed.append(JournalEvent(connected, VideoCall.ENDED, ended_at))
+        crashed.append(JournalEvent(missed, VideoCall.MISSED, ended_at))
+        crashed.file.write('[1, "END')  # cut short mid-write
+        crashed.file.close()
+        # A live worker's segment stays where it is.
+        live = Segment(self.directory / 'journal-2-live.1.log')
+        live.append(JournalEvent(missed, VideoCall.ENDED, ended_at))
+
+        with self.assertLogs('VideoCall.journal', 'WARNING') as logs:
+            await CallJournal(self.directory).replay()
+        self.assertIn('Skipping unreadable journal line', logs.output[0])
+        self.assertIn('3 events, 3 applied', logs.output[1])
+        call = await VideoCall.objects.aget(pk=connected)
+        self.assertEqual((call.status, call.call_end_time), (VideoCall.ENDED, ended_at))
+        self.assertEqual(await self.status(missed), VideoCall.MISSED)
+        self.assertEqual([path.name for path in self.directory.iterdir()], ['journal-2-live.1.log'])
+        live.delete()
+
+    def test_replay_is_idempotent(self):
+        call_id = VideoCall.objects.create(caller=self.alice, receiver=self.bob).pk
+        now = timezone.now()
+        events = [JournalEvent(call_id, VideoCall.CONNECTED, now), JournalEvent(call_id, VideoCall.ENDED, now)]
+        self.assertEqual(apply_events(events), 2)
+        self.assertEqual(apply_events(events), 0)
+        self.assertEqual(VideoCall.objects.get(pk=call_id).status, VideoCall.ENDED)
@@ -0,0 +1,70 @@
+import asyncio
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from ..layers import HashRing, HybridChannelLayer
+
+
+class HybridChannelLayerTests(SimpleTestCase):
+    """Two workers sharing one in-memory layer that stands in for Redis."""
+
+    def setUp(self):
+        self.redis = InMemoryChannelLayer()
+        self.workers = [HybridChannelLayer(remote=lambda **config: self.redis) for _ in range(2)]
+
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), timeout=1)
+
+    async def test_local_send_skips_redis(self):
+        layer = self.workers[0]
+        channel = await layer.new_channel()
+        await layer.send(channel, {'type': 'chat.message', 'n': 1})
+        self.assertEqual(self.redis.channels, {})
+        self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message', 'n': 1})
+
+    async def test_remote_send_reaches_the_owning_worker(self):
+        first, second = self.workers
+        channel = await second.new_channel()
+        await first.send(channel, {'type': 'chat.message', 'n': 1})
+        self.assertEqual(list(self.redis.channels), [second.process_channel])
+        self.assertEqual(await self.receive(second, channel), {'type': 'chat.message', 'n': 1})
+
+    async def test_other_channels_go_through_redis(self):
+        await self.workers[0].send('plain.channel', {'type': 'chat.message'})
+        self.assertEqual(await self.receive(self.redis, 'plain.channel'), {'type': 'chat.message'})
+
+    async def test_group_send_reaches_every_worker_once(self):
+        first, second = self.workers
+        local, other, remote = await first.new_channel(), await first.new_channel(), await second.new_channel()
+        for layer, channel in ((first, local), (first, other), (second, remote)):
+            await layer.group_add('videocall_1', channel)
+        # One remote member per worker, not per channel.
+        self.assertEqual(set(self.redis.groups['videocall_1']), {first.process_channel, second.process_channel})
+
+        await first.group_send('videocall_1', {'type': 'chat.message'})
+        for layer, channel in ((first, local), (first, other), (second, remote)):
+            self.assertEqual(await self.receive(layer, channel), {'type': 'chat.message'})
+        # The worker that sent it ignores its own copy coming back from Redis.
+        await asyncio.sleep(0.05)
+        self.assertTrue(first.channels.get(local) is None or first.channels[local].empty())
+
+        await first.group_discard('videocall_1', local)
+        await first.group_discard('videocall_1', other)
+        self.assertEqual(set(self.redis.groups['videocall_1']), {second.process_channel})
+
+    async def test_group_add_needs_a_local_channel(self):
+        first, second = self.workers
+        with self.assertRaises(ValueError):
+            await first.group_add('videocall_1', await second.new_channel())
+
+
+class HashRingTests(SimpleTestCase):
+
+    def test_adding_a_node_moves_few_names(self):
+        names = [f'videocall_{i}' for i in range(2000)]
+        before, after = HashRing(['a', 'b', 'c']), HashRing(['a', 'b', 'c', 'd'])
+        moved = [name for name in names if before.index(name) != after.index(name)]
+        # About a quarter, all of them to the new node.
+        self.assertLess(len(moved), len(names) * 0.4)
+        self.assertEqual({after.index(name) for name in moved}, {3})
@@ -0,0 +1,44 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
+from django.test import SimpleTestCase, override_settings
+
+from .. import passwords
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], VIDEO_CALL_HASHER_PROCESSES=1)
+class HasherPoolTests(SimpleTestCase):
+
+    def tearDown(self):
+        if passwords._pool is not None:
+            passwords._pool.shutdown()
+            passwords._pool = None
+
+    async def broken_pool(self):
+        pool = passwords.get_hasher_pool()
+        with self.assertRaises(BrokenProcessPool):
+            await asyncio.get_running_loop().run_in_executor(pool, os._exit, 1)
+        return pool
+
+    async def test_round_trip(self):
+        encoded = await passwords.amake_password('s3cret')
+        self.assertTrue(check_password('s3cret', encoded))
+        self.assertEqual(await passwords.averify_password('s3cret', encoded), (True, False))
+        self.assertEqual(await passwords.averify_password('wrong', encoded), (False, False))
+
+    def test_processes_are_not_forked(self):
+        self.assertIn(passwords.get_hasher_pool()._mp_context.get_start_method(), ('forkserver', 'spawn'))
+
+    async def test_broken_pool_is_replaced(self):
+        broken = await self.broken_pool()
+        self.assertTrue(check_password('s3cret', await passwords.amake_password('s3cret')))
+        self.assertIsNot(passwords.get_hasher_pool(), broken)
+
+    async def test_hashes_on_a_thread_when_pools_keep_breaking(self):
+        broken = await self.broken_pool()
+        with mock.patch.object(passwords, 'get_hasher_pool', return_value=broken):
+            encoded = await passwords.amake_password('s3cret')
+        self.assertTrue(check_password('s3cret', encoded))
@@ -0,0 +1,73 @@
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from ..presence import BUSY, OFFLINE, ONLINE, InMemoryPresence, RedisPresence
+
+try:
+    import fakeredis
+    import lupa
+except ImportError:  # pip install fakeredis lupa
+    fakeredis = lupa = None
+
+
+class InMemoryPresenceTests(SimpleTestCase):
+
+    async def test_connections_and_busy(self):
+        presence = InMemoryPresence()
+        self.assertTrue(await presence.connect(1))
+        self.assertFalse(await presence.connect(1))
+        await presence.set_busy(1, 7)
+        await presence.clear_busy(1, 8)
+        self.assertEqual(await presence.status(1), BUSY)
+        await presence.clear_busy(1, 7)
+        self.assertEqual(await presence.statuses([1, 2]), {1: ONLINE, 2: OFFLINE})
+        self.assertFalse(await presence.disconnect(1))
+        self.assertTrue(await presence.disconnect(1))
+        self.assertEqual(await presence.status(1), OFFLINE)
+
+
+@skipUnless(lupa, 'the Lua scripts need fakeredis and lupa')
+class RedisPresenceTests(SimpleTestCase):
+    """Two workers' RedisPresence over one fake Redis server, running the real Lua scripts."""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def worker(self):
+        with mock.patch('redis.asyncio.Redis', lambda **config: fakeredis.FakeAsyncRedis(server=self.server)):
+            return RedisPresence(worker_timeout=90)
+
+    async def test_connections_across_workers(self):
+        first, second = self.worker(), self.worker()
+        self.assertTrue(await first.connect(1))
+        self.assertFalse(await second.connect(1))
+        self.assertEqual(await second.status(1), ONLINE)
+        self.assertFalse(await first.disconnect(1))
+        self.assertTrue(await second.disconnect(1))
+        self.assertEqual(await first.statuses([1, 2]), {1: OFFLINE, 2: OFFLINE})
+
+    async def test_clear_busy_only_for_its_call(self):
+        presence = self.worker()
+        await presence.connect(1)
+        await presence.set_busy(1, 7)
+        await presence.clear_busy(1, 8)
+        self.assertEqual(await presence.status(1), BUSY)
+        await presence.clear_busy(1, 7)
+        self.assertEqual(await presence.status(1), ONLINE)
+
+    async def test_heartbeat_sweeps_a_dead_worker(self):
+        dead, alive = self.worker(), self.worker()
+        await dead.connect(1)
+        await dead.connect(2)
+        await dead.set_busy(1, 7)
+        await alive.connect(2)
+        # The dead worker's last heartbeat is older than worker_timeout.
+        await alive.redis.zadd(alive.workers_key, {dead.worker_id: 0})
+        self.assertEqual(await alive.heartbeat(), [1])
+        self.assertEqual(await alive.statuses([1, 2]), {1: OFFLINE, 2: ONLINE})
+        # Its connections closing late (it was only slow) cannot count twice.
+        self.assertFalse(await dead.disconnect(2))
+        self.assertEqual(await alive.status(2), ONLINE)
+        self.assertTrue(await alive.disconnect(2))
+        self.assertEqual(await alive.heartbeat(), [])
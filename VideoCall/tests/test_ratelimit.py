@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..ratelimit import ConcurrencyLimiter, RateLimiter, TokenBucket, client_ip
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(4)], [True, True, True, False])
+        # Two tokens a second: one back after half a second.
+        self.assertFalse(bucket.take(0.25))
+        self.assertTrue(bucket.take(0.5))
+        self.assertFalse(bucket.take(0.5))
+        # Never more than the burst, however long it was idle.
+        self.assertEqual([bucket.take(100) for _ in range(4)], [True, True, True, False])
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def limiter(self, limits, now=0.0):
+        with mock.patch('VideoCall.ratelimit.time.monotonic', return_value=now):
+            return RateLimiter(limits)
+
+    def allow(self, limiter, action, now):
+        with mock.patch('VideoCall.ratelimit.time.monotonic', return_value=now):
+            return limiter.allow(action)
+
+    def test_per_action_and_default_buckets(self):
+        limiter = self.limiter({'default': (1, 1), 'caller_data': (10, 2)})
+        self.assertEqual([self.allow(limiter, 'caller_data', 0) for _ in range(3)], [True, True, False])
+        # end_call and start_call each get their own "default" bucket.
+        self.assertTrue(self.allow(limiter, 'end_call', 0))
+        self.assertTrue(self.allow(limiter, 'start_call', 0))
+        self.assertFalse(self.allow(limiter, 'end_call', 0.5))
+        self.assertTrue(self.allow(limiter, 'end_call', 1))
+        self.assertTrue(self.allow(limiter, 'caller_data', 0.1))
+        self.assertEqual(limiter.dropped, 2)
+
+    def test_connection_total(self):
+        limiter = self.limiter({'*': (1, 2)})
+        self.assertEqual([self.allow(limiter, action, 0) for action in ('a', 'b', 'c')], [True, True, False])
+        self.assertTrue(self.allow(limiter, 'c', 1))
+
+    def test_first_drop_per_burst(self):
+        limiter = self.limiter({'default': (1, 1)})
+        self.allow(limiter, 'ping', 0)
+        self.assertFalse(self.allow(limiter, 'ping', 0))
+        self.assertTrue(limiter.first_drop('ping'))
+        self.assertFalse(limiter.first_drop('ping'))
+        self.assertTrue(self.allow(limiter, 'ping', 1))
+        self.assertFalse(self.allow(limiter, 'ping', 1))
+        self.assertTrue(limiter.first_drop('ping'))
+
+    def test_no_limits(self):
+        limiter = self.limiter({})
+        self.assertTrue(all(self.allow(limiter, 'caller_data', 0) for _ in range(1000)))
+
+
+class ConcurrencyLimiterTests(SimpleTestCase):
+
+    def test_limit_per_key(self):
+        limiter = ConcurrencyLimiter(2)
+        self.assertEqual([limiter.acquire('10.0.0.1') for _ in range(3)], [True, True, False])
+        self.assertTrue(limiter.acquire('10.0.0.2'))
+        limiter.release('10.0.0.1')
+        self.assertTrue(limiter.acquire('10.0.0.1'))
+        limiter.release('10.0.0.2')
+        self.assertNotIn('10.0.0.2', limiter.active)
+
+
+@override_settings(VIDEO_CALL_TRUSTED_PROXIES=['127.0.0.1', '10.0.0.0/8'])
+class ClientIPTests(SimpleTestCase):
+
+    def ip(self, remote_addr, forwarded=None):
+        headers = {'HTTP_X_FORWARDED_FOR': forwarded} if forwarded is not None else {}
+        return client_ip(RequestFactory().get('/', REMOTE_ADDR=remote_addr, **headers))
+
+    def test_client_ip(self):
+        self.assertEqual(self.ip('203.0.113.5', '198.51.100.1'), '203.0.113.5')
+        self.assertEqual(self.ip('127.0.0.1', '198.51.100.1'), '198.51.100.1')
+        # Entries left of the first untrusted hop could be forged by the client.
+        self.assertEqual(self.ip('127.0.0.1', '1.2.3.4, 198.51.100.1, 10.1.2.3'), '198.51.100.1')
+        # Only proxies: the header (or REMOTE_ADDR without one) names the client as well as it can.
+        self.assertEqual(self.ip('127.0.0.1'), '127.0.0.1')
+        self.assertEqual(self.ip('127.0.0.1', ''), '127.0.0.1')
+        self.assertEqual(self.ip('127.0.0.1', '10.0.0.7, 10.0.0.8'), '10.0.0.7')
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from ..models import Participant, Room, User, VideoCall
+from ..presence import get_presence
+from ..reaper import StaleCallReaper
+from .helpers import ConsumerTestCase
+
+
+class StaleCallReaperTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    async def started(self, status, seconds_ago):
+        call = await VideoCall.objects.acreate(caller=self.alice, receiver=self.bob, status=status)
+        await VideoCall.objects.filter(pk=call.pk).aupdate(call_start_time=timezone.now() - timedelta(seconds=seconds_ago))
+        return call.pk
+
+    async def reap(self):
+        return await StaleCallReaper(interval=0, batch_size=2).reap()
+
+    async def status(self, pk):
+        return (await VideoCall.objects.aget(pk=pk)).status
+
+    async def test_stale_calls(self):
+        ringing = await self.started(VideoCall.RINGING, 10 * 60)
+        connected = await self.started(VideoCall.CONNECTED, 5 * 60 * 60)
+        fresh = await self.started(VideoCall.RINGING, 0)
+        self.assertEqual(await self.reap(), 2)
+        self.assertEqual(await self.status(ringing), VideoCall.MISSED)
+        self.assertEqual(await self.status(connected), VideoCall.ENDED)
+        self.assertEqual(await self.status(fresh), VideoCall.RINGING)
+
+    async def test_orphans_need_shared_presence(self):
+        # Presence local to this worker shows the participants offline, which proves nothing.
+        orphan = await self.started(VideoCall.CONNECTED, 10 * 60)
+        self.assertEqual(await self.reap(), 0)
+        self.assertEqual(await self.status(orphan), VideoCall.CONNECTED)
+
+    async def test_orphans_with_shared_presence(self):
+        get_presence().shared = True
+        orphan = await self.started(VideoCall.CONNECTED, 10 * 60)
+        recent = await self.started(VideoCall.CONNECTED, 10)
+        self.assertEqual(await self.reap(), 1)
+        self.assertEqual(await self.status(orphan), VideoCall.ENDED)
+        self.assertEqual(await self.status(recent), VideoCall.CONNECTED)
+
+        online = await self.started(VideoCall.CONNECTED, 10 * 60)
+        for user in (self.alice, self.bob):
+            await get_presence().connect(user.id)
+        self.assertEqual(await self.reap(), 0)
+        self.assertEqual(await self.status(online), VideoCall.CONNECTED)
+
+    async def test_offline_room_participants(self):
+        get_presence().shared = True
+        room = await Room.objects.acreate(name='standup', owner=self.alice)
+        joined = timezone.now() - timedelta(minutes=10)
+        for user in (self.alice, self.bob):
+            participant = await Participant.objects.acreate(room=room, user=user, channel_name=f'{user.username}.1')
+            await Participant.objects.filter(pk=participant.pk).aupdate(joined_at=joined)
+        await get_presence().connect(self.bob.id)
+        await self.reap()
+        present = Participant.objects.filter(room=room, left_at__isnull=True).values_list('user__username', flat=True)
+        self.assertEqual([username async for username in present], ['bob'])
+        self.assertIsNone((await Room.objects.aget(pk=room.pk)).closed_at)
+
+        await get_presence().disconnect(self.bob.id)
+        await self.reap()
+        self.assertIsNotNone((await Room.objects.aget(pk=room.pk)).closed_at)
@@ -0,0 +1,81 @@
+import asyncio
+
+from django.test import override_settings
+
+from .. import resume
+from ..models import User, VideoCall
+from .helpers import ConsumerTestCase
+
+RESUME = '/ws/video_call/?features=resume'
+CANDIDATE = {'candidate': 'candidate:1 1 udp 2122260223 10.0.0.1 50000 typ host', 'sdpMid': '0'}
+
+
+@override_settings(VIDEO_CALL_STATE_CACHE=None, VIDEO_CALL_RESUME_GRACE=20)
+class ResumeTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        resume._store = resume._timers = None
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    async def dropped_call(self):
+        """Alice (resumable) in a call with bob, then her socket drops with a frame from bob unread."""
+        alice, bob = await self.connect(self.alice, RESUME), await self.connect(self.bob)
+        session = await self.expect(alice, 'session')
+        await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+        call_id = (await self.expect(alice, 'call_initiated'))['video_call_id']
+        await self.expect(bob, 'incoming_call')
+        await bob.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+        last_seq = (await self.expect(alice, 'call_started'))['seq']
+        await bob.send_json_to({'action': 'receiver_data', 'video_call_id': call_id, 'candidate': CANDIDATE})
+        await asyncio.sleep(0.05)
+        await alice.disconnect()
+        await self.expect(bob, 'peer_reconnecting')
+        return call_id, session['session_id'], last_seq, bob
+
+    async def test_resume_replays_missed_frames(self):
+        call_id, session_id, last_seq, bob = await self.dropped_call()
+        # Held back until alice is back.
+        await bob.send_json_to({'action': 'receiver_data', 'video_call_id': call_id, 'sdp': {'type': 'offer'}})
+        alice = await self.connect(self.alice, RESUME)
+        try:
+            await alice.send_json_to({'action': 'resume', 'session_id': session_id, 'last_seq': last_seq})
+            resumed = await self.expect(alice, 'resumed')
+            self.assertEqual((resumed['video_call_id'], resumed['replayed'], resumed['gap']), (call_id, 1, False))
+            self.assertEqual((await self.expect(alice, 'caller_data'))['candidate'], CANDIDATE)
+            self.assertEqual((await self.expect(bob, 'peer_resumed'))['video_call_id'], call_id)
+            self.assertEqual((await self.expect(alice, 'caller_data'))['sdp'], {'type': 'offer'})
+            # Both directions work on the new connection.
+            await alice.send_json_to({'action': 'caller_data', 'video_call_id': call_id, 'candidate': CANDIDATE})
+            self.assertEqual((await self.expect(bob, 'receiver_data'))['candidate'], CANDIDATE)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.CONNECTED)
+
+            # A session resumes once.
+            await alice.send_json_to({'action': 'resume', 'session_id': session_id, 'last_seq': last_seq})
+            self.assertEqual((await self.expect(alice, 'error'))['status_code'], 410)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_resume_by_another_user_is_refused(self):
+        call_id, session_id, last_seq, bob_socket = await self.dropped_call()
+        bob = await self.connect(self.bob, RESUME)
+        try:
+            await bob.send_json_to({'action': 'resume', 'session_id': session_id, 'last_seq': last_seq})
+            self.assertEqual((await self.expect(bob, 'error'))['status_code'], 410)
+        finally:
+            await self.disconnect(bob, bob_socket)
+
+    @override_settings(VIDEO_CALL_RESUME_GRACE=0.05)
+    async def test_session_expires(self):
+        call_id, session_id, last_seq, bob = await self.dropped_call()
+        try:
+            self.assertEqual((await self.expect(bob, 'call_ended'))['video_call_id'], call_id)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.ENDED)
+            alice = await self.connect(self.alice, RESUME)
+            await alice.send_json_to({'action': 'resume', 'session_id': session_id, 'last_seq': last_seq})
+            self.assertEqual(await self.expect(alice, 'error'),
+                             {'action': 'error', 'status_code': 410, 'message': 'Session can no longer be resumed'})
+            await alice.disconnect()
+        finally:
+            await self.disconnect(bob)
@@ -0,0 +1,57 @@
+import asyncio
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .. import ringing
+from ..models import User, VideoCall
+from .helpers import ConsumerTestCase
+
+
+class RingTimeoutTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ringing._scheduler = ringing.RingTimeoutScheduler(timeout=0.2)
+        self.addCleanup(setattr, ringing, '_scheduler', None)
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    async def test_unanswered_call_is_missed(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await alice.send_json_to({'action': 'initiate_call', 'receiver_username': 'bob'})
+            call_id = (await self.expect(alice, 'call_initiated'))['video_call_id']
+            await self.expect(bob, 'incoming_call')
+            for socket in (alice, bob):
+                missed = await self.expect(socket, 'call_missed')
+                self.assertEqual((missed['video_call_id'], missed['status_code']), (call_id, 408))
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.MISSED)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_answered_call_is_not_missed(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            call_id = await self.call(alice, bob, 'bob')
+            await asyncio.sleep(0.5)
+            self.assertEqual((await VideoCall.objects.aget(pk=call_id)).status, VideoCall.CONNECTED)
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_startup_sweep(self):
+        # Left RINGING by a worker that went away: one past its deadline, one not yet.
+        overdue = await VideoCall.objects.acreate(caller=self.alice, receiver=self.bob)
+        await VideoCall.objects.filter(pk=overdue.pk).aupdate(call_start_time=timezone.now() - timedelta(minutes=1))
+        pending = await VideoCall.objects.acreate(caller=self.alice, receiver=self.bob)
+        scheduler = ringing.get_ring_scheduler()
+        scheduler.start()
+        try:
+            await asyncio.sleep(0.05)
+            self.assertEqual((await VideoCall.objects.aget(pk=overdue.pk)).status, VideoCall.MISSED)
+            self.assertEqual((await VideoCall.objects.aget(pk=pending.pk)).status, VideoCall.RINGING)
+            self.assertIn(pending.pk, scheduler.deadlines)
+            await asyncio.sleep(0.5)
+            self.assertEqual((await VideoCall.objects.aget(pk=pending.pk)).status, VideoCall.MISSED)
+        finally:
+            await scheduler.stop()
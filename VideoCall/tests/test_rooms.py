@@ -0,0 +1,91 @@
+from django.test import override_settings
+
+from .. import sfu
+from ..models import Participant, User
+from .helpers import ConsumerTestCase
+
+
+@override_settings(VIDEO_CALL_ROOM_MAX_PARTICIPANTS=2)
+class RoomTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        sfu._sfu = None
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+
+    async def test_room_capacity(self):
+        alice, bob, carol = await self.connect(self.alice), await self.connect(self.bob), await self.connect(self.carol)
+        try:
+            await alice.send_json_to({'action': 'join_room', 'room': 'standup'})
+            self.assertEqual((await self.expect(alice, 'room_joined'))['participants'], [])
+            await bob.send_json_to({'action': 'join_room', 'room': 'standup'})
+            self.assertEqual((await self.expect(bob, 'room_joined'))['participants'], ['alice'])
+            self.assertEqual((await self.expect(alice, 'participant_joined'))['username'], 'bob')
+
+            await carol.send_json_to({'action': 'join_room', 'room': 'standup'})
+            self.assertEqual(await self.expect(carol, 'error'),
+                             {'action': 'error', 'status_code': 409, 'message': 'Room is full'})
+
+            await bob.send_json_to({'action': 'leave_room', 'room': 'standup'})
+            await self.expect(bob, 'room_left')
+            self.assertEqual((await self.expect(alice, 'participant_left'))['username'], 'bob')
+            await carol.send_json_to({'action': 'join_room', 'room': 'standup'})
+            self.assertEqual((await self.expect(carol, 'room_joined'))['participants'], ['alice'])
+            self.assertEqual(await Participant.objects.filter(left_at__isnull=True).acount(), 2)
+        finally:
+            await self.disconnect(alice, bob, carol)
+
+    async def test_rejoin_from_another_device(self):
+        a1, a2 = await self.connect(self.alice), await self.connect(self.alice)
+        try:
+            await a1.send_json_to({'action': 'join_room', 'room': 'standup'})
+            await self.expect(a1, 'room_joined')
+            await a2.send_json_to({'action': 'join_room', 'room': 'standup'})
+            await self.expect(a2, 'room_joined')
+            await self.expect(a1, 'room_joined_elsewhere')
+            # Still one seat taken.
+            self.assertEqual(await Participant.objects.filter(left_at__isnull=True).acount(), 1)
+        finally:
+            await self.disconnect(a1, a2)
+
+    async def join(self, *sockets, mode=None):
+        for socket in sockets:
+            await socket.send_json_to({'action': 'join_room', 'room': 'standup', **({'mode': mode} if mode else {})})
+            await self.expect(socket, 'room_joined')
+
+    async def test_mesh_signals_go_participant_to_participant(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await self.join(alice, bob)
+            await bob.send_json_to({'action': 'publish', 'room': 'standup', 'to': 'alice', 'sdp': {'type': 'offer'}})
+            signal = await self.expect(alice, 'room_signal')
+            self.assertEqual((signal['from'], signal['sdp']), ('bob', {'type': 'offer'}))
+            await bob.send_json_to({'action': 'publish', 'room': 'standup', 'to': 'carol', 'sdp': {'type': 'offer'}})
+            self.assertEqual((await self.expect(bob, 'error'))['status_code'], 404)
+            await alice.send_json_to({'action': 'subscribe', 'room': 'standup'})
+            self.assertEqual((await self.expect(bob, 'subscribe_request'))['from'], 'alice')
+        finally:
+            await self.disconnect(alice, bob)
+
+    async def test_sfu_publish_and_subscribe(self):
+        alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+        try:
+            await self.join(alice, bob, mode='SFU')
+            await alice.send_json_to({'action': 'publish', 'room': 'standup', 'sdp': {'type': 'offer', 'sdp': 'v=0'}})
+            answer = await self.expect(alice, 'room_signal')
+            self.assertEqual((answer['from'], answer['sdp']['type']), (None, 'answer'))
+            # Bob is offered alice's tracks straight away.
+            published = await self.expect(bob, 'track_published')
+            self.assertEqual(published['username'], 'alice')
+            self.assertIn(f'user-{self.alice.id}', published['sdp']['sdp'])
+            await bob.send_json_to({'action': 'subscribe', 'room': 'standup', 'sdp': {'type': 'answer'}})
+
+            room_id = next(iter(sfu.get_sfu().rooms))
+            self.assertEqual(sfu.get_sfu().rooms[room_id][self.bob.id].subscriptions, {self.alice.id})
+            await alice.send_json_to({'action': 'leave_room', 'room': 'standup'})
+            await self.expect(alice, 'room_left')
+            self.assertEqual(sfu.get_sfu().rooms[room_id][self.bob.id].subscriptions, set())
+        finally:
+            await self.disconnect(alice, bob)
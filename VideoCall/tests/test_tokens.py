@@ -0,0 +1,55 @@
+import time
+from unittest import mock
+
+from django.core import signing
+from django.test import TestCase, override_settings
+
+from ..models import User
+from ..tokens import ConnectionTokenAuthMiddleware, issue_token, read_token
+
+
+class ConnectionTokenTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+
+    def test_round_trip(self):
+        self.assertEqual(read_token(issue_token(self.alice)), (self.alice.id, 'alice'))
+
+    def test_bad_signature(self):
+        token = issue_token(self.alice)
+        self.assertIsNone(read_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        # Signed with the project key, but not as a connection token.
+        self.assertIsNone(read_token(signing.dumps([self.alice.id, 'alice'])))
+        for token in ('', 'garbage', None):
+            with self.subTest(token=token):
+                self.assertIsNone(read_token(token))
+
+    @override_settings(VIDEO_CALL_WS_TOKEN_TTL=60)
+    def test_expiry(self):
+        token = issue_token(self.alice)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 59):
+            self.assertIsNotNone(read_token(token))
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 61):
+            self.assertIsNone(read_token(token))
+
+    async def scope_user(self, query_string):
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen['user'] = scope['user']
+
+        await ConnectionTokenAuthMiddleware(app)({'type': 'websocket', 'query_string': query_string}, None, None)
+        return seen['user']
+
+    async def test_middleware(self):
+        user = await self.scope_user(f'token={issue_token(self.alice)}'.encode())
+        self.assertEqual((user.id, user.username, user.is_authenticated), (self.alice.id, 'alice', True))
+        self.assertFalse((await self.scope_user(b'token=forged')).is_authenticated)
+        self.assertFalse((await self.scope_user(b'')).is_authenticated)
+
+    def test_token_view(self):
+        self.assertEqual(self.client.get('/ws-token/').status_code, 401)
+        self.client.force_login(self.alice)
+        response = self.client.get('/ws-token/').json()
+        self.assertEqual(read_token(response['token']), (self.alice.id, 'alice'))
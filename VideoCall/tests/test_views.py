@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from ..models import User
+
+
+class PageTests(TestCase):
+    """Pages render with the default static storage, before any collectstatic."""
+
+    def test_login_page(self):
+        response = self.client.get('/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/static/VideoCall/css/login.css')
+
+    def test_call_page(self):
+        self.client.force_login(User.objects.create_user('alice'))
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/static/VideoCall/js/main.js')
+
+    def test_call_page_requires_login(self):
+        self.assertRedirects(self.client.get('/'), '/login/', fetch_redirect_response=False)
+
+
+class MetricsViewTests(TestCase):
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_staff(self):
+        self.client.force_login(User.objects.create_user('alice'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'videocall_messages_total')
+
+    def test_token(self):
+        # No token configured: none is accepted.
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with self.settings(VIDEO_CALL_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
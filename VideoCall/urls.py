@@ -1,8 +1,10 @@
 from django.urls import path
 
-from VideoCall.views import VideoCallView, LoginView
+from VideoCall.views import VideoCallView, LoginView, CallHistoryView, ConnectionTokenView
 
 urlpatterns = [
     path('', VideoCallView.as_view(), name='videocall'),
     path('login/', LoginView.as_view(), name='login'),
+    path('history/', CallHistoryView.as_view(), name='call_history'),
+    path('ws-token/', ConnectionTokenView.as_view(), name='ws_token'),
 ]
\ No newline at end of file
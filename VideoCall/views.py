@@ -1,48 +1,121 @@
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.views import View
-from .models import VideoCall, User
-from django.contrib.auth import authenticate, login
+from . import metrics
+from .history import decode_cursor, history_entry, history_page
+from .models import User
+from .passwords import aauthenticate, amake_password
+from .ratelimit import client_ip, get_login_limiter
+from .tokens import issue_token, token_ttl
+from django.conf import settings
+from django.contrib.auth import alogin
+from django.db import IntegrityError
+from django.utils.crypto import constant_time_compare
 
 class VideoCallView(View):
     def get(self, request):
         user = request.user
         if user.is_authenticated:
-            call_logs = VideoCall.objects.filter(Q(caller=user) | Q(receiver=user)).order_by('-call_start_time')
-            context = {'call_logs': call_logs}
+            calls, next_cursor = history_page(user)
+            context = {
+                'call_logs': [history_entry(call, user) for call in calls],
+                'history_cursor': next_cursor or '',
+                'ws_token': issue_token(user),
+                'ws_token_ttl': token_ttl(),
+            }
 
             return render(request, 'VideoCall/videocall.html', context=context)
         else:
             return HttpResponseRedirect("/login/")
 
 
-class LoginView(View):
+class CallHistoryView(View):
+    def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        cursor = request.GET.get('cursor', None)
+        before = decode_cursor(cursor) if cursor else None
+        if cursor and before is None:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        calls, next_cursor = history_page(user, before)
+        return JsonResponse({
+            'calls': [history_entry(call, user) for call in calls],
+            'next_cursor': next_cursor,
+        })
+
+
+class ConnectionTokenView(View):
     def get(self, request):
-        if request.user.is_authenticated:
+        user = request.user
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return JsonResponse({'token': issue_token(user), 'expires_in': token_ttl()})
+
+
+class MetricsView(View):
+    """Prometheus metrics, for staff or a scraper sending VIDEO_CALL_METRICS_TOKEN."""
+
+    def get(self, request):
+        if not (request.user.is_staff or self.has_token(request)):
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+    @staticmethod
+    def has_token(request):
+        token = getattr(settings, "VIDEO_CALL_METRICS_TOKEN", "")
+        if not token:
+            return False
+        scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and constant_time_compare(credentials, token)
+
+
+class LoginView(View):
+    """
+    Sign in and sign up. Async, so the password hash waits on the hasher
+    pool (see passwords.py) instead of holding a sync thread, and each
+    client IP gets at most VIDEO_CALL_LOGIN_CONCURRENCY at a time.
+    """
+
+    async def get(self, request):
+        if (await request.auser()).is_authenticated:
             return HttpResponseRedirect('')
         return render(request, 'VideoCall/login.html')
 
-    def post(self, request):
-        if request.user.is_authenticated:
+    async def post(self, request):
+        if (await request.auser()).is_authenticated:
             return HttpResponseRedirect('')
         username = request.POST.get('username', None)
         password = request.POST.get('password', None)
         type = request.POST.get('type', None)
-        print(username, password, type)
-        if username and password:
+        if not (username and password and type in ('signin', 'signup')):
+            return HttpResponseRedirect("/login/")
+        client = client_ip(request)
+        limiter = get_login_limiter()
+        if not limiter.acquire(client):
+            response = HttpResponse('Too many sign-in attempts in progress', status=429)
+            response['Retry-After'] = '1'
+            return response
+        try:
             if type == "signin":
-                print("signin")
-                user = authenticate(username=username, password=password)
-                if user is not None:
-                    login(request, user)
-                    return HttpResponseRedirect('/')
-                else:
-                    return HttpResponseRedirect("/login/")
-            elif type == "signup":
-                print("signup")
-                email = request.POST.get('email', None)
-                user = User.objects.create_user(username=username, password=password, email=email)
-                login(request, user)
-                return HttpResponseRedirect('/')
+                user = await aauthenticate(request, username=username, password=password)
+            else:
+                user = await self.create_user(username, password, request.POST.get('email', None))
+        finally:
+            limiter.release(client)
+        if user is None:
+            return HttpResponseRedirect("/login/")
+        await alogin(request, user)
+        return HttpResponseRedirect('/')
 
+    @staticmethod
+    async def create_user(username, password, email):
+        """What User.objects.create_user does, with the hash from the hasher pool; None if the name is taken."""
+        user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email))
+        user.password = await amake_password(password)
+        try:
+            await user.asave()
+        except IntegrityError:
+            return None
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        return user
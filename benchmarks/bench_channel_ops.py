@@ -0,0 +1,99 @@
+"""
+Counts channel-layer operations for one complete call setup.
+
+Runs initiate -> start -> offer/answer -> ICE trickle -> end between two
+users and reports how many send / group_send calls reached the channel
+layer, how many per-channel deliveries the group sends fanned out to, and
+how many WebSocket frames the clients sent and received, and how many SQL
+reads and writes the whole lifecycle cost. With --devices N the receiver has
+N connections and only the first answers; idle_device_frames counts what
+reached the other N - 1.
+With channels_redis every group_send costs a group-membership read on top
+of one push per member channel, while send is a single push.
+
+With --batch both clients opt into the "batch" feature and send their
+candidates with one candidates_batch action instead of one frame each.
+
+Usage:
+    python benchmarks/bench_channel_ops.py [--candidates 20] [--devices 1] [--batch]
+"""
+import argparse
+import asyncio
+import json
+
+from common import setup_django
+
+setup_django()
+
+from common import QueryCounter, connect, counting_channel_layer, create_users, use_channel_layer
+
+
+async def drain(communicator, counts):
+    frames = []
+    while not await communicator.receive_nothing(timeout=0.05):
+        frames.append(json.loads((await communicator.receive_output())['text']))
+    counts['frames_received'] += len(frames)
+    return frames
+
+
+async def send(communicator, counts, message):
+    counts['frames_sent'] += 1
+    await communicator.send_json_to(message)
+
+
+def make_candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i} typ host', 'sdpMid': '0', 'sdpMLineIndex': 0}
+
+
+async def run(caller, receiver, candidates, devices, batch):
+    layer = use_channel_layer(counting_channel_layer()())
+    path = '/ws/video_call/?features=batch' if batch else '/ws/video_call/'
+    caller_socket = await connect(caller, path)
+    receiver_sockets = [await connect(receiver, path) for _ in range(devices)]
+    receiver_socket = receiver_sockets[0]
+    counts = layer.counts
+    counts.clear()
+    with QueryCounter() as queries:
+
+        await send(caller_socket, counts, {'action': 'initiate_call', 'receiver_username': receiver.username})
+        call_id = (await drain(caller_socket, counts))[0]['video_call_id']
+        await send(receiver_socket, counts, {'action': 'start_call', 'video_call_id': call_id})
+        await drain(caller_socket, counts)
+        await send(caller_socket, counts, {'action': 'caller_data', 'video_call_id': call_id, 'sdp': {'type': 'offer', 'sdp': 'v=0'}})
+        await send(receiver_socket, counts, {'action': 'receiver_data', 'video_call_id': call_id, 'sdp': {'type': 'answer', 'sdp': 'v=0'}})
+        if batch:
+            batch_candidates = [make_candidate(i) for i in range(candidates)]
+            await send(caller_socket, counts, {'action': 'candidates_batch', 'video_call_id': call_id, 'candidates': batch_candidates})
+            await send(receiver_socket, counts, {'action': 'candidates_batch', 'video_call_id': call_id, 'candidates': batch_candidates})
+        else:
+            for i in range(candidates):
+                await send(caller_socket, counts, {'action': 'caller_data', 'video_call_id': call_id, 'candidate': make_candidate(i)})
+                await send(receiver_socket, counts, {'action': 'receiver_data', 'video_call_id': call_id, 'candidate': make_candidate(i)})
+        await drain(caller_socket, counts)
+        await send(caller_socket, counts, {'action': 'end_call', 'video_call_id': call_id})
+        await drain(caller_socket, counts)
+        await drain(receiver_socket, counts)
+        for socket in receiver_sockets[1:]:
+            counts['idle_device_frames'] += len(await drain(socket, counts))
+
+        for socket in [caller_socket] + receiver_sockets:
+            await socket.disconnect()
+    result = dict(counts)
+    result.update(('sql_' + kind, count) for kind, count in queries.counts.items())
+
+    print(f"candidates per side: {candidates}, receiver devices: {devices}, batch: {batch}")
+    names = ['frames_sent', 'frames_received', 'group_send', 'group_deliveries', 'send', 'sql_reads', 'sql_writes']
+    if devices > 1:
+        names.append('idle_device_frames')
+    for name in names:
+        print(f"{name:18} {result.get(name, 0):6}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--devices', type=int, default=1)
+    parser.add_argument('--batch', action='store_true')
+    args = parser.parse_args()
+    caller, receiver = create_users(2, prefix='ops')
+    asyncio.run(run(caller, receiver, args.candidates, args.devices, args.batch))
@@ -0,0 +1,89 @@
+"""
+A reconnect storm: --connections websockets opening at once.
+
+Runs the handshake through the websocket stack of project.asgi twice: once
+with the old session stack (SessionMiddlewareStack(AuthMiddlewareStack(...)),
+a session cookie per user) and once with ConnectionTokenAuthMiddleware (a
+signed ?token= per user). Reports connections per second, p50 / p99 time to
+the accept and SQL statements per connect.
+
+Usage:
+    python benchmarks/bench_connect.py [--connections 500]
+"""
+import argparse
+import asyncio
+import time
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=500)
+    return parser.parse_args()
+
+
+args = parse_args()
+setup_django()
+
+from channels.auth import AuthMiddlewareStack
+from channels.routing import URLRouter
+from channels.sessions import SessionMiddlewareStack
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+
+from common import QueryCounter, create_users
+from VideoCall.routing import websocket_urlpatterns
+from VideoCall.tokens import ConnectionTokenAuthMiddleware, issue_token
+
+
+def session_cookie(user):
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+async def open_socket(application, path, headers, timings):
+    communicator = WebsocketCommunicator(application, path, headers=headers)
+    start = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=60)
+    timings.append(time.perf_counter() - start)
+    assert connected
+    return communicator
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def storm(name, application, requests):
+    timings = []
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        sockets = await asyncio.gather(*(open_socket(application, path, headers, timings) for path, headers in requests))
+        elapsed = time.perf_counter() - start
+    for socket in sockets:
+        await socket.disconnect()
+    total = sum(queries.counts.values())
+    print(f"{name:8} {len(sockets) / elapsed:12.0f} {percentile(timings, 0.5) * 1000:9.1f} {percentile(timings, 0.99) * 1000:9.1f}"
+          f" {total / len(sockets):10.2f}")
+
+
+async def run(session_requests, token_requests):
+    print(f"connections: {args.connections}")
+    print(f"{'stack':8} {'connects/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'SQL/conn':>10}")
+    await storm('session', SessionMiddlewareStack(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))), session_requests)
+    await storm('token', ConnectionTokenAuthMiddleware(URLRouter(websocket_urlpatterns)), token_requests)
+
+
+if __name__ == '__main__':
+    users = create_users(args.connections, prefix='storm')
+    session_requests = [('/ws/video_call/', [(b'cookie', session_cookie(user).encode())]) for user in users]
+    token_requests = [(f'/ws/video_call/?token={issue_token(user)}', []) for user in users]
+    asyncio.run(run(session_requests, token_requests))
@@ -0,0 +1,104 @@
+"""
+Microbenchmark for VideoCallConsumer.websocket_receive dispatch cost.
+
+Feeds pre-encoded frames straight into a consumer instance (no socket, no
+database) and reports the mean cost per message for each action. The relay
+rows use a call that is already in the membership cache, so they measure
+parsing, dispatch, serialization and the channel-layer hand-off only.
+
+Rate limits are off, so every frame is dispatched. The limiter's own cost is
+a second table: the cached relay with a bucket that always has room, and
+with one that is empty (each frame is dropped).
+
+Usage:
+    python benchmarks/bench_dispatch.py [--messages 20000] [--codec json|msgpack]
+"""
+import argparse
+import asyncio
+import time
+
+from common import setup_django
+
+# The dropped-frame case must not close the connection part way through.
+setup_django(database=False, VIDEO_CALL_RATE_LIMITS={}, VIDEO_CALL_RATE_LIMIT_CLOSE_AFTER=0)
+
+from channels.layers import InMemoryChannelLayer
+from django.contrib.auth.models import User
+
+from VideoCall.codecs import json_codec, msgpack_codec
+from VideoCall.consumers import VideoCallConsumer
+from VideoCall.ratelimit import RateLimiter
+
+CODECS = {codec.name: codec for codec in (json_codec, msgpack_codec)}
+
+CALL_ID = 1
+CALLER = User(id=1, username='alice')
+RECEIVER = User(id=2, username='bob')
+
+CASES = [
+    ("caller_data (cached relay)", {"action": "caller_data", "video_call_id": CALL_ID, "candidate": {"candidate": "candidate:1 1 udp 2122260223 10.0.0.1 50000 typ host", "sdpMid": "0", "sdpMLineIndex": 0}}),
+    ("caller_data (missing id)", {"action": "caller_data", "candidate": {}}),
+    ("receiver_data (missing id)", {"action": "receiver_data", "candidate": {}}),
+    ("initiate_call (missing user)", {"action": "initiate_call"}),
+    ("end_call (missing id)", {"action": "end_call"}),
+    ("unknown action", {"action": "ping"}),
+]
+
+# (name, VIDEO_CALL_RATE_LIMITS) for the cached relay.
+LIMITER_CASES = [
+    ("no limits", {}),
+    ("within limit", {"*": (10 ** 9, 10 ** 9), "caller_data": (10 ** 9, 10 ** 9)}),
+    ("over limit (dropped)", {"caller_data": (0, 1)}),
+]
+
+
+async def make_consumer(codec):
+    consumer = VideoCallConsumer()
+    consumer.scope = {"user": CALLER, "session": {}, "subprotocols": [codec.subprotocol] if codec.subprotocol else []}
+    consumer.channel_layer = InMemoryChannelLayer(capacity=10 ** 7)
+    consumer.channel_name = await consumer.channel_layer.new_channel()
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    consumer.send = send
+    await consumer.websocket_connect({"type": "websocket.connect"})
+    consumer.remember_call(CALL_ID, CALLER.id, RECEIVER.id, "CONNECTED")
+    return consumer, sent
+
+
+async def run(messages, codec):
+    consumer, sent = await make_consumer(codec)
+    # Keep the peer's group small and drained so the in-memory layer stays cheap.
+    peer_channel = await consumer.channel_layer.new_channel()
+    await consumer.channel_layer.group_add(f"videocall_{RECEIVER.id}", peer_channel)
+
+    async def measure(event):
+        start = time.perf_counter()
+        for _ in range(messages):
+            await consumer.websocket_receive(event)
+        elapsed = time.perf_counter() - start
+        sent.clear()
+        await consumer.channel_layer.flush()
+        await consumer.channel_layer.group_add(f"videocall_{RECEIVER.id}", peer_channel)
+        return elapsed / messages * 1e6
+
+    print(f"{'case':32} {'us/msg':>10}")
+    for name, payload in CASES:
+        event = {"type": "websocket.receive", codec.key: codec.dumps(payload)}
+        print(f"{name:32} {await measure(event):10.2f}")
+
+    print(f"\n{'rate limiter, cached relay':32} {'us/msg':>10}")
+    event = {"type": "websocket.receive", codec.key: codec.dumps(CASES[0][1])}
+    for name, limits in LIMITER_CASES:
+        consumer.rate_limiter = RateLimiter(limits)
+        print(f"{name:32} {await measure(event):10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--codec', choices=sorted(CODECS), default='json')
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, CODECS[args.codec]))
@@ -0,0 +1,136 @@
+"""
+One abusive connection against everyone else on the worker.
+
+Sets up --pairs ordinary calls plus one more whose caller floods caller_data
+candidates at --rate frames per second for --seconds, while every ordinary pair
+trickles a candidate each way every 50 ms. The channel layer holds
+--capacity messages per channel, like the Redis layer's "capacity". Reports
+for the ordinary pairs the p50 / p99 candidate relay latency and how many
+candidates never arrived, and for the flood how many frames the consumer
+handled, how many the rate limiter dropped and how many sends hit a full
+channel.
+
+Usage:
+    python benchmarks/bench_flood.py [--pairs 20] [--seconds 2] [--rate 5000] [--capacity 100] [--no-limits]
+"""
+import argparse
+import asyncio
+import time
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=2)
+    parser.add_argument('--rate', type=int, default=5000, help='flood frames per second (0: no flood)')
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--no-limits', action='store_true', help='turn the rate limiter off (VIDEO_CALL_RATE_LIMITS = {})')
+    return parser.parse_args()
+
+
+args = parse_args()
+overrides = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': args.capacity}}},
+    'VIDEO_CALL_RELAY_WINDOW': 0,
+    'VIDEO_CALL_RATE_LIMIT_CLOSE_AFTER': 0,
+}
+if args.no_limits:
+    overrides['VIDEO_CALL_RATE_LIMITS'] = {}
+setup_django(**overrides)
+
+from common import connect, create_users
+from VideoCall import metrics
+
+
+def make_candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i % 10000} typ host', 'sdpMid': '0',
+            'sdpMLineIndex': 0, 'sent_at': time.perf_counter()}
+
+
+async def start_call(caller, receiver, receiver_username):
+    await caller.send_json_to({'action': 'initiate_call', 'receiver_username': receiver_username})
+    call_id = (await caller.receive_json_from(timeout=10))['video_call_id']
+    await receiver.receive_json_from(timeout=10)  # incoming_call
+    await receiver.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+    while (await caller.receive_json_from(timeout=10))['action'] != 'call_started':
+        pass
+    while (await receiver.receive_json_from(timeout=10))['action'] != 'call_started':
+        pass
+    return call_id
+
+
+async def trickle(socket, call_id, action, deadline, sent):
+    i = 0
+    while time.perf_counter() < deadline:
+        await socket.send_json_to({'action': action, 'video_call_id': call_id, 'candidate': make_candidate(i)})
+        sent.append(1)
+        i += 1
+        await asyncio.sleep(0.05)
+
+
+async def collect(socket, deadline, latencies):
+    while True:
+        try:
+            frame = await socket.receive_json_from(timeout=max(deadline - time.perf_counter(), 0) + 1)
+        except asyncio.TimeoutError:
+            return
+        candidate = frame.get('candidate')
+        if candidate:
+            latencies.append(time.perf_counter() - candidate['sent_at'])
+
+
+async def flood(socket, call_id, deadline, counts):
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        due = int((time.perf_counter() - start) * args.rate)
+        for i in range(counts['flood_sent'], due):
+            await socket.send_json_to({'action': 'caller_data', 'video_call_id': call_id, 'candidate': make_candidate(i)})
+        counts['flood_sent'] = max(due, counts['flood_sent'])
+        await asyncio.sleep(0.01)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def run(users):
+    sockets = [await connect(user) for user in users]
+    calls = []
+    for i in range(0, len(users), 2):
+        calls.append(await start_call(sockets[i], sockets[i + 1], users[i + 1].username))
+    abuser, abused, flood_call = sockets[-2], sockets[-1], calls[-1]
+
+    def limited():
+        return metrics.RATE_LIMITED.labels('caller_data').value
+
+    handled_before = metrics.MESSAGES.labels('caller_data').value
+    limited_before, full_before = limited(), metrics.CHANNEL_FULL.labels().value
+    deadline = time.perf_counter() + args.seconds
+    latencies, sent, counts = [], [], {'flood_sent': 0}
+    tasks = [flood(abuser, flood_call, deadline, counts)]
+    for i, call_id in enumerate(calls[:-1]):
+        caller, receiver = sockets[2 * i], sockets[2 * i + 1]
+        tasks += [
+            trickle(caller, call_id, 'caller_data', deadline, sent),
+            trickle(receiver, call_id, 'receiver_data', deadline, sent),
+            collect(caller, deadline, latencies),
+            collect(receiver, deadline, latencies),
+        ]
+    await asyncio.gather(*tasks)
+
+    print(f"pairs: {args.pairs}, flood: {args.rate}/s for {args.seconds}s, capacity: {args.capacity}, rate limits: {not args.no_limits}")
+    print(f"{'relay latency p50':28} {percentile(latencies, 0.50) * 1000:10.2f} ms")
+    print(f"{'relay latency p99':28} {percentile(latencies, 0.99) * 1000:10.2f} ms")
+    print(f"{'candidates lost':28} {len(sent) - len(latencies):10} of {len(sent)}")
+    print(f"{'flood frames sent':28} {counts['flood_sent']:10}")
+    print(f"{'flood frames rate limited':28} {limited() - limited_before:10.0f}")
+    print(f"{'caller_data handled, all':28} {metrics.MESSAGES.labels('caller_data').value - handled_before - (limited() - limited_before):10.0f}")
+    print(f"{'sends to a full channel':28} {metrics.CHANNEL_FULL.labels().value - full_before:10.0f}")
+    print(f"{'candidates dropped':28} {metrics.DROPPED_CANDIDATES.labels().value:10.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(create_users(2 * args.pairs + 2, prefix='flood')))
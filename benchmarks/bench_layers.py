@@ -0,0 +1,205 @@
+"""
+Relay latency and Redis traffic of the channel layer backends.
+
+Sets up --pairs calls (initiate -> start), then has both sides of every call
+trickle --candidates ICE candidates 20 ms apart, on three setups:
+
+  * redis:      every connection on a plain Redis-style layer (what
+                channels_redis.core.RedisChannelLayer does),
+  * hybrid:     HybridChannelLayer, both peers on the same worker,
+  * hybrid-2w:  HybridChannelLayer on two workers, callers on one and
+                receivers on the other, so everything crosses "Redis".
+
+"Redis" is an in-memory layer that msgpack-encodes every message and waits
+--rtt milliseconds per operation, split over --shards hosts. Reports the
+p50 / p99 candidate relay latency, the operations and payload bytes that
+reached the shards, and how the groups spread over the shards.
+
+Usage:
+    python benchmarks/bench_layers.py [--pairs 10] [--candidates 50] [--rtt 0.5] [--shards 1]
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+import msgpack
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--candidates', type=int, default=50, help='ICE candidates each side trickles')
+    parser.add_argument('--rtt', type=float, default=0.5, help='milliseconds per simulated Redis operation')
+    parser.add_argument('--shards', type=int, default=1)
+    return parser.parse_args()
+
+
+args = parse_args()
+setup_django(VIDEO_CALL_RELAY_WINDOW=0)
+
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.testing import WebsocketCommunicator
+from django.contrib.sessions.backends.db import SessionStore
+
+from common import create_users, use_channel_layer
+from VideoCall.consumers import VideoCallConsumer
+from VideoCall.layers import HybridChannelLayer
+
+OPS = Counter()
+
+
+class SimulatedRedis(InMemoryChannelLayer):
+    """An in-memory layer with a network round trip and msgpack on every operation."""
+
+    def __init__(self, hosts=('redis',), **config):
+        config['capacity'] = 10 ** 6
+        super().__init__(**config)
+        self.host = hosts[0]
+
+    async def hop(self, op, message=None):
+        OPS[op] += 1
+        OPS[f'{self.host}'] += 1
+        if message is not None:
+            payload = msgpack.packb(message)
+            OPS['bytes'] += len(payload)
+            message = msgpack.unpackb(payload)
+        await asyncio.sleep(args.rtt / 1000)
+        return message
+
+    async def send(self, channel, message):
+        await super().send(channel, await self.hop('send', message))
+
+    async def receive(self, channel):
+        message = await super().receive(channel)
+        OPS['receive'] += 1
+        return message
+
+    async def new_channel(self, prefix='specific.'):
+        # Like channels_redis: no Redis round trip until something is sent.
+        return await super().new_channel(prefix)
+
+    async def group_add(self, group, channel):
+        await self.hop('group_add')
+        await super().group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        await self.hop('group_discard')
+        await super().group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        # One read of the group's members, then a push per member.
+        await self.hop('group_send', message)
+        for channel in list(self.groups.get(group, ())):
+            OPS['group_deliveries'] += 1
+            OPS['bytes'] += len(msgpack.packb(message))
+        await super().group_send(group, message)
+
+
+def make_candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i} typ host', 'sdpMid': '0',
+            'sdpMLineIndex': 0, 'sent_at': time.perf_counter()}
+
+
+def hybrid_layer(shards):
+    hosts = [f'redis{i}' for i in range(args.shards)]
+    return HybridChannelLayer(remote=lambda hosts, **config: shards[hosts[0]], hosts=hosts, capacity=10 ** 6)
+
+
+async def connect(user, alias):
+    consumer = type(f'Consumer_{alias}', (VideoCallConsumer,), {'channel_layer_alias': alias})
+    communicator = WebsocketCommunicator(consumer.as_asgi(), '/ws/video_call/')
+    communicator.scope['user'] = user
+    communicator.scope['session'] = SessionStore()
+    connected, _ = await communicator.connect()
+    assert connected, f'{user.username} could not connect'
+    return communicator
+
+
+async def expect(socket, action):
+    while True:
+        frame = await socket.receive_json_from(timeout=10)
+        if frame.get('action') == action:
+            return frame
+
+
+async def trickle(socket, call_id, action):
+    # Spread the pairs over the interval instead of sending in lockstep.
+    await asyncio.sleep(random.uniform(0, 0.02))
+    for i in range(args.candidates):
+        await socket.send_json_to({'action': action, 'video_call_id': call_id, 'candidate': make_candidate(i)})
+        await asyncio.sleep(0.02)
+
+
+async def collect(socket, latencies):
+    for _ in range(args.candidates):
+        frame = await socket.receive_json_from(timeout=10)
+        latencies.append(time.perf_counter() - frame['candidate']['sent_at'])
+
+
+async def start_call(caller, receiver, receiver_username):
+    await caller.send_json_to({'action': 'initiate_call', 'receiver_username': receiver_username})
+    call_id = (await expect(caller, 'call_initiated'))['video_call_id']
+    await expect(receiver, 'incoming_call')
+    await receiver.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+    await expect(caller, 'call_started')
+    await expect(receiver, 'call_started')
+    return call_id
+
+
+async def exchange(caller, receiver, call_id, latencies):
+    await asyncio.gather(
+        trickle(caller, call_id, 'caller_data'),
+        trickle(receiver, call_id, 'receiver_data'),
+        collect(caller, latencies),
+        collect(receiver, latencies),
+    )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def run(setup, users):
+    shards = {f'redis{i}': SimulatedRedis(hosts=[f'redis{i}']) for i in range(args.shards)}
+    if setup == 'redis':
+        use_channel_layer(shards['redis0'])
+        aliases = ('default', 'default')
+    else:
+        use_channel_layer(hybrid_layer(shards))
+        aliases = ('default', 'default')
+        if setup == 'hybrid-2w':
+            channel_layers.backends['worker2'] = hybrid_layer(shards)
+            aliases = ('default', 'worker2')
+    sockets = [await connect(user, aliases[i % 2]) for i, user in enumerate(users)]
+    OPS.clear()
+    pairs = [(sockets[i], sockets[i + 1]) for i in range(0, len(users), 2)]
+    started = time.perf_counter()
+    calls = await asyncio.gather(*(
+        start_call(caller, receiver, users[2 * i + 1].username) for i, (caller, receiver) in enumerate(pairs)
+    ))
+    latencies = []
+    await asyncio.gather(*(exchange(caller, receiver, call_id, latencies) for (caller, receiver), call_id in zip(pairs, calls)))
+    elapsed = time.perf_counter() - started
+    for socket in sockets:
+        await socket.disconnect()
+    for alias in set(aliases):
+        layer = channel_layers.backends[alias]
+        if hasattr(layer, 'close'):
+            await layer.close()
+    remote_ops = OPS['send'] + OPS['group_send'] + OPS['group_add'] + OPS['group_discard']
+    spread = '/'.join(str(OPS[host]) for host in shards)
+    print(f"{setup:10} {percentile(latencies, 0.5) * 1000:9.2f} {percentile(latencies, 0.99) * 1000:9.2f}"
+          f" {remote_ops:11} {OPS['group_deliveries']:11} {OPS['bytes'] / 1024:9.1f} {elapsed:8.2f}  {spread}")
+
+
+if __name__ == '__main__':
+    all_users = create_users(6 * args.pairs, prefix='layers')
+    print(f"pairs: {args.pairs}, candidates: {args.candidates}, rtt: {args.rtt} ms, shards: {args.shards}")
+    print(f"{'setup':10} {'p50 ms':>9} {'p99 ms':>9} {'redis ops':>11} {'group fans':>11} {'KiB':>9} {'secs':>8}  ops per shard")
+    for index, name in enumerate(('redis', 'hybrid', 'hybrid-2w')):
+        asyncio.run(run(name, all_users[index * 2 * args.pairs:(index + 1) * 2 * args.pairs]))
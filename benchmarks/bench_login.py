@@ -0,0 +1,139 @@
+"""
+A morning login burst next to live signaling.
+
+Posts --logins sign-ins (PBKDF2, from --clients client IPs behind a local
+reverse proxy) to three versions of the login view while probing the worker:
+
+  * sync:         the old LoginView.post, a sync view calling authenticate(),
+                  run on asgiref's shared thread like Django's ASGI handler does,
+  * async-inline: an async view calling aauthenticate() with Django's own
+                  ModelBackend, which hashes on the event loop,
+  * async-pool:   LoginView, hashing on the VIDEO_CALL_HASHER_PROCESSES pool.
+
+The probes are what a consumer does meanwhile: an async ORM lookup (which
+waits for the shared thread) and a 10 ms sleep (which waits for the event
+loop). Reports their p50 / p99 delay during the burst, the burst's wall time
+and how many sign-ins the per-IP limit turned away.
+
+Usage:
+    python benchmarks/bench_login.py [--logins 20] [--clients 20]
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=20, help='distinct client IPs the sign-ins come from')
+    return parser.parse_args()
+
+
+args = parse_args()
+setup_django(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+    ROOT_URLCONF='__main__',
+)
+
+from django.contrib.auth import aauthenticate, alogin, authenticate, login
+from django.contrib.auth.hashers import make_password
+from django.http import HttpResponseRedirect
+from django.test import AsyncClient
+from django.urls import path
+
+from common import create_users
+from VideoCall import repository
+from VideoCall.models import User
+from VideoCall.views import LoginView
+
+PASSWORD = 'correct horse battery staple'
+
+
+def sync_login(request):
+    user = authenticate(username=request.POST['username'], password=request.POST['password'])
+    if user is None:
+        return HttpResponseRedirect('/login/')
+    login(request, user)
+    return HttpResponseRedirect('/')
+
+
+async def inline_login(request):
+    user = await aauthenticate(request, username=request.POST['username'], password=request.POST['password'])
+    if user is None:
+        return HttpResponseRedirect('/login/')
+    await alogin(request, user)
+    return HttpResponseRedirect('/')
+
+
+urlpatterns = [
+    path('sync/', sync_login),
+    path('async-inline/', inline_login),
+    path('async-pool/', LoginView.as_view()),
+]
+
+SETUPS = ('sync', 'async-inline', 'async-pool')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def probe_orm(done, delays):
+    while not done.is_set():
+        start = time.perf_counter()
+        await repository.get_user_id('nobody')
+        delays.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def probe_loop(done, delays):
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        delays.append(time.perf_counter() - start - 0.01)
+
+
+async def sign_in(setup, username, client_ip):
+    # Through a reverse proxy on 127.0.0.1 (a VIDEO_CALL_TRUSTED_PROXIES entry), as in production.
+    response = await AsyncClient().post(f'/{setup}/', {'type': 'signin', 'username': username, 'password': PASSWORD},
+                                        headers={'X-Forwarded-For': client_ip})
+    return response.status_code
+
+
+async def run(setup, usernames):
+    done = asyncio.Event()
+    orm_delays, loop_delays = [], []
+    probes = [asyncio.create_task(probe_orm(done, orm_delays)), asyncio.create_task(probe_loop(done, loop_delays))]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(
+        sign_in(setup, username, f'10.0.0.{i % args.clients + 1}') for i, username in enumerate(usernames)
+    ))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*probes)
+    assert all(status in (302, 429) for status in statuses), statuses
+    print(f"{setup:13} {percentile(orm_delays, 0.5) * 1000:8.1f} {percentile(orm_delays, 0.99) * 1000:8.1f}"
+          f" {percentile(loop_delays, 0.5) * 1000:9.1f} {percentile(loop_delays, 0.99) * 1000:9.1f}"
+          f" {elapsed:8.2f} {statuses.count(429):8}")
+
+
+async def main(usernames):
+    print(f"logins: {args.logins}, client IPs: {args.clients}")
+    print(f"{'setup':13} {'ORM p50':>8} {'ORM p99':>8} {'loop p50':>9} {'loop p99':>9} {'secs':>8} {'429s':>8}   (ms)")
+    for setup in SETUPS:
+        await run(setup, usernames)
+
+
+if __name__ == '__main__':
+    # Refused sign-ins are counted below, not logged one by one.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    users = create_users(args.logins, prefix='login')
+    # One hash for everyone: hashing each user's password here would take longer than the bench.
+    User.objects.filter(username__startswith='login').update(password=make_password(PASSWORD))
+    asyncio.run(main([user.username for user in users]))
@@ -0,0 +1,138 @@
+"""
+A Wi-Fi hiccup on --pairs connected calls: every caller's socket drops.
+
+Compares two ways back into the call:
+
+  * redial:  the old behaviour, the call ends and the caller initiates a new
+             one that the receiver accepts (before any ICE/SDP renegotiation),
+  * resume:  the caller reconnects and sends ``resume`` with its last seq.
+
+While the caller is away the receiver trickles --candidates ICE candidates.
+Reports p50 / p99 time until the caller is back in a CONNECTED call, the SQL
+statements that took, and how many of the receiver's candidates reached the
+caller.
+
+Usage:
+    python benchmarks/bench_resume.py [--pairs 50] [--candidates 5]
+"""
+import argparse
+import asyncio
+import time
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--candidates', type=int, default=5, help='ICE candidates the receiver sends during the drop')
+    return parser.parse_args()
+
+
+args = parse_args()
+setup_django(VIDEO_CALL_RELAY_WINDOW=0)
+
+from channels.layers import InMemoryChannelLayer
+from django.test import override_settings
+
+from common import QueryCounter, connect, create_users, use_channel_layer
+
+RESUME = '/ws/video_call/?features=resume'
+
+
+async def expect(socket, action):
+    while True:
+        frame = await socket.receive_json_from(timeout=10)
+        if frame.get('action') == action:
+            return frame
+
+
+async def start_call(caller, receiver, receiver_username):
+    await caller.send_json_to({'action': 'initiate_call', 'receiver_username': receiver_username})
+    call_id = (await expect(caller, 'call_initiated'))['video_call_id']
+    await expect(receiver, 'incoming_call')
+    await receiver.send_json_to({'action': 'start_call', 'video_call_id': call_id})
+    started = await expect(caller, 'call_started')
+    await expect(receiver, 'call_started')
+    return call_id, started
+
+
+async def trickle(receiver, call_id):
+    for i in range(args.candidates):
+        await receiver.send_json_to({'action': 'receiver_data', 'video_call_id': call_id,
+                                     'candidate': {'candidate': f'candidate:{i}'}})
+
+
+async def redial(caller_user, receiver, receiver_user, call_id, timings):
+    await expect(receiver, 'disconnected')
+    await trickle(receiver, call_id)
+    start = time.perf_counter()
+    caller = await connect(caller_user, RESUME)
+    await start_call(caller, receiver, receiver_user.username)
+    timings.append(time.perf_counter() - start)
+    return caller, 0
+
+
+async def resume(caller_user, receiver, session, started, call_id, timings):
+    await expect(receiver, 'peer_reconnecting')
+    await trickle(receiver, call_id)
+    start = time.perf_counter()
+    caller = await connect(caller_user, RESUME)
+    await caller.send_json_to({'action': 'resume', 'session_id': session['session_id'], 'last_seq': started['seq']})
+    resumed = await expect(caller, 'resumed')
+    timings.append(time.perf_counter() - start)
+    await expect(receiver, 'peer_resumed')
+    delivered = 0
+    for _ in range(args.candidates):
+        if (await caller.receive_json_from(timeout=10)).get('action') == 'caller_data':
+            delivered += 1
+    assert resumed['gap'] is False
+    return caller, delivered
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def run(mode, users):
+    use_channel_layer(InMemoryChannelLayer(capacity=10 ** 6))
+    pairs = [(users[i], users[i + 1]) for i in range(0, len(users), 2)]
+    calls = []
+    for caller_user, receiver_user in pairs:
+        caller = await connect(caller_user, RESUME)
+        session = await expect(caller, 'session')
+        receiver = await connect(receiver_user, RESUME)
+        call_id, started = await start_call(caller, receiver, receiver_user.username)
+        calls.append((caller, receiver, session, started, call_id))
+    timings = []
+    with QueryCounter() as queries:
+        # With no grace period a disconnect hangs up at once, as it did before.
+        with override_settings(VIDEO_CALL_RESUME_GRACE=0 if mode == 'redial' else 20):
+            for caller, *_ in calls:
+                await caller.disconnect()
+        if mode == 'redial':
+            results = await asyncio.gather(*(
+                redial(caller_user, receiver, receiver_user, call_id, timings)
+                for (caller_user, receiver_user), (_, receiver, _, _, call_id) in zip(pairs, calls)
+            ))
+        else:
+            results = await asyncio.gather(*(
+                resume(caller_user, receiver, session, started, call_id, timings)
+                for (caller_user, _), (_, receiver, session, started, call_id) in zip(pairs, calls)
+            ))
+    delivered = sum(count for _, count in results)
+    for (caller, _), (_, receiver, *_) in zip(results, calls):
+        await caller.disconnect()
+        await receiver.disconnect()
+    total = sum(queries.counts.values())
+    print(f"{mode:8} {percentile(timings, 0.5) * 1000:9.2f} {percentile(timings, 0.99) * 1000:9.2f}"
+          f" {total / len(pairs):10.1f} {delivered:>6}/{args.candidates * len(pairs)}")
+
+
+if __name__ == '__main__':
+    users = create_users(4 * args.pairs, prefix='resume')
+    print(f"pairs: {args.pairs}, candidates during the drop: {args.candidates}")
+    print(f"{'mode':8} {'p50 ms':>9} {'p99 ms':>9} {'SQL/call':>10} {'candidates':>13}")
+    asyncio.run(run('redial', users[:2 * args.pairs]))
+    asyncio.run(run('resume', users[2 * args.pairs:]))
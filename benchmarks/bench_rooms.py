@@ -0,0 +1,124 @@
+"""
+Signaling cost of a group room, mesh against SFU, as the room grows.
+
+N participants join one room in turn and negotiate the way the client would:
+
+- MESH: each newcomer offers to every participant already there, who
+  answers; both ends then send their candidates, one publish per peer
+  connection.
+- SFU: each newcomer publishes once (offer plus candidates), subscribes to
+  everyone and answers the SFU's offer; everyone already there answers the
+  subscription offer that comes with the new track.
+
+Reports the WebSocket frames and bytes, ICE candidates carried, channel-layer
+operations and SQL statements for the whole room, plus frames per participant
+and the peer connections each participant holds.
+
+Usage:
+    python benchmarks/bench_rooms.py [--sizes 2,4,8,16] [--candidates 10]
+"""
+import argparse
+import asyncio
+import json
+
+from common import setup_django
+
+setup_django(VIDEO_CALL_ROOM_MAX_PARTICIPANTS=1000)
+
+from common import QueryCounter, connect, counting_channel_layer, create_users, use_channel_layer
+
+
+def make_candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i} typ host', 'sdpMid': '0', 'sdpMLineIndex': 0}
+
+
+class Participant:
+    def __init__(self, user, socket, counts):
+        self.user = user
+        self.socket = socket
+        self.counts = counts
+
+    async def send(self, message):
+        text = json.dumps(message)
+        self.counts['frames_sent'] += 1
+        self.counts['bytes'] += len(text)
+        self.counts['candidates'] += len(message.get('candidates', ()))
+        await self.socket.send_to(text_data=text)
+
+    async def drain(self):
+        frames = []
+        while not await self.socket.receive_nothing(timeout=0.01):
+            text = (await self.socket.receive_output())['text']
+            frames.append(json.loads(text))
+            self.counts['bytes'] += len(text)
+            self.counts['candidates'] += len(frames[-1].get('candidates', ()))
+        self.counts['frames_received'] += len(frames)
+        return frames
+
+
+async def negotiate_mesh(room, newcomer, present, candidates):
+    for peer in present:
+        await newcomer.send({'action': 'publish', 'room': room, 'to': peer.user.username,
+                             'sdp': {'type': 'offer', 'sdp': 'v=0'}, 'candidates': candidates})
+        await peer.drain()
+        await peer.send({'action': 'publish', 'room': room, 'to': newcomer.user.username,
+                         'sdp': {'type': 'answer', 'sdp': 'v=0'}, 'candidates': candidates})
+        await newcomer.drain()
+
+
+async def negotiate_sfu(room, newcomer, present, candidates):
+    await newcomer.send({'action': 'publish', 'room': room, 'sdp': {'type': 'offer', 'sdp': 'v=0'}, 'candidates': candidates})
+    await newcomer.send({'action': 'subscribe', 'room': room})
+    await newcomer.drain()
+    await newcomer.send({'action': 'subscribe', 'room': room, 'sdp': {'type': 'answer', 'sdp': 'v=0'}})
+    for peer in present:
+        await peer.drain()  # participant_joined, track_published with the SFU's offer
+        await peer.send({'action': 'subscribe', 'room': room, 'sdp': {'type': 'answer', 'sdp': 'v=0'}})
+
+
+async def run(mode, users, candidate_count):
+    layer = use_channel_layer(counting_channel_layer()())
+    counts = layer.counts
+    size = len(users)
+    room = f'bench-{mode.lower()}-{size}'
+    candidates = [make_candidate(i) for i in range(candidate_count)]
+    participants = [Participant(user, await connect(user), counts) for user in users]
+    negotiate = negotiate_mesh if mode == 'MESH' else negotiate_sfu
+    counts.clear()
+    with QueryCounter() as queries:
+        for i, newcomer in enumerate(participants):
+            await newcomer.send({'action': 'join_room', 'room': room, 'mode': mode})
+            await newcomer.drain()
+            await negotiate(room, newcomer, participants[:i], candidates)
+        for participant in participants:
+            await participant.drain()
+    for participant in participants:
+        await participant.socket.disconnect()
+    result = dict(counts)
+    result.update(('sql_' + kind, count) for kind, count in queries.counts.items())
+    result['peer_connections'] = size - 1 if mode == 'MESH' else 1
+    return result
+
+
+async def main(runs, candidate_count):
+    names = ['frames_sent', 'frames_received', 'bytes', 'candidates', 'send', 'group_send', 'group_deliveries', 'sql_reads', 'sql_writes']
+    print(f"candidates per peer connection: {candidate_count}")
+    print(f"{'mode':5} {'N':>4} " + ' '.join(f'{name:>16}' for name in names) + f" {'frames/person':>14} {'PCs/person':>10}")
+    for mode, users in runs:
+        size = len(users)
+        result = await run(mode, users, candidate_count)
+        per_person = (result.get('frames_sent', 0) + result.get('frames_received', 0)) / size
+        print(f"{mode:5} {size:4} " + ' '.join(f'{result.get(name, 0):16}' for name in names)
+              + f" {per_person:14.1f} {result['peer_connections']:10}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='2,4,8,16')
+    parser.add_argument('--candidates', type=int, default=10)
+    args = parser.parse_args()
+    runs = [
+        (mode, create_users(int(size), prefix=f'room-{mode.lower()}-{size}-'))
+        for mode in ('MESH', 'SFU') for size in args.sizes.split(',')
+    ]
+    asyncio.run(main(runs, args.candidates))
@@ -0,0 +1,219 @@
+"""
+Load test for the signaling path of VideoCallConsumer.
+
+Opens N caller/receiver pairs with WebsocketCommunicator over the in-memory
+channel layer and runs every pair concurrently through the full lifecycle:
+initiate -> start -> SDP offer/answer -> ICE trickle -> end. Reports
+
+  * relayed messages per second during the SDP/ICE phase,
+  * p50 / p99 answer latency (start_call sent -> caller gets call_started),
+  * p50 / p99 relay latency (client send -> peer receive),
+  * SQL statements per call,
+  * Python memory allocated per open connection (tracemalloc),
+  * how many database jobs queued for the database executor (--db-threads,
+    VIDEO_CALL_DB_THREADS) and for asgiref's shared sync thread, which runs
+    the async ORM calls, sampled every millisecond.
+
+Usage:
+    python benchmarks/bench_signaling.py [--pairs 50] [--candidates 10] [--batch] [--window SECONDS] [--write-behind] [--db-threads N]
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--candidates', type=int, default=10, help='ICE candidates each side trickles')
+    parser.add_argument('--batch', action='store_true', help='clients opt into candidates_batch frames')
+    parser.add_argument('--window', type=float, default=None, help='override VIDEO_CALL_RELAY_WINDOW')
+    parser.add_argument('--write-behind', action='store_true', help='journal call transitions (VIDEO_CALL_WRITE_BEHIND)')
+    parser.add_argument('--db-threads', type=int, default=None, help='override VIDEO_CALL_DB_THREADS (0: shared sync thread)')
+    parser.add_argument('--timeout', type=float, default=30)
+    return parser.parse_args()
+
+
+args = parse_args()
+overrides = {} if args.window is None else {'VIDEO_CALL_RELAY_WINDOW': args.window}
+if args.write_behind:
+    overrides.update(VIDEO_CALL_WRITE_BEHIND=True, VIDEO_CALL_JOURNAL_DIR=tempfile.mkdtemp(prefix='videocall-journal-'))
+if args.db_threads is not None:
+    overrides['VIDEO_CALL_DB_THREADS'] = args.db_threads
+setup_django(**overrides)
+
+from asgiref.sync import SyncToAsync
+
+from common import QueryCounter, connect, create_users
+from VideoCall import repository
+
+
+class Client:
+    """A communicator plus a buffer of frames that arrived while waiting for others."""
+
+    def __init__(self, communicator, timeout):
+        self.communicator = communicator
+        self.timeout = timeout
+        self.buffer = []
+
+    async def send(self, message):
+        await self.communicator.send_json_to(message)
+
+    async def expect(self, *actions):
+        for index, frame in enumerate(self.buffer):
+            if frame.get('action') in actions:
+                return self.buffer.pop(index)
+        while True:
+            frame = await self.communicator.receive_json_from(timeout=self.timeout)
+            if frame.get('action') in actions:
+                return frame
+            self.buffer.append(frame)
+
+
+def make_candidate(i):
+    return {
+        'candidate': f'candidate:{i} 1 udp 2122260223 10.0.0.1 {50000 + i} typ host',
+        'sdpMid': '0',
+        'sdpMLineIndex': 0,
+        'sent_at': time.perf_counter(),
+    }
+
+
+async def receive_candidates(client, count, latencies):
+    received = 0
+    while received < count:
+        frame = await client.expect('caller_data', 'receiver_data', 'candidates_batch')
+        candidates = frame.get('candidates') or ([frame['candidate']] if frame.get('candidate') else [])
+        now = time.perf_counter()
+        for candidate in candidates:
+            latencies.append(now - candidate['sent_at'])
+        received += len(candidates)
+
+
+async def send_candidates(client, call_id, action, count, batch):
+    if batch:
+        await client.send({'action': 'candidates_batch', 'video_call_id': call_id, 'candidates': [make_candidate(i) for i in range(count)]})
+        return
+    for i in range(count):
+        await client.send({'action': action, 'video_call_id': call_id, 'candidate': make_candidate(i)})
+
+
+async def run_pair(caller, receiver, candidates, batch, latencies, relay_times, answer_latencies):
+    await caller.send({'action': 'initiate_call', 'receiver_username': receiver.username})
+    frame = await caller.expect('call_initiated', 'error')
+    if frame['action'] == 'error':
+        raise RuntimeError(f"initiate_call failed: {frame}")
+    call_id = frame['video_call_id']
+    await receiver.expect('incoming_call')
+
+    answered = time.perf_counter()
+    await receiver.send({'action': 'start_call', 'video_call_id': call_id})
+    await receiver.expect('call_started')
+    await caller.expect('call_started')
+    answer_latencies.append(time.perf_counter() - answered)
+
+    relay_start = time.perf_counter()
+    await caller.send({'action': 'caller_data', 'video_call_id': call_id, 'sdp': {'type': 'offer', 'sdp': 'v=0'}})
+    await receiver.expect('receiver_data', 'candidates_batch')
+    await receiver.send({'action': 'receiver_data', 'video_call_id': call_id, 'sdp': {'type': 'answer', 'sdp': 'v=0'}})
+    await caller.expect('caller_data', 'candidates_batch')
+    await asyncio.gather(
+        send_candidates(caller, call_id, 'caller_data', candidates, batch),
+        send_candidates(receiver, call_id, 'receiver_data', candidates, batch),
+        receive_candidates(caller, candidates, latencies),
+        receive_candidates(receiver, candidates, latencies),
+    )
+    relay_times.append((relay_start, time.perf_counter()))
+
+    await caller.send({'action': 'end_call', 'video_call_id': call_id})
+    await caller.expect('call_ended')
+    await receiver.expect('call_ended')
+
+
+class QueueSampler:
+    """Samples the database job queues every ``interval`` seconds while running."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.executor = []
+        self.shared = []
+
+    async def run(self):
+        executor = repository.get_executor()
+        shared = SyncToAsync.single_thread_executor._work_queue
+        while True:
+            self.executor.append(executor.queued if executor is not None else 0)
+            self.shared.append(shared.qsize())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self
+
+    def __exit__(self, *exc_info):
+        self.task.cancel()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(users, pairs, candidates, batch, timeout):
+    path = '/ws/video_call/?features=batch' if batch else '/ws/video_call/'
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    clients = [Client(await connect(user, path), timeout) for user in users]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for client, user in zip(clients, users):
+        client.username = user.username
+    memory_per_connection = (after - before) / len(clients)
+
+    latencies, relay_times, answer_latencies = [], [], []
+    with QueryCounter() as queries, QueueSampler() as queues:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_pair(clients[2 * i], clients[2 * i + 1], candidates, batch, latencies, relay_times, answer_latencies)
+            for i in range(pairs)
+        ))
+        elapsed = time.perf_counter() - start
+
+    for client in clients:
+        await client.communicator.disconnect()
+
+    relay_phase = max(end for _, end in relay_times) - min(begin for begin, _ in relay_times)
+    relayed = pairs * (2 + 2 * candidates)  # offer + answer + candidates both ways
+    sql = queries.counts
+
+    db_threads = repository.get_executor()._max_workers if repository.get_executor() else 0
+    print(f"pairs: {pairs}, candidates per side: {candidates}, batch: {batch}, write-behind: {args.write_behind}, "
+          f"db threads: {db_threads}")
+    print(f"{'lifecycle wall time':28} {elapsed:10.3f} s")
+    print(f"{'calls per second':28} {pairs / elapsed:10.1f}")
+    print(f"{'relayed messages per second':28} {relayed / relay_phase:10.1f}")
+    print(f"{'answer latency p50':28} {percentile(answer_latencies, 0.50) * 1000:10.2f} ms")
+    print(f"{'answer latency p99':28} {percentile(answer_latencies, 0.99) * 1000:10.2f} ms")
+    print(f"{'relay latency p50':28} {percentile(latencies, 0.50) * 1000:10.2f} ms")
+    print(f"{'relay latency p99':28} {percentile(latencies, 0.99) * 1000:10.2f} ms")
+    print(f"{'SQL reads per call':28} {sql['reads'] / pairs:10.2f}")
+    print(f"{'SQL writes per call':28} {sql['writes'] / pairs:10.2f}")
+    print(f"{'memory per connection':28} {memory_per_connection / 1024:10.1f} KiB")
+    for name, depths in (('executor', queues.executor), ('shared thread', queues.shared)):
+        print(f"{name + ' queue mean / max':28} {sum(depths) / len(depths):10.2f} / {max(depths)}")
+
+
+if __name__ == '__main__':
+    users = create_users(2 * args.pairs, prefix='load')
+    try:
+        asyncio.run(run(users, args.pairs, args.candidates, args.batch, args.timeout))
+    except asyncio.TimeoutError:
+        sys.exit(f"timed out waiting for a frame after {args.timeout}s")
@@ -0,0 +1,115 @@
+"""
+Static asset requests on an app worker.
+
+Runs collectstatic (CompressedManifestStaticFilesStorage) into a scratch
+STATIC_ROOT, then fetches the page's assets --requests times each through
+project.asgi's HTTP stack. Two ways:
+
+  * django:  what serving them used to take: Django's static() view behind
+             the full middleware stack, uncompressed, no cache headers,
+  * assets:  StaticAssetsMiddleware, serving the precompressed variant of
+             the content-hashed name.
+
+Requests are plain ASGI calls, with no network in between. Reports
+requests per second, bytes sent per page load and the Cache-Control the
+browser gets.
+
+Usage:
+    python benchmarks/bench_static.py [--requests 500]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+import warnings
+
+from common import setup_django
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    return parser.parse_args()
+
+
+args = parse_args()
+setup_django(
+    database=False, STATIC_ROOT=tempfile.mkdtemp(prefix='videocall-static-'), DEBUG=True,
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'VideoCall.storage.CompressedManifestStaticFilesStorage'},
+    },
+)
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.asgi import get_asgi_application
+from django.core.management import call_command
+from django.test import override_settings
+
+from VideoCall.assets import StaticAssetsMiddleware
+
+ASSETS = ['VideoCall/js/main.js', 'VideoCall/css/style.css', 'VideoCall/css/login.css']
+
+
+async def fetch(app, path):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'accept-encoding', b'gzip, deflate, br')],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    response = {'body': b''}
+    requested, finished = asyncio.Event(), asyncio.Event()
+
+    async def receive():
+        if requested.is_set():
+            # Django listens for a disconnect once it has the body.
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+        requested.set()
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+        else:
+            response['body'] += message.get('body', b'')
+            if not message.get('more_body'):
+                finished.set()
+
+    await app(scope, receive, send)
+    assert response['status'] == 200, (path, response['status'])
+    return response
+
+
+async def run(name, app, paths):
+    for path in paths:
+        await fetch(app, path)
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        for path in paths:
+            await fetch(app, path)
+    elapsed = time.perf_counter() - start
+    responses = [await fetch(app, path) for path in paths]
+    page_bytes = sum(len(response['body']) for response in responses)
+    cache_control = responses[0]['headers'].get(b'cache-control', b'-').decode()
+    print(f"{name:8} {args.requests * len(paths) / elapsed:10.0f} {page_bytes / 1024:12.1f}  {cache_control}")
+
+
+def main():
+    # FileResponse through the ASGI handler warns on every request.
+    warnings.filterwarnings('ignore', message='StreamingHttpResponse must consume synchronous iterators')
+    call_command('collectstatic', interactive=False, verbosity=0)
+    django_app = get_asgi_application()
+    plain = ['/static/' + name for name in ASSETS]
+    with override_settings(DEBUG=False):
+        hashed = ['/' + staticfiles_storage.url(name).lstrip('/') for name in ASSETS]
+    print(f"requests: {args.requests} x {len(ASSETS)} assets")
+    print(f"{'server':8} {'req/s':>10} {'KiB per page':>12}  cache-control")
+    asyncio.run(run('django', django_app, plain))
+    asyncio.run(run('assets', StaticAssetsMiddleware(django_app), hashed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Shared setup for the benchmark scripts.
+
+Loads project.settings, then swaps in an in-memory channel layer, in-memory
+presence and local-memory caches so benchmarks never touch Redis. The database follows the project's
+VIDEO_CALL_DB profile: a throwaway file with the same pragmas for SQLite, or
+VIDEO_CALL_BENCH_DB_NAME (default "<POSTGRES_DB>_bench", which must exist and
+is flushed) for PostgreSQL.
+"""
+import os
+import sys
+import tempfile
+from collections import Counter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def setup_django(database=True, **overrides):
+    import django
+    from django.conf import settings
+    from project import settings as project_settings
+
+    config = {name: getattr(project_settings, name) for name in dir(project_settings) if name.isupper()}
+    config['CHANNEL_LAYERS'] = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 10 ** 6}}}
+    config['VIDEO_CALL_PRESENCE'] = {'BACKEND': 'VideoCall.presence.InMemoryPresence'}
+    config['CACHES'] = {alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'} for alias in ('default', 'calls')}
+    config['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    if database:
+        # Same profile as the project (VIDEO_CALL_DB), pointed at a scratch database.
+        default = dict(project_settings.DATABASES['default'])
+        if default['ENGINE'].endswith('sqlite3'):
+            fd, default['NAME'] = tempfile.mkstemp(prefix='videocall-bench-', suffix='.sqlite3')
+            os.close(fd)
+        else:
+            default['NAME'] = os.environ.get('VIDEO_CALL_BENCH_DB_NAME', f"{default['NAME']}_bench")
+        config['DATABASES'] = {'default': default}
+    config.update(overrides)
+    settings.configure(**config)
+    django.setup()
+
+    if database:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        if not default['ENGINE'].endswith('sqlite3'):
+            call_command('flush', interactive=False, verbosity=0)
+
+
+def create_users(count, prefix='user'):
+    from django.contrib.auth.models import User
+    User.objects.bulk_create([User(username=f'{prefix}{i}', password='!') for i in range(count)])
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+async def connect(user, path='/ws/video_call/', **scope):
+    from channels.testing import WebsocketCommunicator
+    from django.contrib.sessions.backends.db import SessionStore
+    from VideoCall.consumers import VideoCallConsumer
+
+    communicator = WebsocketCommunicator(VideoCallConsumer.as_asgi(), path)
+    communicator.scope['user'] = user
+    communicator.scope['session'] = SessionStore()
+    communicator.scope.update(scope)
+    connected, _ = await communicator.connect()
+    assert connected, f'{user.username} could not connect'
+    return communicator
+
+
+def counting_channel_layer():
+    from channels.layers import InMemoryChannelLayer
+
+    class CountingChannelLayer(InMemoryChannelLayer):
+        """In-memory layer that tallies the operations a Redis layer would perform."""
+        counts = Counter()
+
+        def __init__(self, **kwargs):
+            kwargs.setdefault('capacity', 10 ** 6)
+            super().__init__(**kwargs)
+
+        async def send(self, channel, message):
+            self.counts['send'] += 1
+            await super().send(channel, message)
+
+        async def group_send(self, group, message):
+            deliveries = len(self.groups.get(group, {}))
+            self.counts['group_send'] += 1
+            self.counts['group_deliveries'] += deliveries
+            await super().group_send(group, message)
+            # InMemoryChannelLayer fans out through send(); only count direct sends.
+            self.counts['send'] -= deliveries
+
+    return CountingChannelLayer
+
+
+def use_channel_layer(layer):
+    """Replaces the default channel layer instance with ``layer``."""
+    from channels.layers import channel_layers
+    channel_layers.backends['default'] = layer
+    return layer
+
+
+class QueryCounter:
+    """Counts SQL statements run on any thread while active, split by kind."""
+
+    WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def record(self, sql):
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if verb == 'SELECT':
+            self.counts['reads'] += 1
+        elif verb in self.WRITES:
+            self.counts['writes'] += 1
+        else:
+            self.counts['other'] += 1
+
+    def __enter__(self):
+        from django.db.backends import utils
+
+        self._original = original = utils.CursorWrapper._execute
+        counter = self
+
+        def _execute(cursor, sql, params, *ignored_wrapper_args):
+            counter.record(sql)
+            return original(cursor, sql, params, *ignored_wrapper_args)
+
+        utils.CursorWrapper._execute = _execute
+        return self
+
+    def __exit__(self, *exc_info):
+        from django.db.backends import utils
+        utils.CursorWrapper._execute = self._original
@@ -2,22 +2,23 @@ import os
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.sessions import SessionMiddlewareStack
-from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
-from VideoCall.routing import websocket_urlpatterns as video_call_websocket_urlpatterns
 
+# Sets up Django, so it runs before importing anything that loads models.
 django_asgi_app = get_asgi_application()
 
-application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+from VideoCall.assets import StaticAssetsMiddleware
+from VideoCall.middleware import CallTimersMiddleware
+from VideoCall.tokens import ConnectionTokenAuthMiddleware
+from VideoCall.routing import websocket_urlpatterns as video_call_websocket_urlpatterns
+
+application = CallTimersMiddleware(ProtocolTypeRouter({
+    "http": StaticAssetsMiddleware(django_asgi_app),
     "websocket": AllowedHostsOriginValidator(
-        SessionMiddlewareStack(
-            AuthMiddlewareStack(
-                URLRouter(
-                    video_call_websocket_urlpatterns
-                )
+        ConnectionTokenAuthMiddleware(
+            URLRouter(
+                video_call_websocket_urlpatterns
             )
         )
     )
-})
\ No newline at end of file
+}))
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -27,9 +30,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = ["*"]
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
-CSRF_TRUSTED_ORIGINS = [
-    "*"
-]
+# Extra origins allowed to POST, with their scheme ("https://example.com"), comma separated.
+# Same-origin requests need no entry.
+CSRF_TRUSTED_ORIGINS = [origin for origin in os.environ.get('CSRF_TRUSTED_ORIGINS', '').split(',') if origin]
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_SAMESITE = 'Lax'
@@ -80,27 +83,170 @@ TEMPLATES = [
 WSGI_APPLICATION = 'project.wsgi.application'
 
 ASGI_APPLICATION = 'project.asgi.application'
+# In-process delivery between peers on the same worker, Redis between workers.
+# Each entry of "hosts" is one shard; groups are spread over them by consistent hashing.
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "VideoCall.layers.HybridChannelLayer",
         "CONFIG": {
+            "remote": "channels_redis.core.RedisChannelLayer",
             "hosts": [("127.0.0.1", 6379)],
             "capacity": 1024,
             "expiry": 10
         },
     },
 }
+# Online / busy registry shared by all workers, next to the channel layer
+VIDEO_CALL_PRESENCE = {
+    "BACKEND": "VideoCall.presence.RedisPresence",
+    "CONFIG": {
+        "hosts": [("127.0.0.1", 6379)],
+        # Seconds without a heartbeat before a worker's connections are counted as gone
+        "worker_timeout": 90,
+    },
+}
+# Seconds between presence heartbeats of each ASGI worker (0 disables)
+VIDEO_CALL_PRESENCE_HEARTBEAT = 30
+VIDEO_CALL_PRESENCE_MAX_SUBSCRIPTIONS = 200
+# Share the call-membership cache between all consumers of a worker process
+VIDEO_CALL_SHARED_CACHE = True
+# Seconds to coalesce SDP/ICE candidates bound for the same peer (0 disables)
+VIDEO_CALL_RELAY_WINDOW = 0.02
+# Call state every worker must see, on the Redis next to the channel layer
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "calls": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+        "KEY_PREFIX": "videocall",
+    },
+}
+# CACHES alias holding parked resumable sessions (process-local map if unset:
+# a resume then only works on the worker that parked the session)
+VIDEO_CALL_STATE_CACHE = "calls"
+# Seconds a websocket connection token stays valid; the page refreshes it at half that
+VIDEO_CALL_WS_TOKEN_TTL = 10 * 60
+# Processes hashing passwords for the login view, and the sign-ins and sign-ups one client
+# IP may have in progress at once (0: no limit)
+VIDEO_CALL_HASHER_PROCESSES = int(os.environ.get('VIDEO_CALL_HASHER_PROCESSES', 2))
+VIDEO_CALL_LOGIN_CONCURRENCY = 2
+# Reverse proxies (addresses or networks) whose X-Forwarded-For names the real client,
+# for the per-IP limits above; the proxy must append to that header, not pass it through
+VIDEO_CALL_TRUSTED_PROXIES = ['127.0.0.1', '::1']
+# Seconds a CONNECTED call outlives a dropped connection that may still resume it (0: hang up at once)
+VIDEO_CALL_RESUME_GRACE = 20
+# Recent frames kept per resumable connection, replayed to the connection that resumes it
+VIDEO_CALL_RESUME_BUFFER = 64
+# Calls per page of history, on the page and from /history/
+VIDEO_CALL_HISTORY_PAGE_SIZE = 20
+# Seconds a call may ring before the server marks it MISSED
+VIDEO_CALL_RING_TIMEOUT = 30
+# Seconds after which a CONNECTED call is assumed orphaned and closed by the reaper
+VIDEO_CALL_MAX_DURATION = 4 * 60 * 60
+# Seconds after which the reaper closes a CONNECTED call whose caller or receiver is offline
+VIDEO_CALL_ORPHAN_TIMEOUT = 2 * 60
+# Seconds between stale call sweeps in each ASGI worker (0 disables; see manage.py reap_calls)
+VIDEO_CALL_REAPER_INTERVAL = 5 * 60
+# Seconds between refreshes of today's and yesterday's call stats in each ASGI worker;
+# a worker skips its turn while another rollup holds the lock (0 disables; see manage.py rollup_calls)
+VIDEO_CALL_ROLLUP_INTERVAL = 15 * 60
+# Write-behind: journal call transitions to VIDEO_CALL_JOURNAL_DIR and flush them
+# to the database in batches instead of waiting on each write
+VIDEO_CALL_WRITE_BEHIND = False
+VIDEO_CALL_JOURNAL_DIR = BASE_DIR / "journal"
+VIDEO_CALL_JOURNAL_FLUSH_INTERVAL = 0.05
+# fsync every journal append (survives power loss, not just a worker crash)
+VIDEO_CALL_JOURNAL_FSYNC = False
+# Group rooms: participants per room, and the size up to which new rooms use mesh
+# signaling rather than the SFU
+VIDEO_CALL_ROOM_MAX_PARTICIPANTS = 8
+VIDEO_CALL_ROOM_MESH_LIMIT = 4
+# SFU backend for SFU-mode rooms (LocalSFU is an in-process stand-in that forwards no media)
+VIDEO_CALL_SFU = {
+    "BACKEND": "VideoCall.sfu.LocalSFU",
+}
+# Per-connection token buckets, (frames per second, burst) by action: "default" for
+# each unlisted action, "*" for all of a connection's frames together
+VIDEO_CALL_RATE_LIMITS = {
+    "*": (100, 200),
+    "default": (5, 20),
+    "caller_data": (50, 100),
+    "receiver_data": (50, 100),
+    "candidates_batch": (20, 40),
+    "publish": (50, 100),
+    "subscribe": (20, 40),
+    "initiate_call": (1, 5),
+}
+# Close a connection once this many of its frames were rate limited (0: never)
+VIDEO_CALL_RATE_LIMIT_CLOSE_AFTER = 1000
+# Bearer token a Prometheus scraper sends to read /metrics (unset: staff sessions only)
+VIDEO_CALL_METRICS_TOKEN = os.environ.get('VIDEO_CALL_METRICS_TOKEN', '')
+# Most ICE candidates queued for one peer; the oldest are dropped beyond it
+VIDEO_CALL_RELAY_MAX_CANDIDATES = 64
+# Retries, with doubling backoff from 50 ms, when a peer's channel is full
+VIDEO_CALL_SEND_RETRIES = 3
+# Threads running transactional database work for the consumer (0: asgiref's single shared thread)
+VIDEO_CALL_DB_THREADS = int(os.environ.get('VIDEO_CALL_DB_THREADS', 4))
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# VIDEO_CALL_DB picks the profile: "sqlite" (default) or "postgres".
+VIDEO_CALL_DB = os.environ.get('VIDEO_CALL_DB', 'sqlite')
+
+if VIDEO_CALL_DB == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # Keep each executor thread's connection (and its pragmas) between calls.
+            'CONN_MAX_AGE': 600,
+            'OPTIONS': {
+                # Seconds to wait for the write lock before "database is locked".
+                'timeout': 20,
+                # Take the write lock at BEGIN, so two transactions never deadlock upgrading to writers.
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets readers run alongside the writer; NORMAL sync is safe under WAL.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-16000;'
+                ),
+            },
+        }
     }
-}
+elif VIDEO_CALL_DB == 'postgres':
+    # Needs psycopg 3 (pip install "psycopg[binary,pool]").
+    POSTGRES_POOL = os.environ.get('POSTGRES_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'videocall'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # A pool replaces persistent connections; Django requires CONN_MAX_AGE = 0 with one.
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL else int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # One connection per database executor thread (VIDEO_CALL_DB_THREADS),
+                # plus one for the async ORM's shared thread.
+                'pool': {
+                    'min_size': 1,
+                    'max_size': int(os.environ.get('POSTGRES_POOL_SIZE', VIDEO_CALL_DB_THREADS + 1)),
+                    'timeout': 10,
+                },
+            } if POSTGRES_POOL else {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"VIDEO_CALL_DB must be 'sqlite' or 'postgres', not {VIDEO_CALL_DB!r}")
 
 
 # Password validation
@@ -139,6 +285,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
+# With STATIC_MANIFEST=1, collectstatic writes content-hashed copies plus .gz (and, with the
+# brotli package, .br) variants; project.asgi serves them from STATIC_ROOT (see VideoCall/assets.py).
+# Off by default: pages link to hashed names only after collectstatic has run.
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', '0') == '1'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'VideoCall.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    },
+}
+# Cache lifetime of static files without a content hash in their name (hashed ones are immutable)
+VIDEO_CALL_STATIC_MAX_AGE = 60
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -18,8 +18,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from VideoCall.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('', include('VideoCall.urls'), name='videocall'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)